@@ -15,10 +15,13 @@ import tornado.web
 from litedfs.version import __version__
 from litedfs.data.handlers import info
 from litedfs.data.handlers import data
+from litedfs.data.handlers import task
 from litedfs.data.utils.registrant import Registrant
 from litedfs.data.utils import common
 from litedfs.data.utils.persistent_config import PersistentConfig
 from litedfs.data.utils.task_processer import TaskProcesser
+from litedfs.data.utils.task_cache import TaskCache
+from litedfs.data.utils.block_index import BlockIndex
 from litedfs.data.config import CONFIG, load_config
 from litedfs.data import logger
 
@@ -30,8 +33,10 @@ class Application(tornado.web.Application):
         handlers = [
             (r"/", info.AboutHandler),
             (r"/block/create", data.CreateBlockHandler),
+            (r"/file/create", data.CreateFileHandler),
             (r"/block/download", data.DownloadBlockHandler),
             (r"/block/read", data.RangeReadHandler),
+            (r"/task/push", task.PushTaskHandler),
         ]
         settings = dict(debug = False)
         tornado.web.Application.__init__(self, handlers, **settings)
@@ -114,6 +119,8 @@ def main():
                     retry_interval = CONFIG["retry_interval"]
                 )
 
+                BlockIndex.load()
+                TaskCache.set_max_size(CONFIG.get("task_queue_size", 1000))
                 task_processer = TaskProcesser(0)
                 task_processer.start()
                 http_server = tornado.httpserver.HTTPServer(Application())
@@ -126,6 +133,8 @@ def main():
                 signal.signal(signal.SIGINT, common.sig_handler)
                 tornado.ioloop.IOLoop.instance().start()
                 task_processer.join()
+                data_registrant.close_sessions()
+                BlockIndex.save()
             except Exception as e:
                 LOG.exception(e)
 
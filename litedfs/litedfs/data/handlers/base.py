@@ -73,22 +73,31 @@ class BaseSocketHandler(websocket.WebSocketHandler):
 
 @web.stream_request_body
 class StreamBaseHandler(BaseHandler):
-    PARSE_READY = 0
-    PARSE_FILE_PENDING = 1
+    PARSE_PREAMBLE = 0
+    PARSE_HEADERS = 1
+    PARSE_FIELD = 2
+    PARSE_FILE = 3
+    PARSE_DONE = 4
 
     def check_xsrf_cookie(self): # ignore xsrf check
         pass
 
     def prepare(self):
-        self.mimetype = self.request.headers.get("Content-Type")
-        self.boundary = "--%s" % (self.mimetype[self.mimetype.find("boundary")+9:])
-        self.boundary = self.boundary.encode("utf-8")
-        self.state = StreamBaseHandler.PARSE_READY
+        self.mimetype = self.request.headers.get("Content-Type", "")
+        self.boundary = None
+        if "boundary=" in self.mimetype:
+            boundary = self.mimetype[self.mimetype.find("boundary=") + 9:].split(";")[0].strip().strip('"')
+            # every delimiter is preceded by CRLF, the buffer starts with one so the first delimiter matches too
+            self.boundary = ("\r\n--%s" % boundary).encode("utf-8")
+        self.buffer = b"\r\n"
+        self.state = StreamBaseHandler.PARSE_PREAMBLE
         self.output = None
-        self.find_filename = re.compile(b'filename="(.*)"')
-        self.find_mimetype = re.compile(b'Content-Type: (.*)')
-        self.find_field = re.compile(b'name="(.*)"')
+        self.find_filename = re.compile(r'filename="(.*?)"', re.I)
+        self.find_field = re.compile(r'(?:^|;)\s*name="(.*?)"', re.I)
         self.start = time.time()
+        self.part_name = ""
+        self.part_value = b""
+        self.file_field = ""
         self.file_name = ""
         self.file_path = ""
         self.form_arguments = {}
@@ -96,55 +105,96 @@ class StreamBaseHandler(BaseHandler):
     def data_received(self, data):
         LOG.debug("chunk size: %s", len(data))
         try:
-            buff = data.split(self.boundary)
-            for index, part in enumerate(buff):
-                if part:
-                    if part == b"--\r\n":
+            if self.boundary is None or self.state == StreamBaseHandler.PARSE_DONE:
+                return
+            self.buffer += data
+            while self.buffer and self.state != StreamBaseHandler.PARSE_DONE:
+                if self.state == StreamBaseHandler.PARSE_PREAMBLE:
+                    pos = self.buffer.find(self.boundary)
+                    if pos < 0:
+                        self.buffer = self.buffer[-len(self.boundary):]
                         break
-                    if self.state == StreamBaseHandler.PARSE_FILE_PENDING:
-                        if len(buff) > 1:
-                            self.output.write(part[:-2])
-                            self.output.close()
-                            self.state = StreamBaseHandler.PARSE_READY
-                            continue
-                        else:
-                            self.output.write(part)
-                            self.output.flush()
-                            continue
-
-                    elif self.state == StreamBaseHandler.PARSE_READY:
-                        stream = io.BytesIO(part)
-                        stream.readline()
-                        form_data_type_line = stream.readline()
-                        if form_data_type_line.find(b"filename") > -1:
-                            filename = re.search(self.find_filename, form_data_type_line).groups()[0]
-                            self.file_name = os.path.split(filename)[-1]
-                            self.file_path = os.path.join(CONFIG["data_path"].encode("utf-8"), b"tmp", self.file_name)
-                            self.output = open(self.file_path, "wb")
-                            content_type_line = stream.readline()
-                            mimetype = re.search(self.find_mimetype, content_type_line).groups()[0]
-                            LOG.debug("%s with %s" % (filename, mimetype.strip()))
-                            stream.readline()
-                            body = stream.read()
-                            if len(buff) > index + 1:
-                                self.output.write(body[:-2])
-                                self.output.flush()
-                                self.state = StreamBaseHandler.PARSE_READY
-                            else:
-                                self.output.write(body)
-                                self.output.flush()
-                                self.state = StreamBaseHandler.PARSE_FILE_PENDING
-                        else:
-                            stream.readline()
-                            form_name = re.search(self.find_field, form_data_type_line).groups()[0]
-                            form_value = stream.readline()
-                            if form_name:
-                                self.form_arguments[form_name.strip().decode("utf-8")] = form_value.strip().decode("utf-8")
-                            self.state = StreamBaseHandler.PARSE_READY
-                            LOG.debug("%s = %s" % (form_name.strip(), form_value.strip()))
+                    self.buffer = self.buffer[pos + len(self.boundary):]
+                    self.state = StreamBaseHandler.PARSE_HEADERS
+                elif self.state == StreamBaseHandler.PARSE_HEADERS:
+                    if len(self.buffer) < 2:
+                        break
+                    if self.buffer[:2] == b"--":
+                        self.buffer = b""
+                        self.state = StreamBaseHandler.PARSE_DONE
+                        break
+                    pos = self.buffer.find(b"\r\n\r\n", 2)
+                    if pos < 0:
+                        break
+                    headers = self.buffer[2:pos].decode("utf-8")
+                    self.buffer = self.buffer[pos + 4:]
+                    self.part_begin(headers)
+                else:
+                    pos = self.buffer.find(self.boundary)
+                    if pos < 0:
+                        # keep a tail that may hold the beginning of the next delimiter
+                        keep = len(self.boundary) - 1
+                        if len(self.buffer) > keep:
+                            self.part_received(self.buffer[:-keep])
+                            self.buffer = self.buffer[-keep:]
+                        break
+                    self.part_received(self.buffer[:pos])
+                    self.buffer = self.buffer[pos + len(self.boundary):]
+                    self.part_end()
+                    self.state = StreamBaseHandler.PARSE_HEADERS
         except Exception as e:
             LOG.exception(e)
 
+    def part_begin(self, headers):
+        field_name = ""
+        file_name = None
+        for line in headers.split("\r\n"):
+            if line.lower().startswith("content-disposition:"):
+                disposition = line.split(":", 1)[1]
+                r = re.search(self.find_field, disposition)
+                if r:
+                    field_name = r.groups()[0]
+                r = re.search(self.find_filename, disposition)
+                if r:
+                    file_name = r.groups()[0]
+        if file_name is not None:
+            self.file_field = field_name
+            self.file_begin(field_name, file_name)
+            self.state = StreamBaseHandler.PARSE_FILE
+        else:
+            self.part_name = field_name
+            self.part_value = b""
+            self.state = StreamBaseHandler.PARSE_FIELD
+
+    def part_received(self, data):
+        if data:
+            if self.state == StreamBaseHandler.PARSE_FILE:
+                self.file_received(data)
+            else:
+                self.part_value += data
+
+    def part_end(self):
+        if self.state == StreamBaseHandler.PARSE_FILE:
+            self.file_end()
+        elif self.part_name:
+            self.form_arguments[self.part_name] = self.part_value.decode("utf-8")
+            LOG.debug("%s = %s", self.part_name, self.form_arguments[self.part_name])
+
+    def file_begin(self, field_name, file_name):
+        self.file_name = os.path.split(file_name)[-1]
+        if self.file_name:
+            self.file_path = os.path.join(CONFIG["data_path"], "tmp", self.file_name)
+            self.output = open(self.file_path, "wb")
+
+    def file_received(self, data):
+        if self.output:
+            self.output.write(data)
+
+    def file_end(self):
+        if self.output:
+            self.output.close()
+            self.output = None
+
     def get_form_argument(self, key, default_value):
         result = default_value
         try:
@@ -3,15 +3,19 @@
 import os
 import json
 import time
+import hashlib
 import logging
-from io import BytesIO
+from uuid import uuid4
 
 from tornado import web
 from tornado import gen
+from tornado.iostream import StreamClosedError
 
-from litedfs.data.handlers.base import BaseHandler, BaseSocketHandler
+from litedfs.data.handlers.base import BaseHandler, BaseSocketHandler, StreamBaseHandler
 from litedfs.data.utils.registrant import Registrant
-from litedfs.data.utils.common import file_sha1sum, file_md5sum, bytes_md5sum, Errors, splitall
+from litedfs.data.utils.block_report import BlockReport
+from litedfs.data.utils.block_index import BlockIndex
+from litedfs.data.utils.common import file_sha1sum, file_md5sum, bytes_md5sum, disk_usage, delete_block, Errors, splitall
 from litedfs.data.config import CONFIG
 
 LOG = logging.getLogger("__name__")
@@ -26,38 +30,203 @@ def parse_node_ids(ids_str):
     return node_ids
 
 
-class CreateBlockHandler(BaseHandler):
-    @gen.coroutine
-    def post(self):
-        result = {"result": Errors.OK}
-        try:
-            file_name = self.get_argument("name", "")
-            block_id = self.get_argument("block", "")
-            node_ids = parse_node_ids(self.get_argument("ids", ""))
-            file_body = self.request.files['up_file'][0]["body"]
+class CreateBlockHandler(StreamBaseHandler):
+    def prepare(self):
+        StreamBaseHandler.prepare(self)
+        # the block body never stays in memory, so only the free disk space limits its size
+        self.request.connection.set_max_body_size(disk_usage()["free"])
+        self.block_md5 = hashlib.md5()
+        self.block_size = 0
+        self.tmp_file_path = ""
+        self.pipeline = None
+        self.forward_chunks = []
+
+    def get_block_argument(self, key):
+        return self.get_form_argument(key, self.get_query_argument(key, ""))
+
+    def file_begin(self, field_name, file_name):
+        if field_name == "up_file" and self.output is None:
+            file_name = self.get_block_argument("name")
+            block_id = self.get_block_argument("block")
             if file_name and block_id:
                 dir_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4])
                 if not os.path.exists(dir_path):
                     os.makedirs(dir_path)
-                file_path = os.path.join(dir_path, "%s_%s.blk" % (file_name, block_id))
-                tmp_file_path = os.path.join(dir_path, "%s_%s.blk.tmp" % (file_name, block_id))
-                fp = open(tmp_file_path, "wb")
-                fp.write(file_body)
-                fp.close()
-                os.rename(tmp_file_path, file_path)
-                file_path = os.path.join(dir_path, "%s_%s.chk" % (file_name, block_id))
-                fp = open(file_path, "w")
-                block_md5 = bytes_md5sum(file_body)
-                fp.write(block_md5)
-                fp.close()
-                result["md5"] = block_md5
-                Registrant.instance().replicate_block_async(file_name, BytesIO(file_body), block_id, node_ids)
+                self.tmp_file_path = os.path.join(dir_path, "%s_%s.blk.tmp" % (file_name, block_id))
+                node_ids = parse_node_ids(self.get_block_argument("ids"))
+                if node_ids:
+                    self.pipeline = Registrant.instance().block_pipeline(file_name, block_id, node_ids)
+            else: # name & block arguments after the file part, replicate after receiving
+                self.tmp_file_path = os.path.join(CONFIG["data_path"], "tmp", "%s.blk.tmp" % uuid4().hex)
+            self.output = open(self.tmp_file_path, "wb")
+
+    def file_received(self, data):
+        if self.output and self.file_field == "up_file":
+            self.output.write(data)
+            self.block_md5.update(data)
+            self.block_size += len(data)
+            if self.pipeline:
+                self.forward_chunks.append(data)
+
+    @gen.coroutine
+    def data_received(self, data):
+        StreamBaseHandler.data_received(self, data)
+        if self.forward_chunks:
+            chunks = self.forward_chunks
+            self.forward_chunks = []
+            for chunk in chunks:
+                yield self.pipeline.write(chunk)
+
+    def discard_block(self):
+        try:
+            if self.pipeline:
+                self.pipeline.abort()
+                self.pipeline = None
+            if self.output:
+                self.output.close()
+                self.output = None
+            if self.tmp_file_path and os.path.exists(self.tmp_file_path):
+                os.remove(self.tmp_file_path)
+        except Exception as e:
+            LOG.exception(e)
+
+    def on_connection_close(self):
+        self.discard_block()
+
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            yield self.store_block(result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.discard_block()
+        self.write(result)
+        self.finish()
+
+    @gen.coroutine
+    def store_block(self, result):
+        """
+        keep the received block, its md5 and the replica results go into the result
+        """
+        file_name = self.get_block_argument("name")
+        block_id = self.get_block_argument("block")
+        node_ids = parse_node_ids(self.get_block_argument("ids"))
+        if file_name and block_id and self.tmp_file_path and self.output is None and self.state == StreamBaseHandler.PARSE_DONE:
+            dir_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4])
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+            file_path = os.path.join(dir_path, "%s_%s.blk" % (file_name, block_id))
+            os.rename(self.tmp_file_path, file_path)
+            self.tmp_file_path = ""
+            BlockReport.add(file_name, block_id)
+            Registrant.instance().add_write_load(self.block_size)
+            file_path = os.path.join(dir_path, "%s_%s.chk" % (file_name, block_id))
+            fp = open(file_path, "w")
+            block_md5 = self.block_md5.hexdigest()
+            fp.write(block_md5)
+            fp.close()
+            BlockIndex.add(file_name, block_id, block_md5, self.block_size)
+            result["md5"] = block_md5
+            if self.pipeline:
+                pipeline = self.pipeline
+                self.pipeline = None
+                result["replicas"] = yield pipeline.finish(block_md5)
+            elif node_ids:
+                result["replicas"] = yield Registrant.instance().replicate_block_async(file_name, block_id, node_ids)
+        else:
+            LOG.warning("invalid arguments")
+            Errors.set_result_error("InvalidParameters", result)
+
+
+class CreateFileHandler(CreateBlockHandler):
+    """
+    create a file that fits in one block with one request from the client,
+    the block is kept and forwarded down the ids chain like /block/create, checked against the md5 argument if given,
+    then the file is committed to the name node with the client's user & token,
+    a failed check or commit deletes the block and its replicas again
+    """
+    def prepare(self):
+        CreateBlockHandler.prepare(self)
+        self.file_id = str(uuid4())
+
+    def get_block_argument(self, key):
+        if key == "name":
+            return self.file_id
+        elif key == "block":
+            return "0"
+        return CreateBlockHandler.get_block_argument(self, key)
+
+    @gen.coroutine
+    def delete_replicas(self, node_ids):
+        registrant = Registrant.instance()
+        task = {"command": "delete", "name": self.file_id, "block": "0"}
+        for node_id in node_ids:
+            data_node = registrant.data_nodes.get(str(node_id))
+            if data_node:
+                try:
+                    url = "http://%s:%s/task/push" % (data_node[0], data_node[1])
+                    yield registrant.async_client.fetch(url, method = "POST", headers = {"token": registrant.task_token}, body = json.dumps({"tasks": [task]}), raise_error = False)
+                except Exception as e:
+                    LOG.warning("delete block: %s_0 on node: %s failed: %s", self.file_id, node_id, e)
+
+    @gen.coroutine
+    def commit_file(self, file_path, replica, result):
+        registrant = Registrant.instance()
+        node_ids = [registrant.id]
+        for node_id in result.get("replicas", {}):
+            if result["replicas"][node_id] == Errors.OK:
+                node_ids.append(int(node_id))
+        json_data = {
+            "size": self.block_size,
+            "path": file_path,
+            "id": self.file_id,
+            "replica": replica,
+            "blocks": [[0, self.block_size, node_ids, result["md5"]]],
+            "checksum": bytes_md5sum(result["md5"].encode("utf-8")),
+        }
+        url = "http://%s:%s/file/create" % (CONFIG["name_http_host"], CONFIG["name_http_port"])
+        headers = {"user": self.request.headers["user"], "token": self.request.headers["token"]}
+        r = yield registrant.async_client.fetch(url, method = "POST", headers = headers, body = json.dumps(json_data), raise_error = False)
+        data = json.loads(r.body.decode("utf-8")) if r.code == 200 else {}
+        if data.get("result") == Errors.OK:
+            result["id"] = self.file_id
+            result["blocks"] = json_data["blocks"]
+        else:
+            LOG.error("commit file: %s to name node failed, response: %s, %s", file_path, r.code, data)
+            delete_block(self.file_id, "0")
+            yield self.delete_replicas(node_ids[1:])
+            result.clear()
+            if "result" in data:
+                result.update(data)
+            else:
+                Errors.set_result_error("OperationFailed", result)
+
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            file_path = self.get_block_argument("path")
+            replica = int(self.get_block_argument("replica") or "1")
+            if file_path and replica > 0 and Registrant.instance().id is not None and "user" in self.request.headers and "token" in self.request.headers:
+                yield self.store_block(result)
+                if result["result"] == Errors.OK:
+                    block_md5 = self.get_block_argument("md5")
+                    if not block_md5 or block_md5 == result["md5"]:
+                        yield self.commit_file(file_path, replica, result)
+                    else:
+                        delete_block(self.file_id, "0")
+                        yield self.delete_replicas([node_id for node_id in result.get("replicas", {}) if result["replicas"][node_id] == Errors.OK])
+                        result.clear()
+                        Errors.set_result_error("ChecksumFailed", result)
             else:
                 LOG.warning("invalid arguments")
                 Errors.set_result_error("InvalidParameters", result)
         except Exception as e:
             LOG.exception(e)
             Errors.set_result_error("ServerException", result)
+        self.discard_block()
         self.write(result)
         self.finish()
 
@@ -73,31 +242,32 @@ class RangeReadHandler(BaseHandler):
             size = int(self.get_argument("size", -1))
             block_md5 = self.get_argument("md5", "")
             if file_name and block_id and offset >= 0 and size > 0 and block_md5:
-                file_md5 = ""
-                dir_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4])
-                file_path = os.path.join(dir_path, "%s_%s.chk" % (file_name, block_id))
-                if os.path.exists(file_path) and os.path.isfile(file_path):
-                    with open(file_path, 'r') as f:
-                        file_md5 = f.read()
-                if file_md5 == block_md5:
-                    file_path = os.path.join(dir_path, "%s_%s.blk" % (file_name, block_id))
-                    if os.path.exists(file_path) and os.path.isfile(file_path):
-                        buf_size = 64 * 1024
-                        self.set_header('Content-Type', 'application/octet-stream')
-                        self.set_header('Content-Disposition', 'attachment; filename=%s_%s.blk.%s-%s.part' % (file_name, block_id, offset, size))
-                        with open(file_path, 'rb') as f:
+                # md5 & size from the block index, the .blk file is the only one opened
+                block_info = BlockIndex.get(file_name, block_id)
+                if block_info is None:
+                    Errors.set_result_error("BlockNotExists", result)
+                elif block_info[0] == block_md5:
+                    file_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4], "%s_%s.blk" % (file_name, block_id))
+                    try:
+                        f = open(file_path, 'rb')
+                    except OSError:
+                        BlockIndex.remove(file_name, block_id)
+                        f = None
+                    if f is not None:
+                        with f:
+                            buf_size = 64 * 1024
+                            self.set_header('Content-Type', 'application/octet-stream')
+                            self.set_header('Content-Disposition', 'attachment; filename=%s_%s.blk.%s-%s.part' % (file_name, block_id, offset, size))
+                            size = max(0, min(size, block_info[1] - offset))
+                            self.set_header('Content-Length', size)
                             f.seek(offset)
-                            while size > buf_size:
-                                data = f.read(buf_size)
+                            while size > 0:
+                                data = f.read(min(size, buf_size))
                                 if not data:
                                     break
                                 self.write(data)
-                                self.flush()
-                                yield gen.moment
-                                size -= buf_size
-                            if size > 0:
-                                self.write(f.read(size))
-                                self.flush()
+                                yield self.flush()
+                                size -= len(data)
                         self.finish()
                         return
                     else:
@@ -107,6 +277,9 @@ class RangeReadHandler(BaseHandler):
             else:
                 LOG.warning("invalid arguments")
                 Errors.set_result_error("InvalidParameters", result)
+        except StreamClosedError:
+            LOG.warning("client closed while sending block: %s_%s", file_name, block_id)
+            return
         except Exception as e:
             LOG.exception(e)
             Errors.set_result_error("ServerException", result)
@@ -128,14 +301,15 @@ class DownloadBlockHandler(BaseHandler):
                     buf_size = 64 * 1024
                     self.set_header('Content-Type', 'application/octet-stream')
                     self.set_header('Content-Disposition', 'attachment; filename=%s_%s.blk' % (file_name, block_id))
+                    self.set_header('Content-Length', os.path.getsize(file_path))
                     with open(file_path, 'rb') as f:
                         while True:
                             data = f.read(buf_size)
                             if not data:
                                 break
                             self.write(data)
-                            self.flush()
-                            yield gen.moment
+                            # wait until the chunk is sent, slow clients must not pile the block up in memory
+                            yield self.flush()
                     self.finish()
                     return
                 else:
@@ -143,6 +317,9 @@ class DownloadBlockHandler(BaseHandler):
             else:
                 LOG.warning("invalid arguments")
                 Errors.set_result_error("InvalidParameters", result)
+        except StreamClosedError:
+            LOG.warning("client closed while sending block: %s_%s", file_name, block_id)
+            return
         except Exception as e:
             LOG.exception(e)
             Errors.set_result_error("ServerException", result)
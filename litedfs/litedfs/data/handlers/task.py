@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+
+from tornado import gen
+
+from litedfs.data.handlers.base import BaseHandler
+from litedfs.data.utils.task_cache import TaskCache
+from litedfs.data.utils.registrant import Registrant
+from litedfs.data.utils.common import Errors
+
+LOG = logging.getLogger("__name__")
+
+
+class PushTaskHandler(BaseHandler):
+    """
+    urgent tasks pushed by the name node, they skip the queue instead of waiting for a heartbeat,
+    the token header must be the task token the name node sent when this data node registered
+    """
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            data = json.loads(self.request.body.decode("utf-8"))
+            tasks = data.get("tasks", [])
+            task_token = Registrant.instance().task_token
+            if not task_token or self.request.headers.get("token") != task_token:
+                LOG.error("permission denied, push tasks from: %s", self.request.remote_ip)
+                Errors.set_result_error("AuthError", result)
+            elif isinstance(tasks, list):
+                for task in reversed(tasks):
+                    TaskCache.push_front(task)
+                result["task_queue_free"] = TaskCache.free()
+                LOG.debug("push urgent tasks: %s", tasks)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
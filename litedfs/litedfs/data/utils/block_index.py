@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from litedfs.data.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class BlockIndex(object):
+    """
+    md5 & size of the blocks stored on this data node, so a range read doesn't read the .chk file,
+    a block is loaded from its .chk file the first time it is read, created & deleted blocks update it,
+    at most block_index_size blocks are kept, the least recently read go first,
+    with block_index_file it is saved to data_path/block_index at shutdown and loaded at startup,
+    the file is removed once loaded, so an index missing the changes before a crash is never used
+    """
+    lock = threading.Lock()
+    blocks = OrderedDict()
+
+    @classmethod
+    def path(cls):
+        return os.path.join(CONFIG["data_path"], "block_index")
+
+    @classmethod
+    def add(cls, name, block, md5, size):
+        key = (name, str(block))
+        max_size = CONFIG.get("block_index_size", 1000000)
+        with cls.lock:
+            cls.blocks[key] = (md5, size)
+            cls.blocks.move_to_end(key)
+            while len(cls.blocks) > max_size:
+                cls.blocks.popitem(last = False)
+
+    @classmethod
+    def remove(cls, name, block):
+        with cls.lock:
+            cls.blocks.pop((name, str(block)), None)
+
+    @classmethod
+    def get(cls, name, block):
+        """
+        (md5, size) of the block, None if it isn't stored here
+        """
+        key = (name, str(block))
+        with cls.lock:
+            result = cls.blocks.get(key)
+            if result is not None:
+                cls.blocks.move_to_end(key)
+                return result
+        dir_path = os.path.join(CONFIG["data_path"], "files", name[:2], name[2:4])
+        try:
+            with open(os.path.join(dir_path, "%s_%s.chk" % (name, block)), "r") as fp:
+                md5 = fp.read()
+            size = os.path.getsize(os.path.join(dir_path, "%s_%s.blk" % (name, block)))
+        except OSError:
+            return None
+        cls.add(name, block, md5, size)
+        return md5, size
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.blocks.clear()
+
+    @classmethod
+    def load(cls):
+        if CONFIG.get("block_index_file", False) and os.path.exists(cls.path()):
+            try:
+                max_size = CONFIG.get("block_index_size", 1000000)
+                with cls.lock:
+                    with open(cls.path(), "r") as fp:
+                        for line in fp:
+                            name, block, md5, size = line.split()
+                            cls.blocks[(name, block)] = (md5, int(size))
+                    while len(cls.blocks) > max_size:
+                        cls.blocks.popitem(last = False)
+                LOG.info("load block index: %s blocks", len(cls.blocks))
+            except Exception as e:
+                LOG.exception(e)
+                cls.clear()
+            os.remove(cls.path())
+
+    @classmethod
+    def save(cls):
+        if CONFIG.get("block_index_file", False):
+            try:
+                tmp_path = cls.path() + ".tmp"
+                with cls.lock:
+                    with open(tmp_path, "w") as fp:
+                        for (name, block), (md5, size) in cls.blocks.items():
+                            fp.write("%s %s %s %s\n" % (name, block, md5, size))
+                    n = len(cls.blocks)
+                os.rename(tmp_path, cls.path())
+                LOG.info("save block index: %s blocks", n)
+            except Exception as e:
+                LOG.exception(e)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import json
+import uuid
+import logging
+import datetime
+from functools import partial
+
+from tornado import gen
+from tornado.queues import Queue
+from tornado.util import TimeoutError
+from tornado.httpclient import HTTPRequest
+
+from litedfs.data.utils.common import Errors
+
+LOG = logging.getLogger(__name__)
+
+PIPELINE_TIMEOUT = 3600
+PUT_TIMEOUT = datetime.timedelta(seconds = 1)
+
+
+class PipelineAbortedError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class BlockPipeline(object):
+    """
+    forward a block to the next data node of the replica chain while it is still being received,
+    the chunks are posted to the first online node of node_ids, the rest node_ids go with the request,
+    so every node of the chain forwards the block in the same way
+    """
+    ABORT = object()
+
+    def __init__(self, http_client, data_nodes, file_name, block_id, node_ids, queue_size = 16):
+        self.http_client = http_client
+        self.data_nodes = data_nodes
+        self.file_name = file_name
+        self.block_id = block_id
+        self.node_ids = node_ids
+        self.queue = Queue(maxsize = queue_size)
+        self.node_id = None
+        self.downstream_ids = []
+        self.replicas = {}
+        self.future = None
+        self.aborted = False
+
+    def start(self):
+        for n, node_id in enumerate(self.node_ids):
+            if node_id in self.data_nodes:
+                self.node_id = node_id
+                self.downstream_ids = self.node_ids[n + 1:]
+                break
+            else:
+                LOG.error("pipeline block[%s_%s] skip node: %s, not online", self.file_name, self.block_id, node_id)
+                self.replicas[node_id] = "ReplicateBlockFailed"
+        if self.node_id is not None:
+            data_node = self.data_nodes[self.node_id]
+            url = "http://%s:%s/block/create" % (data_node[0], data_node[1])
+            boundary = uuid.uuid4().hex
+            params = {"name": self.file_name, "block": str(self.block_id), "ids": ",".join(self.downstream_ids)}
+            request = HTTPRequest(
+                url,
+                method = "POST",
+                headers = {"Content-Type": "multipart/form-data; boundary=%s" % boundary},
+                body_producer = partial(self.body_producer, boundary, params),
+                request_timeout = PIPELINE_TIMEOUT
+            )
+            self.future = self.http_client.fetch(request, raise_error = False)
+        return self
+
+    @gen.coroutine
+    def body_producer(self, boundary, params, write):
+        boundary_bytes = boundary.encode()
+        for arg_name in params:
+            yield write(b'--%s\r\n' % (boundary_bytes, ))
+            yield write(b'Content-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' %
+                        (arg_name.encode(), params[arg_name].encode()))
+        yield write(b'--%s\r\n' % (boundary_bytes, ))
+        yield write(b'Content-Disposition: form-data; name="up_file"; filename="up_file"\r\n')
+        yield write(b'Content-Type: application/octet-stream\r\n\r\n')
+        while True:
+            chunk = yield self.queue.get()
+            if self.aborted or chunk is BlockPipeline.ABORT:
+                raise PipelineAbortedError("pipeline block[%s_%s] aborted" % (self.file_name, self.block_id))
+            if chunk is None:
+                break
+            yield write(chunk)
+        yield write(b'\r\n--%s--\r\n' % (boundary_bytes, ))
+
+    @gen.coroutine
+    def write(self, chunk):
+        # stop waiting for queue space once the downstream request failed
+        while self.future is not None and not self.future.done():
+            try:
+                yield self.queue.put(chunk, timeout = PUT_TIMEOUT)
+                break
+            except TimeoutError:
+                pass
+
+    @gen.coroutine
+    def finish(self, block_md5):
+        if self.future is not None:
+            try:
+                yield self.write(None)
+                r = yield self.future
+                if r.code == 200:
+                    data = json.loads(r.body.decode("utf-8"))
+                    if "result" in data and data["result"] == Errors.OK:
+                        if data["md5"] == block_md5:
+                            self.replicas[self.node_id] = Errors.OK
+                        else:
+                            self.replicas[self.node_id] = "ChecksumFailed"
+                    else:
+                        self.replicas[self.node_id] = data["result"]
+                    if "replicas" in data:
+                        self.replicas.update(data["replicas"])
+                else:
+                    LOG.error("pipeline block[%s_%s] to node: %s failed, response: %s", self.file_name, self.block_id, self.node_id, r)
+            except Exception as e:
+                LOG.exception(e)
+            for node_id in [self.node_id] + self.downstream_ids:
+                if node_id not in self.replicas:
+                    self.replicas[node_id] = "ReplicateBlockFailed"
+        return self.replicas
+
+    def abort(self):
+        self.aborted = True
+        try:
+            self.queue.put_nowait(BlockPipeline.ABORT)
+        except Exception:
+            pass
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+from collections import deque
+
+from litedfs.data.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class BlockReport(object):
+    """
+    blocks stored on this data node, reported to the name node with the heartbeats,
+    a full report is split into parts over several heartbeats, then only the added & removed blocks are sent,
+    blocks are grouped by file: {file_id: [block_id, ...]}
+    """
+    lock = threading.Lock()
+    added = {}
+    removed = {}
+    full_parts = deque()
+    full_parts_sent = 0
+    scanning = False
+
+    @classmethod
+    def add(cls, name, block):
+        block = int(block)
+        with cls.lock:
+            if name in cls.removed:
+                cls.removed[name].discard(block)
+            if name not in cls.added:
+                cls.added[name] = set()
+            cls.added[name].add(block)
+
+    @classmethod
+    def remove(cls, name, block):
+        block = int(block)
+        with cls.lock:
+            if name in cls.added:
+                cls.added[name].discard(block)
+            if name not in cls.removed:
+                cls.removed[name] = set()
+            cls.removed[name].add(block)
+
+    @classmethod
+    def begin_full_report(cls):
+        # incremental reports wait for the full report, so a block removed during the scan isn't added back by it
+        with cls.lock:
+            cls.scanning = True
+
+    @classmethod
+    def scan(cls, part_size = 50000):
+        parts = []
+        part = {}
+        n = 0
+        files_path = os.path.join(CONFIG["data_path"], "files")
+        for level_1 in os.scandir(files_path):
+            if level_1.is_dir():
+                for level_2 in os.scandir(level_1.path):
+                    if level_2.is_dir():
+                        for f in os.scandir(level_2.path):
+                            if f.name.endswith(".blk"):
+                                name, block = f.name[:-4].rsplit("_", 1)
+                                if name not in part:
+                                    part[name] = []
+                                part[name].append(int(block))
+                                n += 1
+                                if n >= part_size:
+                                    parts.append(part)
+                                    part = {}
+                                    n = 0
+        parts.append(part)
+        return parts
+
+    @classmethod
+    def start_full_report(cls, parts):
+        with cls.lock:
+            cls.full_parts = deque(parts)
+            cls.full_parts_sent = 0
+            cls.scanning = False
+        LOG.info("start full block report, parts: %s", len(parts))
+
+    @classmethod
+    def next_report(cls):
+        """
+        the report goes with the next heartbeat, the full report first, incremental ones after it finished
+        """
+        result = None
+        with cls.lock:
+            if cls.full_parts:
+                result = {"type": "full", "blocks": cls.full_parts.popleft(), "first": cls.full_parts_sent == 0, "last": len(cls.full_parts) == 0}
+                cls.full_parts_sent += 1
+            elif not cls.scanning and (cls.added or cls.removed):
+                result = {
+                    "type": "incremental",
+                    "added": {name: list(cls.added[name]) for name in cls.added if cls.added[name]},
+                    "removed": {name: list(cls.removed[name]) for name in cls.removed if cls.removed[name]},
+                }
+                cls.added = {}
+                cls.removed = {}
+        return result
@@ -15,6 +15,8 @@ from tornado import gen
 from tornado.web import HTTPError
 import psutil
 
+from litedfs.data.utils.block_report import BlockReport
+from litedfs.data.utils.block_index import BlockIndex
 from litedfs.data.config import CONFIG
 
 LOG = logging.getLogger(__name__)
@@ -62,6 +64,7 @@ class Errors(object):
         "BlockNotExists": {"name": "BlockNotExists", "message": "block not exists"},
         "ChecksumFailed": {"name": "ChecksumFailed", "message": "checksum failed"},
         "ReplicateBlockFailed": {"name": "ReplicateBlockFailed", "message": "replicate block failed"},
+        "AuthError": {"name": "AuthError", "message": "permission denied"},
     }
 
     @classmethod
@@ -184,6 +187,9 @@ def delete_file(name):
             for file in files:
                 if file.startswith(name):
                     os.remove(os.path.join(dir_path, file))
+                    if file.endswith(".blk"):
+                        BlockReport.remove(name, file[:-4].rsplit("_", 1)[1])
+                        BlockIndex.remove(name, file[:-4].rsplit("_", 1)[1])
             files = os.listdir(dir_path)
             if len(files) == 0:
                 os.rmdir(dir_path)
@@ -196,28 +202,31 @@ def delete_file(name):
 
 
 def delete_block(name, block):
+    delete_blocks(name, [block])
+
+
+def delete_blocks(name, blocks):
     try:
         dir_path = os.path.join(CONFIG["data_path"], "files", name[:2], name[2:4])
-        file_path = os.path.join(dir_path, "%s_%s.blk" % (name, block))
-        tmp_file_path = os.path.join(dir_path, "%s_%s.blk.tmp" % (name, block))
-        check_file_path = os.path.join(dir_path, "%s_%s.chk" % (name, block))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
-        if os.path.exists(check_file_path):
-            os.remove(check_file_path)
-        files = os.listdir(dir_path)
-        if len(files) == 0:
+        for block in blocks:
+            for file_name in ("%s_%s.blk" % (name, block), "%s_%s.blk.tmp" % (name, block), "%s_%s.chk" % (name, block)):
+                try:
+                    os.remove(os.path.join(dir_path, file_name))
+                except FileNotFoundError:
+                    pass
+            BlockReport.remove(name, block)
+            BlockIndex.remove(name, block)
+        # rmdir only succeeds on empty directories, no need to list them
+        try:
             os.rmdir(dir_path)
-            dir_parent_path = os.path.split(dir_path)[0]
-            files = os.listdir(dir_parent_path)
-            if len(files) == 0:
-                os.rmdir(dir_parent_path)
+            os.rmdir(os.path.split(dir_path)[0])
+        except OSError:
+            pass
     except Exception as e:
         LOG.exception(e)
 
 
+@gen.coroutine
 def body_producer(boundary, files, params, write):
     if not isinstance(files, dict):
         raise HTTPError("files must be dict")
@@ -226,32 +235,69 @@ def body_producer(boundary, files, params, write):
 
     boundary_bytes = boundary.encode()
 
+    # params go first, so the receiver knows where the block belongs before its body arrives
+    for arg_name in params:
+        value = params[arg_name]
+        yield write(b'--%s\r\n' % (boundary_bytes, ))
+        yield write(b'Content-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' %
+                    (arg_name.encode(), value.encode()))
+
     for file_name in files:
         file = files[file_name]
         file_name_bytes = file_name.encode()
-        write(b'--%s\r\n' % (boundary_bytes, ))
-        write(b'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' %
-              (file_name.encode(), file_name_bytes))
+        yield write(b'--%s\r\n' % (boundary_bytes, ))
+        yield write(b'Content-Disposition: form-data; name="%s"; filename="%s"\r\n' %
+                    (file_name.encode(), file_name_bytes))
 
         mtype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
-        write(b'Content-Type: %s\r\n' % (mtype.encode(), ))
-        write(b'\r\n')
+        yield write(b'Content-Type: %s\r\n' % (mtype.encode(), ))
+        yield write(b'\r\n')
         while True:
-            # 64k at a time.
+            # 64k at a time, wait for each write to drain so the block never sits in memory.
             chunk = file.read(64 * 1024)
             if not chunk:
                 break
-            write(chunk)
+            yield write(chunk)
 
-        write(b'\r\n')
+        yield write(b'\r\n')
+
+    yield write(b'--%s--\r\n' % (boundary_bytes, ))
 
-    for arg_name in params:
-        value = params[arg_name]
-        write(b'--%s\r\n' % (boundary_bytes, ))
-        write(b'Content-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' %
-              (arg_name.encode(), value.encode()))
 
-    write(b'--%s--\r\n' % (boundary_bytes, ))
+def body_chunks(boundary, files, params):
+    """
+    the multipart body of body_producer as a generator, for a streamed requests body
+    """
+    boundary_bytes = boundary.encode()
+    for arg_name in params:
+        yield b'--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n' % (boundary_bytes, arg_name.encode(), params[arg_name].encode())
+    for file_name in files:
+        file = files[file_name]
+        mtype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+        yield b'--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+            boundary_bytes, file_name.encode(), file_name.encode(), mtype.encode())
+        while True:
+            chunk = file.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+        yield b'\r\n'
+    yield b'--%s--\r\n' % (boundary_bytes, )
+
+
+def throttle_chunks(chunks, rate):
+    """
+    pace a chunk generator to at most rate bytes per second, 0 means no limit
+    """
+    start = time.time()
+    sent = 0
+    for chunk in chunks:
+        yield chunk
+        sent += len(chunk)
+        if rate > 0:
+            delay = float(sent) / rate - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
 
 
 def async_post(async_client, url, files, params):
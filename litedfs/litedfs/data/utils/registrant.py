@@ -2,18 +2,25 @@
 
 import os
 import json
+import time
+import hashlib
 import logging
-from io import BytesIO
+import threading
+from uuid import uuid4
 
 import requests
+from requests.adapters import HTTPAdapter
 from tornado import gen
+from tornado.ioloop import IOLoop
 from tornado.httpclient import AsyncHTTPClient, HTTPRequest
 from tornado.tcpclient import TCPClient
 from tornado_discovery.registrant import BaseRegistrant
 from tornado_discovery.common import Command, Status
 
-from litedfs.data.utils.common import Errors, async_post, disk_usage, size_pretty
+from litedfs.data.utils.common import Errors, BUF_SIZE, disk_usage, size_pretty, body_chunks, throttle_chunks
+from litedfs.data.utils.block_pipeline import BlockPipeline
 from litedfs.data.utils.task_cache import TaskCache
+from litedfs.data.utils.block_report import BlockReport
 from litedfs.data.config import CONFIG
 
 LOG = logging.getLogger(__name__)
@@ -38,7 +45,16 @@ class Registrant(BaseRegistrant):
             cls._instance.heartbeat_data = {}
             cls._instance.registered = False
             cls._instance.data_nodes = {}
+            cls._instance.id = None # the name node's id of this data node
+            cls._instance.task_token = None
             cls._instance.async_client = AsyncHTTPClient()
+            cls._instance.pipeline_client = AsyncHTTPClient(force_instance = True, max_clients = 100)
+            cls._instance.sessions = {}
+            cls._instance.sessions_lock = threading.Lock()
+            cls._instance.full_block_report_time = 0
+            cls._instance.write_bytes = 0
+            cls._instance.write_load = 0.0
+            cls._instance.write_load_time = time.time()
         return cls._instance
 
     def __init__(self, host, port, config, retry_interval = 10, reconnect = True):
@@ -48,35 +64,78 @@ class Registrant(BaseRegistrant):
     def instance(cls):
         return cls._instance
 
+    def get_session(self, data_node):
+        """
+        one pooled keep-alive session per data node endpoint, shared by all threads
+        """
+        endpoint = "%s:%s" % (data_node[0], data_node[1])
+        with self.sessions_lock:
+            if endpoint not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = CONFIG.get("http_pool_size", 10))
+                session.mount("http://", adapter)
+                if not CONFIG.get("http_keep_alive", True):
+                    session.headers["Connection"] = "close"
+                self.sessions[endpoint] = session
+            return self.sessions[endpoint]
+
+    def close_sessions(self):
+        with self.sessions_lock:
+            for endpoint in self.sessions:
+                self.sessions[endpoint].close()
+            self.sessions.clear()
+
     def update_heartbeat_data(self, data = {}):
         self.heartbeat_data.update(data)
 
+    def add_write_load(self, size):
+        self.write_bytes += size
+
+    def update_write_load(self):
+        """
+        bytes written per second, smoothed over the heartbeats
+        """
+        now = time.time()
+        if now > self.write_load_time:
+            self.write_load = self.write_load * 0.5 + self.write_bytes / (now - self.write_load_time) * 0.5
+            self.write_bytes = 0
+            self.write_load_time = now
+
+    def block_pipeline(self, file_name, block_id, node_ids):
+        return BlockPipeline(self.pipeline_client, self.data_nodes, file_name, block_id, node_ids).start()
+
     @gen.coroutine
-    def replicate_block_async(self, file_name, block_file, block_id, node_ids):
-        result = False
+    def replicate_block_async(self, file_name, block_id, node_ids):
+        result = {}
+        block_file = None
         try:
             if node_ids:
-                node_id = node_ids[0]
-                if node_id in self.data_nodes:
-                    data_node = self.data_nodes[node_id]
-                    url = "http://%s:%s/block/create" % (data_node[0], data_node[1])
-                    r = yield async_post(self.async_client, url, {"up_file": block_file}, {"name": file_name, "block": block_id, "ids": ",".join(node_ids[1:])})
-                    if r.code == 200:
-                        data = json.loads(r.body.decode("utf-8"))
-                        if "result" in data and data["result"] == Errors.OK:
-                            result = True
-                            LOG.debug("replicate block to node: %s(%s:%s), result: %s", node_id, data_node[0], data_node[1], result)
-                        else:
-                            LOG.error("replicate block to node: %s(%s:%s) failed, result: %s", node_id, data_node[0], data_node[1], result)
-                    else:
-                        LOG.error("replicate block to node: %s(%s:%s) failed, response: %s", node_id, data_node[0], data_node[1], r)
-            else:
-                result = True
+                file_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4], "%s_%s.blk" % (file_name, block_id))
+                block_file = open(file_path, "rb")
+                pipeline = self.block_pipeline(file_name, block_id, node_ids)
+                block_md5 = hashlib.md5()
+                while True:
+                    chunk = block_file.read(BUF_SIZE)
+                    if not chunk:
+                        break
+                    block_md5.update(chunk)
+                    yield pipeline.write(chunk)
+                result = yield pipeline.finish(block_md5.hexdigest())
+                LOG.debug("replicate block[%s_%s] to nodes: %s, result: %s", file_name, block_id, node_ids, result)
         except Exception as e:
             LOG.exception(e)
+            for node_id in node_ids:
+                if node_id not in result:
+                    result[node_id] = "ReplicateBlockFailed"
+        finally:
+            if block_file:
+                block_file.close()
         return result
 
-    def replicate_block(self, file_name, block_id, node_ids):
+    def replicate_block(self, file_name, block_id, node_ids, bandwidth = 0):
+        """
+        copy a local block to the node_ids chain, sent at most bandwidth bytes per second, 0 means no limit
+        """
         result = False
         try:
             node_ids = [str(i) for i in node_ids]
@@ -88,18 +147,19 @@ class Registrant(BaseRegistrant):
 
                     file_path = os.path.join(CONFIG["data_path"], "files", file_name[:2], file_name[2:4], "%s_%s.blk" % (file_name, block_id))
                     if os.path.exists(file_path):
-                        fp = open(file_path, "rb")
-                        block_content = BytesIO(fp.read())
-                        fp.close()
-                        files = {'up_file': ("up_file", block_content, b"text/plain")}
-                        values = {"name": file_name, "block": block_id, "ids": ",".join(node_ids[1:])}
-                        r = requests.post(url, files = files, data = values)
+                        # streamed from the file 64k at a time, the block never sits in memory
+                        boundary = uuid4().hex
+                        headers = {"Content-Type": "multipart/form-data; boundary=%s" % boundary}
+                        values = {"name": file_name, "block": str(block_id), "ids": ",".join(node_ids[1:])}
+                        with open(file_path, "rb") as fp:
+                            body = throttle_chunks(body_chunks(boundary, {"up_file": fp}, values), bandwidth)
+                            r = self.get_session(data_node).post(url, headers = headers, data = body)
                         if r.status_code == 200:
                             data = r.json()
                             if "result" in data and data["result"] == "ok":
                                 result = True
                             else:
-                                LOG.error("replicate block failed: %s", d)
+                                LOG.error("replicate block failed: %s", data)
                         else:
                             LOG.error("replicate block error:\ncode: %s\ncontent: %s", r.status_code, r.content)
                     else:
@@ -122,6 +182,9 @@ class Registrant(BaseRegistrant):
             if data["command"] == Command.register:
                 if data["data"]["status"] == Status.success:
                     self.registered = True
+                    self.id = data["data"].get("id")
+                    self.task_token = data["data"].get("task_token")
+                    IOLoop.current().add_callback(self.full_block_report)
                     if not self.config.has_key("node_id"):
                         self.config.set("node_id", data["data"]["node_id"])
                         LOG.info("Received new node_id: %s", data["data"]["node_id"])
@@ -133,9 +196,23 @@ class Registrant(BaseRegistrant):
         except Exception as e:
             LOG.exception(e)
 
+    @gen.coroutine
+    def full_block_report(self):
+        self.full_block_report_time = time.time()
+        BlockReport.begin_full_report()
+        parts = []
+        try:
+            parts = yield IOLoop.current().run_in_executor(None, BlockReport.scan, CONFIG.get("block_report_part_size", 50000))
+        except Exception as e:
+            LOG.exception(e)
+        BlockReport.start_full_report(parts)
+
     def update_storage_info(self, data):
         usage = disk_usage()
         data.update({"storage_full": self.config.get("storage_preserve_space") > usage["free"]})
+        data.update({"storage_free": usage["free"] - self.config.get("storage_preserve_space")})
+        data.update({"storage_used": usage["used"], "storage_total": usage["total"]})
+        data.update({"write_load": self.write_load, "rack": CONFIG.get("rack", "")})
         data.update({"storage_preserve_space": size_pretty(self.config.get("storage_preserve_space"))})
         data.update({"storage_disk_total": size_pretty(usage["total"])})
         data.update({"storage_disk_used": size_pretty(usage["used"])})
@@ -147,7 +224,13 @@ class Registrant(BaseRegistrant):
         try:
             message_data = self.config.to_dict()
             message_data.update(self.heartbeat_data)
-            message_data.update({"task_queue_full": TaskCache.full()})
+            message_data.update({"task_queue_full": TaskCache.full(), "task_queue_free": TaskCache.free()})
+            if self.registered and not BlockReport.scanning and time.time() - self.full_block_report_time >= CONFIG.get("block_report_interval", 3600):
+                IOLoop.current().add_callback(self.full_block_report)
+            block_report = BlockReport.next_report()
+            if block_report:
+                message_data["block_report"] = block_report
+            self.update_write_load()
             self.update_storage_info(message_data)
             data = {"command": Command.heartbeat, "data": message_data}
             self.send_message(data)
@@ -158,6 +241,9 @@ class Registrant(BaseRegistrant):
                 if "task" in data["data"]:
                     task = data["data"]["task"]
                     TaskCache.push(task)
+                if "tasks" in data["data"]:
+                    for task in data["data"]["tasks"]:
+                        TaskCache.push(task)
                 LOG.debug("Client Received Heartbeat Message: %s", data["data"])
             else:
                 LOG.error("Client Received Heartbeat Message: %s", data["data"])
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
+from collections import deque
 
 LOG = logging.getLogger(__name__)
 
 
 class TaskCache(object):
-    cache = []
-    max_size = 10
+    cache = deque()
+    max_size = 1000
+    event = threading.Event()
 
     @classmethod
     def set_max_size(cls, size):
@@ -16,18 +19,32 @@ class TaskCache(object):
     @classmethod
     def push(cls, task):
         cls.cache.append(task)
+        cls.event.set()
+
+    @classmethod
+    def push_front(cls, task):
+        cls.cache.appendleft(task)
+        cls.event.set()
 
     @classmethod
     def pop(cls):
         result = None
         try:
-            result = cls.cache.pop(0)
+            result = cls.cache.popleft()
         except IndexError:
             pass
         except Exception as e:
             LOG.exception(e)
         return result
 
+    @classmethod
+    def wait(cls, timeout):
+        """
+        block until a task is pushed or timeout
+        """
+        cls.event.wait(timeout)
+        cls.event.clear()
+
     @classmethod
     def empty(cls):
         return len(cls.cache) == 0
@@ -36,6 +53,10 @@ class TaskCache(object):
     def full(cls):
         return len(cls.cache) >= cls.max_size
 
+    @classmethod
+    def free(cls):
+        return max(0, cls.max_size - len(cls.cache))
+
     @classmethod
     def size(cls):
-        return len(cls.cache)
\ No newline at end of file
+        return len(cls.cache)
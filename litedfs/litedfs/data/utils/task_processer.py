@@ -7,7 +7,7 @@ from threading import Thread
 
 from litedfs.data.utils.task_cache import TaskCache
 from litedfs.data.utils.registrant import Registrant
-from litedfs.data.utils.common import delete_file, delete_block
+from litedfs.data.utils.common import delete_file, delete_block, delete_blocks
 from litedfs.data.config import CONFIG
 
 LOG = logging.getLogger(__name__)
@@ -47,17 +47,19 @@ class TaskProcesser(StoppableThread):
                             task = TaskCache.pop()
                             if task is not None:
                                 if task["command"] == "delete":
-                                    if "block" not in task:
-                                        delete_file(task["name"])
-                                    else:
+                                    if "blocks" in task:
+                                        delete_blocks(task["name"], task["blocks"])
+                                    elif "block" in task:
                                         delete_block(task["name"], task["block"])
+                                    else:
+                                        delete_file(task["name"])
                                 elif task["command"] == "replicate":
-                                    Registrant.instance().replicate_block(task["name"], task["block"], task["ids"])
+                                    Registrant.instance().replicate_block(task["name"], task["block"], task["ids"], task.get("bandwidth", 0))
                             else:
                                 time.sleep(0.5)
                             LOG.info("TaskProcesser(%03d) process task: %s", self.pid, task)
                         else:
-                            time.sleep(5)
+                            TaskCache.wait(5)
                     except Exception as e:
                         LOG.exception(e)
                 else:
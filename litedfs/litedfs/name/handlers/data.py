@@ -14,7 +14,8 @@ from tornado import gen
 from litedfs.name.handlers.base import BaseHandler, BaseSocketHandler, auth_check
 from litedfs.name.utils.fs_core import FileSystemTree, InvalidValueError, SameNameExistsError, TargetPathMustDirectoryError, TargetPathNotExistsError, SourcePathNotExistsError, FileNotExistsError, SameNameFileExistsError
 from litedfs.name.utils.listener import Connection
-from litedfs.name.utils.common import file_sha1sum, file_md5sum, Errors, splitall
+from litedfs.name.utils.placement import PlacementPolicy
+from litedfs.name.utils.common import file_sha1sum, file_md5sum, bytes_md5sum, Errors, splitall
 from litedfs.name.config import CONFIG
 
 LOG = logging.getLogger("__name__")
@@ -44,7 +45,8 @@ class GenerateFileBlockListHandler(BaseHandler):
                                     host_parts = urllib.parse.urlsplit("//" + self.request.host)
                                     data_node[0] = host_parts.hostname
                             if len(data_nodes) > 0:
-                                data_node_ids = list(data_nodes.keys())
+                                node_stats = Connection.get_node_stats()
+                                policy = PlacementPolicy.instance()
                                 blocks = []
                                 block_id = 0
                                 if replica < 1:
@@ -52,11 +54,11 @@ class GenerateFileBlockListHandler(BaseHandler):
                                 if replica > len(data_nodes):
                                     replica = len(data_nodes)
                                 while file_size > block_size:
-                                    blocks.append((block_id, block_size, random.sample(data_node_ids, replica)))
+                                    blocks.append((block_id, block_size, policy.choose(node_stats, replica)))
                                     file_size -= block_size
                                     block_id += 1
                                 if file_size > 0:
-                                    blocks.append((block_id, file_size, random.sample(data_node_ids, replica)))
+                                    blocks.append((block_id, file_size, policy.choose(node_stats, replica)))
                                 result["data_nodes"] = data_nodes
                                 result["blocks"] = blocks
                                 result["id"] = str(uuid4())
@@ -77,6 +79,148 @@ class GenerateFileBlockListHandler(BaseHandler):
         self.finish()
 
 
+class GeneratePackBlockHandler(BaseHandler):
+    @auth_check
+    @gen.coroutine
+    def get(self):
+        result = {"result": Errors.OK}
+        try:
+            pack_size = int(self.get_argument("size", "0"))
+            replica = int(self.get_argument("replica", "1"))
+            if pack_size >= 0 and pack_size <= CONFIG["block_size"]:
+                fs = FileSystemTree.instance()
+                if fs:
+                    data_nodes = Connection.get_node_infos(without_full_node = True)
+                    for i in data_nodes:
+                        data_node = data_nodes[i]
+                        if data_node[0] == "127.0.0.1":
+                            host_parts = urllib.parse.urlsplit("//" + self.request.host)
+                            data_node[0] = host_parts.hostname
+                    if len(data_nodes) > 0:
+                        if replica < 1:
+                            replica = 1
+                        if replica > len(data_nodes):
+                            replica = len(data_nodes)
+                        node_stats = Connection.get_node_stats()
+                        result["data_nodes"] = data_nodes
+                        result["blocks"] = [(0, pack_size, PlacementPolicy.instance().choose(node_stats, replica))]
+                        result["id"] = str(uuid4())
+                        result["pack_file_size"] = CONFIG.get("pack_file_size", 1048576)
+                    else:
+                        Errors.set_result_error("NoUsableDataNode", result)
+                else:
+                    Errors.set_result_error("ServiceNotReadyYet", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
+
+
+class PlacementHintsHandler(BaseHandler):
+    """
+    count replica chains chosen by the placement policy, for the client to cache,
+    a file smaller than block_size is then sent to the first node of a chain, which commits it to the name node
+    """
+    @auth_check
+    @gen.coroutine
+    def get(self):
+        result = {"result": Errors.OK}
+        try:
+            replica = int(self.get_argument("replica", "1"))
+            count = int(self.get_argument("count", "16"))
+            if count > 0 and count <= 1000:
+                data_nodes = Connection.get_node_infos(without_full_node = True)
+                for i in data_nodes:
+                    data_node = data_nodes[i]
+                    if data_node[0] == "127.0.0.1":
+                        host_parts = urllib.parse.urlsplit("//" + self.request.host)
+                        data_node[0] = host_parts.hostname
+                if len(data_nodes) > 0:
+                    if replica < 1:
+                        replica = 1
+                    if replica > len(data_nodes):
+                        replica = len(data_nodes)
+                    node_stats = Connection.get_node_stats()
+                    policy = PlacementPolicy.instance()
+                    result["data_nodes"] = data_nodes
+                    result["placements"] = [policy.choose(node_stats, replica) for _ in range(count)]
+                    result["block_size"] = CONFIG["block_size"]
+                else:
+                    Errors.set_result_error("NoUsableDataNode", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
+
+
+class CreatePackHandler(BaseHandler):
+    """
+    register a stored container and create the small files packed into it, like a batch of creates,
+    files: [{"path": ..., "offset": ..., "size": ..., "checksum": ...}, ...], one result per file
+    """
+    @auth_check
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            self.json_data = json.loads(self.request.body.decode("utf-8"))
+            container_id = self.get_json_argument("id", "")
+            replica = int(self.get_json_argument("replica", "1"))
+            blocks = self.get_json_argument("blocks", [])
+            files = self.get_json_argument("files", [])
+            if container_id and len(blocks) == 1 and len(blocks[0]) == 4 and files and len(files) <= CONFIG.get("batch_max_operations", 1000):
+                fs = FileSystemTree.instance()
+                if fs:
+                    if container_id not in fs.files:
+                        now = int(time.time())
+                        fs.create_pack({
+                            "size": blocks[0][1],
+                            "id": container_id,
+                            "replica": replica,
+                            "current_replica": min(replica, len(blocks[0][2])),
+                            "blocks": blocks,
+                            "checksum": bytes_md5sum(blocks[0][3].encode("utf-8")),
+                            "ctime": now,
+                            "mtime": now,
+                        })
+                        operations = []
+                        for f in files:
+                            operations.append({
+                                "op": "create",
+                                "path": f.get("path", ""),
+                                "id": str(uuid4()),
+                                "size": f.get("size", 0),
+                                "checksum": f.get("checksum", ""),
+                                "pack": [container_id, f.get("offset", -1)],
+                            })
+                        locks = []
+                        results = fs.batch(operations, locks)
+                        success = yield fs.sync()
+                        for file_path in locks:
+                            fs.unset_file_lock(file_path)
+                        if success:
+                            result["results"] = results
+                        else:
+                            Errors.set_result_error("OperationFailed", result)
+                    else:
+                        Errors.set_result_error("SameNameExists", result)
+                else:
+                    Errors.set_result_error("ServiceNotReadyYet", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
+
+
 class ListFileLockHandler(BaseHandler):
     @gen.coroutine
     def get(self):
@@ -155,6 +299,8 @@ class CreateFileHandler(BaseHandler):
                                 "mtime": now,
                             }
                         )
+                        if success:
+                            success = yield fs.sync()
                         if success:
                             fs.unset_file_lock(file_path)
                         else:
@@ -178,6 +324,49 @@ class CreateFileHandler(BaseHandler):
         self.finish()
 
 
+class CreateInlineFileHandler(BaseHandler):
+    """
+    create a tiny file with one request, the base64 content is kept in the name node's file info,
+    only when it is not bigger than inline_file_size
+    """
+    @auth_check
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            self.json_data = json.loads(self.request.body.decode("utf-8"))
+            file_path = self.get_json_argument("path", "")
+            replica = int(self.get_json_argument("replica", "1"))
+            content = self.get_json_argument("content", None)
+            if file_path and replica and content is not None:
+                fs = FileSystemTree.instance()
+                if fs:
+                    if not fs.exists(file_path):
+                        locks = []
+                        try:
+                            r = fs.batch([{"op": "create", "path": file_path, "id": str(uuid4()), "replica": replica, "inline": content}], locks)[0]
+                            if r["result"] == Errors.OK:
+                                success = yield fs.sync()
+                                if not success:
+                                    Errors.set_result_error("OperationFailed", result)
+                            else:
+                                result = r
+                        finally:
+                            for path in locks:
+                                fs.unset_file_lock(path)
+                    else:
+                        Errors.set_result_error("SameNameExists", result)
+                else:
+                    Errors.set_result_error("ServiceNotReadyYet", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
+
+
 class MoveFileDirectoryHandler(BaseHandler):
     @auth_check
     @gen.coroutine
@@ -191,6 +380,8 @@ class MoveFileDirectoryHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = fs.move(source_path, target_path)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -232,6 +423,8 @@ class RenameFileDirectoryHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = fs.rename(file_path, new_name)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -269,6 +462,8 @@ class UpdateFileHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = yield fs.update_replica(file_path, replica)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -299,6 +494,8 @@ class DeleteFileHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = fs.delete(file_path)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -327,6 +524,8 @@ class CreateDirectoryHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = fs.makedirs(dir_path)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -357,6 +556,8 @@ class DeleteDirectoryHandler(BaseHandler):
                 fs = FileSystemTree.instance()
                 if fs:
                     success = fs.delete(dir_path)
+                    if success:
+                        success = yield fs.sync()
                     if not success:
                         Errors.set_result_error("OperationFailed", result)
                 else:
@@ -384,14 +585,16 @@ class ListDirectoryHandler(BaseHandler):
             include_directory = True if self.get_argument("include_directory", "true") == "true" else False
             offset = int(self.get_argument("offset", 0))
             limit = int(self.get_argument("limit", 0))
+            start_after = self.get_argument("start_after", "")
             if dir_path:
                 fs = FileSystemTree.instance()
                 if fs:
-                    r = fs.list_dir(dir_path, offset = offset, limit = limit, recursive = False, include_file = include_file, include_directory = include_directory)
+                    r = fs.list_dir(dir_path, offset = offset, limit = limit, recursive = False, include_file = include_file, include_directory = include_directory, start_after = start_after)
                     result["children"] = r["files"]
                     result["offset"] = r["offset"]
                     result["limit"] = r["limit"]
                     result["total"] = r["total"]
+                    result["next_start_after"] = r["next_start_after"]
                 else:
                     Errors.set_result_error("ServiceNotReadyYet", result)
             else:
@@ -428,6 +631,8 @@ class GetFileBlockInfoHandler(BaseHandler):
                             result["file_info"] = file_info
                             result["data_nodes"] = data_nodes
                             result["block_size"] = CONFIG["block_size"]
+                            if "pack" in file_info:
+                                result["pack"] = fs.pack_map.locate(file_info["pack"])
                         else:
                             Errors.set_result_error("FileNotExists", result)
                     else:
@@ -501,6 +706,35 @@ class IsDirectoryHandler(BaseHandler):
         self.finish()
 
 
+class DirectorySummaryHandler(BaseHandler):
+    @auth_check
+    @gen.coroutine
+    def get(self):
+        result = {"result": Errors.OK}
+        try:
+            dir_path = self.get_argument("path", "")
+            if dir_path:
+                fs = FileSystemTree.instance()
+                if fs:
+                    summary = fs.summary(dir_path)
+                    if summary:
+                        result["summary"] = summary
+                    else:
+                        Errors.set_result_error("PathNotExists", result)
+                else:
+                    Errors.set_result_error("ServiceNotReadyYet", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except InvalidValueError as e:
+            LOG.error(e)
+            Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
+
+
 class PathInfoHandler(BaseHandler):
     @auth_check
     @gen.coroutine
@@ -529,3 +763,34 @@ class PathInfoHandler(BaseHandler):
             Errors.set_result_error("ServerException", result)
         self.write(result)
         self.finish()
+
+
+class BatchHandler(BaseHandler):
+    @auth_check
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            self.json_data = json.loads(self.request.body.decode("utf-8"))
+            operations = self.get_json_argument("operations", [])
+            if operations and isinstance(operations, list) and len(operations) <= CONFIG.get("batch_max_operations", 1000):
+                fs = FileSystemTree.instance()
+                if fs:
+                    locks = []
+                    results = fs.batch(operations, locks)
+                    success = yield fs.sync()
+                    for file_path in locks: # only the locks this batch took
+                        fs.unset_file_lock(file_path)
+                    if success:
+                        result["results"] = results
+                    else:
+                        Errors.set_result_error("OperationFailed", result)
+                else:
+                    Errors.set_result_error("ServiceNotReadyYet", result)
+            else:
+                Errors.set_result_error("InvalidParameters", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(result)
+        self.finish()
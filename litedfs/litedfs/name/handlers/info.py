@@ -10,6 +10,8 @@ from tornado import gen
 from litedfs.name.handlers.base import BaseHandler, BaseSocketHandler, auth_check
 from litedfs.name.models.data_nodes import DataNodes
 from litedfs.name.utils.listener import Connection
+from litedfs.name.utils.block_map import BlockMap
+from litedfs.name.utils.fs_core import FileSystemTree
 from litedfs.name.utils.common import Errors, list_sort
 from litedfs.version import __version__
 from litedfs.name.config import CONFIG
@@ -51,9 +53,55 @@ class ClusterInfoHandler(BaseHandler):
                     info["offline_nodes"].append(node["info"])
                     info["number_of_offline_nodes"] += 1
             info["offline_nodes"] = list_sort(info["offline_nodes"], "id")
+            info["number_of_under_replicated_blocks"] = len(BlockMap.instance().under_replicated) if BlockMap.instance() else 0
             result["info"] = info
         except Exception as e:
             LOG.exception(e)
             Errors.set_result_error("ServerException", result)
         self.write(json.dumps(result, sort_keys = True))
         self.finish()
+
+
+class ClusterBalanceHandler(BaseHandler):
+    @auth_check
+    @gen.coroutine
+    def get(self):
+        result = {"result": Errors.OK}
+        try:
+            fs = FileSystemTree.instance()
+            if fs:
+                result["balancer"] = fs.balancer.status()
+            else:
+                Errors.set_result_error("ServiceNotReadyYet", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(json.dumps(result, sort_keys = True))
+        self.finish()
+
+    @auth_check
+    @gen.coroutine
+    def post(self):
+        result = {"result": Errors.OK}
+        try:
+            self.json_data = json.loads(self.request.body.decode("utf-8"))
+            command = self.get_json_argument("command", "")
+            threshold = self.get_json_argument("threshold", None)
+            bandwidth = self.get_json_argument("bandwidth", None)
+            fs = FileSystemTree.instance()
+            if fs:
+                if command == "start":
+                    fs.balancer.start(threshold = threshold, bandwidth = bandwidth)
+                    result["balancer"] = fs.balancer.status()
+                elif command == "stop":
+                    fs.balancer.stop()
+                    result["balancer"] = fs.balancer.status()
+                else:
+                    Errors.set_result_error("InvalidParameters", result)
+            else:
+                Errors.set_result_error("ServiceNotReadyYet", result)
+        except Exception as e:
+            LOG.exception(e)
+            Errors.set_result_error("ServerException", result)
+        self.write(json.dumps(result, sort_keys = True))
+        self.finish()
@@ -4,8 +4,11 @@ import os
 import logging
 import argparse
 
+from tornado import gen, ioloop
+
 from litedfs.version import __version__
-from litedfs.name.utils.fs_core import F, C
+from litedfs.name.utils.fs_core import FileSystemTree, F, C
+from litedfs.name.utils.fs_image import FsImage
 from litedfs.name.utils.append_log import AppendLogJson
 from litedfs.name.config import CONFIG, load_config
 from litedfs.name import logger
@@ -13,6 +16,24 @@ from litedfs.name import logger
 LOG = logging.getLogger(__name__)
 
 
+@gen.coroutine
+def convert_fsimage(fsimage_path, new_fsimage_path):
+    """
+    replay an old json lines fsimage and write it out in the binary fsimage format
+    """
+    fs = FileSystemTree()
+    fsimage = AppendLogJson(fsimage_path)
+    for line in fsimage.iterlines():
+        if line[F.cmd] == C.create:
+            fs.create(line[F.path], line[F.info], recover = True)
+        elif line[F.cmd] in (C.makedir, C.makedirs):
+            directory = fs.makedirs(line[F.path], recover = True)
+            if F.info in line and directory.type == F.dir:
+                directory.info = line[F.info]
+    fsimage.close()
+    yield fs.write_fsimage(new_fsimage_path)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog = 'migrate_fsimage.py')
     parser.add_argument("-c", "--config", required = True, help = "configuration file path")
@@ -33,14 +54,13 @@ if __name__ == "__main__":
 
             LOG.info("migrate start")
             
-            fsimage_new = AppendLogJson(os.path.join(CONFIG["data_path"], "fsimage.new"))
-            fsimage = AppendLogJson(os.path.join(CONFIG["data_path"], "fsimage"))
-            for line in fsimage.iterlines():
-                if line[F.cmd] == C.makedir:
-                    line[F.cmd] = C.makedirs
-                fsimage_new.writeline(line)
-            fsimage_new.close()
-            fsimage.close()
+            fsimage_path = os.path.join(CONFIG["data_path"], "fsimage")
+            if os.path.exists(fsimage_path) and not FsImage.is_fsimage(fsimage_path):
+                ioloop.IOLoop.current().run_sync(
+                    lambda: convert_fsimage(fsimage_path, os.path.join(CONFIG["data_path"], "fsimage.new"))
+                )
+            else:
+                LOG.info("fsimage is already in binary format or not exists, skip it")
 
             editlog_new = AppendLogJson(os.path.join(CONFIG["data_path"], "editlog.new"))
             editlog = AppendLogJson(os.path.join(CONFIG["data_path"], "editlog"))
@@ -31,8 +31,10 @@ class Application(tornado.web.Application):
         handlers = [
             (r"/", info.AboutHandler),
             (r"/cluster/info", info.ClusterInfoHandler),
+            (r"/cluster/balance", info.ClusterBalanceHandler),
             (r"/file/block/list", data.GenerateFileBlockListHandler),
             (r"/file/create", data.CreateFileHandler),
+            (r"/file/inline/create", data.CreateInlineFileHandler),
             (r"/file/delete", data.DeleteFileHandler),
             (r"/file/move", data.MoveFileDirectoryHandler),
             (r"/file/rename", data.RenameFileDirectoryHandler),
@@ -40,12 +42,17 @@ class Application(tornado.web.Application):
             (r"/file/lock/list", data.ListFileLockHandler),
             (r"/file/lock/update", data.UpdateFileLockHandler),
             (r"/file/block/info", data.GetFileBlockInfoHandler),
+            (r"/pack/block", data.GeneratePackBlockHandler),
+            (r"/pack/create", data.CreatePackHandler),
+            (r"/placement/hints", data.PlacementHintsHandler),
             (r"/directory/create", data.CreateDirectoryHandler),
             (r"/directory/list", data.ListDirectoryHandler),
+            (r"/directory/summary", data.DirectorySummaryHandler),
             (r"/directory/delete", data.DeleteDirectoryHandler),
             (r"/directory/move", data.MoveFileDirectoryHandler),
             (r"/directory/rename", data.RenameFileDirectoryHandler),
             (r"/path/info", data.PathInfoHandler),
+            (r"/batch", data.BatchHandler),
         ]
         settings = dict(debug = False)
         tornado.web.Application.__init__(self, handlers, **settings)
@@ -3,6 +3,10 @@
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado import gen, ioloop
+from tornado.concurrent import Future
 
 from litedfs.name.config import CONFIG
 
@@ -52,6 +56,11 @@ class AppendLog(object):
     def lines(self):
         return len(self.lines_pos)
 
+    def sync(self):
+        future = Future()
+        future.set_result(True)
+        return future
+
     def readline(self, line = 1):
         result = False
         try:
@@ -112,3 +121,94 @@ class AppendLogJson(AppendLog):
         except Exception as e:
             LOG.exception(e)
         return result
+
+
+class EditLog(AppendLogJson):
+    """
+    group commit editlog, writeline only queues the line, the lines queued while the previous batch
+    is being written go out together with one write, flushed or fsynced according to durability:
+    "none", "flush" or "fsync", the write happens in a thread so the ioloop keeps serving,
+    wait for sync() before acknowledging a mutation
+    """
+    def __init__(self, log_path, durability = "flush"):
+        AppendLogJson.__init__(self, log_path)
+        self.durability = durability
+        self.pending = []
+        self.pending_waiters = []
+        self.committing_waiters = []
+        self.committing = False
+        self.executor = ThreadPoolExecutor(max_workers = 1)
+
+    def writeline(self, data = {}):
+        result = False
+        try:
+            self.pending.append(json.dumps(data, separators = (",", ":")) + "\n")
+            if not self.committing:
+                self.committing = True
+                ioloop.IOLoop.current().add_callback(self.commit)
+            result = True
+        except Exception as e:
+            LOG.exception(e)
+        return result
+
+    def sync(self):
+        future = Future()
+        if self.pending:
+            self.pending_waiters.append(future)
+        elif self.committing:
+            self.committing_waiters.append(future)
+        else:
+            future.set_result(True)
+        return future
+
+    @gen.coroutine
+    def commit(self):
+        while self.pending and self.log_file:
+            lines = "".join(self.pending)
+            self.pending = []
+            self.committing_waiters, self.pending_waiters = self.pending_waiters, []
+            result = False
+            try:
+                result = yield ioloop.IOLoop.current().run_in_executor(self.executor, self.write_batch, lines)
+            except Exception as e:
+                LOG.exception(e)
+            self.resolve(self.committing_waiters, result)
+            self.committing_waiters = []
+        self.committing = False
+
+    def write_batch(self, lines):
+        self.log_file.write(lines)
+        if self.durability in ("flush", "fsync"):
+            self.log_file.flush()
+        if self.durability == "fsync":
+            os.fsync(self.log_file.fileno())
+        return True
+
+    def resolve(self, waiters, result):
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def close(self):
+        try:
+            if self.log_file:
+                # wait for the batch in flight, then write out what is still queued
+                self.executor.shutdown(wait = True)
+                result = False
+                try:
+                    self.write_batch("".join(self.pending))
+                    self.log_file.flush()
+                    if self.durability == "fsync":
+                        os.fsync(self.log_file.fileno())
+                    result = True
+                except Exception as e:
+                    LOG.exception(e)
+                self.pending = []
+                self.log_file.close()
+                self.log_file = None
+                self.resolve(self.committing_waiters, True)
+                self.resolve(self.pending_waiters, result)
+                self.committing_waiters = []
+                self.pending_waiters = []
+        except Exception as e:
+            LOG.exception(e)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from tornado import ioloop
+
+from litedfs.name.utils.listener import Connection
+from litedfs.name.utils.placement import PlacementPolicy
+from litedfs.name.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class Balancer(object):
+    """
+    moves blocks from the data nodes used above the cluster's average to the ones used below it,
+    until every node is within threshold (a fraction, 0.1 = 10%) of the average,
+    a move copies the block with a replicate task, once the target's block report shows it
+    the placement goes to the editlog and the source's copy is deleted,
+    at most balance_streams moves run at a time, the source data node sends each of them at bandwidth / balance_streams
+    bytes per second, so the moves together never go over bandwidth, the balancer stops by itself when the cluster is balanced
+    """
+    _instance = None
+    name = "balancer"
+
+    def __new__(cls, fs, interval = 10):
+        if not cls._instance:
+            cls._instance = object.__new__(cls)
+            cls._instance.fs = fs
+            cls._instance.interval = interval
+            cls._instance.running = False
+            cls._instance.threshold = 0.1
+            cls._instance.bandwidth = 10485760
+            cls._instance.moves = {} # (file_id, block_id) => [expire time, source node id, target node id, size]
+            cls._instance.moved_blocks = 0
+            cls._instance.moved_bytes = 0
+            cls._instance.idle_rounds = 0
+            cls._instance.ioloop_service()
+        return cls._instance
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def ioloop_service(self):
+        self.periodic_balance_service = ioloop.PeriodicCallback(
+            self.balance_service,
+            self.interval * 1000
+        )
+        self.periodic_balance_service.start()
+
+    def start(self, threshold = None, bandwidth = None):
+        self.threshold = threshold if threshold is not None else CONFIG.get("balance_threshold", 0.1)
+        self.bandwidth = bandwidth if bandwidth is not None else CONFIG.get("balance_bandwidth", 10485760)
+        self.moved_blocks = 0
+        self.moved_bytes = 0
+        self.idle_rounds = 0
+        self.running = True
+        LOG.info("balancer start, threshold: %s, bandwidth: %s", self.threshold, self.bandwidth)
+
+    def stop(self):
+        self.running = False
+        LOG.info("balancer stop, moved blocks: %s, moved bytes: %s", self.moved_blocks, self.moved_bytes)
+
+    def utilization(self, data_nodes):
+        """
+        node id => used / total, moves in flight already counted
+        """
+        used = {node_id: data_nodes[node_id]["used"] for node_id in data_nodes}
+        for _, source_node_id, target_node_id, size in self.moves.values():
+            if source_node_id in used:
+                used[source_node_id] -= size
+            if target_node_id in used:
+                used[target_node_id] += size
+        return {node_id: float(used[node_id]) / data_nodes[node_id]["total"] for node_id in data_nodes if data_nodes[node_id]["total"] > 0}
+
+    def status(self):
+        data_nodes = Connection.get_node_stats()
+        utilization = self.utilization(data_nodes)
+        return {
+            "running": self.running,
+            "threshold": self.threshold,
+            "bandwidth": self.bandwidth,
+            "moving_blocks": len(self.moves),
+            "moved_blocks": self.moved_blocks,
+            "moved_bytes": self.moved_bytes,
+            "utilization": {node_id: round(utilization[node_id], 4) for node_id in utilization},
+        }
+
+    def check_moves(self):
+        block_map = self.fs.block_map
+        now = time.time()
+        for key in list(self.moves.keys()):
+            expire_time, source_node_id, target_node_id, size = self.moves[key]
+            if target_node_id in block_map.replica_nodes(*key):
+                del self.moves[key]
+                if self.fs.move_block_node(key[0], key[1], source_node_id, target_node_id):
+                    Connection.push_task(source_node_id, {"command": "delete", "name": key[0], "blocks": [key[1]]})
+                    self.moved_blocks += 1
+                    self.moved_bytes += size
+                else: # the file is gone
+                    Connection.push_task(target_node_id, {"command": "delete", "name": key[0], "blocks": [key[1]]})
+            elif expire_time < now:
+                del self.moves[key]
+                LOG.warning("move block: %s from node: %s to node: %s timeout", key, source_node_id, target_node_id)
+
+    def block_size(self, file_id, block_id):
+        result = None
+        file_info = self.fs.files.get(file_id)
+        if file_info:
+            for block in file_info["blocks"]:
+                if block[0] == block_id:
+                    result = block[1]
+                    break
+        return result
+
+    def schedule(self):
+        """
+        plan moves from the most used nodes to the least used ones, return the bytes scheduled, None when balanced
+        """
+        block_map = self.fs.block_map
+        data_nodes = Connection.get_node_stats()
+        utilization = self.utilization(data_nodes)
+        if len(utilization) < 2:
+            return None
+        average = float(sum(data_nodes[node_id]["used"] for node_id in utilization)) / sum(data_nodes[node_id]["total"] for node_id in utilization)
+        over = [node_id for node_id in utilization if utilization[node_id] > average + self.threshold]
+        under = [node_id for node_id in utilization if utilization[node_id] < average - self.threshold]
+        if not over and not under:
+            return None
+        # the nodes out of the threshold pair with the ones on the other side of the average
+        if over:
+            sources = over
+            targets = [node_id for node_id in utilization if utilization[node_id] < average]
+        else:
+            sources = [node_id for node_id in utilization if utilization[node_id] > average]
+            targets = under
+        sources = sorted(sources, key = lambda node_id: -utilization[node_id])
+        targets = [node_id for node_id in targets if not data_nodes[node_id]["full"]]
+        # bytes a node can give away or take before it reaches the average
+        excess = {node_id: (utilization[node_id] - average) * data_nodes[node_id]["total"] for node_id in sources}
+        room = {node_id: (average - utilization[node_id]) * data_nodes[node_id]["total"] for node_id in targets}
+        max_moves = CONFIG.get("balance_streams", 4)
+        max_streams = CONFIG.get("replication_streams", 4)
+        streams = {}
+        for _, source_node_id, target_node_id, _ in self.moves.values():
+            streams[source_node_id] = streams.get(source_node_id, 0) + 1
+            streams[target_node_id] = streams.get(target_node_id, 0) + 1
+        policy = PlacementPolicy.instance()
+        result = 0
+        for source_node_id in sources:
+            for key in list(block_map.node_blocks.get(source_node_id, ())):
+                if len(self.moves) >= max_moves or streams.get(source_node_id, 0) >= max_streams or excess[source_node_id] <= 0:
+                    break
+                if key in self.moves or key in block_map.under_replicated or key in self.fs.replicator.pending:
+                    continue
+                size = self.block_size(*key)
+                if size is None:
+                    continue
+                replica_nodes = block_map.replica_nodes(*key)
+                nodes = {
+                    node_id: data_nodes[node_id] for node_id in data_nodes
+                    if node_id in replica_nodes or (node_id in room and room[node_id] >= size and streams.get(node_id, 0) < max_streams)
+                }
+                target_node_ids = policy.choose(nodes, 1, excludes = replica_nodes)
+                if target_node_ids:
+                    target_node_id = target_node_ids[0]
+                    task = {"command": "replicate", "name": key[0], "block": key[1], "ids": [target_node_id], "bandwidth": self.bandwidth // max_moves}
+                    Connection.push_urgent_task(source_node_id, task)
+                    self.moves[key] = [time.time() + CONFIG.get("replication_timeout", 600), source_node_id, target_node_id, size]
+                    streams[source_node_id] = streams.get(source_node_id, 0) + 1
+                    streams[target_node_id] = streams.get(target_node_id, 0) + 1
+                    excess[source_node_id] -= size
+                    room[target_node_id] -= size
+                    result += size
+        return result
+
+    def balance_service(self):
+        try:
+            if self.running and self.fs.status == "ready":
+                self.check_moves()
+                n = self.schedule()
+                if n is None and not self.moves:
+                    LOG.info("cluster is balanced")
+                    self.stop()
+                elif n == 0 and not self.moves:
+                    self.idle_rounds += 1
+                    if self.idle_rounds >= 5:
+                        LOG.warning("cluster is unbalanced, but no block can be moved")
+                        self.stop()
+                else:
+                    self.idle_rounds = 0
+                    if n:
+                        LOG.info("schedule block moves: %s bytes, moving blocks: %s, moved blocks: %s", n, len(self.moves), self.moved_blocks)
+        except Exception as e:
+            LOG.exception(e)
+
+    def close(self):
+        self.periodic_balance_service.stop()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class BlockMap(object):
+    """
+    where the blocks really are, built from the data nodes' block reports,
+    blocks: (file_id, block_id) => set of node ids, node_blocks: node id => set of (file_id, block_id),
+    keeps files' current_replica up to date and tracks the under replicated blocks
+    """
+    _instance = None
+    name = "block_map"
+
+    def __new__(cls, fs = None):
+        if not cls._instance:
+            cls._instance = object.__new__(cls)
+            cls._instance.fs = fs
+            cls._instance.blocks = {}
+            cls._instance.node_blocks = {}
+            cls._instance.full_reports = {}
+            cls._instance.under_replicated = {}
+        return cls._instance
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def add_replica(self, node_id, key):
+        if key not in self.blocks:
+            self.blocks[key] = set()
+        self.blocks[key].add(node_id)
+        if node_id not in self.node_blocks:
+            self.node_blocks[node_id] = set()
+        self.node_blocks[node_id].add(key)
+
+    def remove_replica(self, node_id, key):
+        if key in self.blocks:
+            self.blocks[key].discard(node_id)
+            if not self.blocks[key]:
+                del self.blocks[key]
+        if node_id in self.node_blocks:
+            self.node_blocks[node_id].discard(key)
+
+    def report(self, node_id, report):
+        file_ids = set()
+        if report["type"] == "full":
+            if report["first"] or node_id not in self.full_reports:
+                self.full_reports[node_id] = set()
+            reported = self.full_reports[node_id]
+            for file_id in report["blocks"]:
+                for block_id in report["blocks"][file_id]:
+                    reported.add((file_id, block_id))
+            if report["last"]:
+                del self.full_reports[node_id]
+                stored = self.node_blocks.get(node_id, set())
+                for key in stored - reported:
+                    self.remove_replica(node_id, key)
+                    file_ids.add(key[0])
+                for key in reported - stored:
+                    self.add_replica(node_id, key)
+                    file_ids.add(key[0])
+                LOG.info("full block report from node: %s, blocks: %s", node_id, len(reported))
+        elif report["type"] == "incremental":
+            for file_id in report["added"]:
+                for block_id in report["added"][file_id]:
+                    self.add_replica(node_id, (file_id, block_id))
+                file_ids.add(file_id)
+            for file_id in report["removed"]:
+                for block_id in report["removed"][file_id]:
+                    self.remove_replica(node_id, (file_id, block_id))
+                file_ids.add(file_id)
+            LOG.debug("incremental block report from node: %s, %s", node_id, report)
+        for file_id in file_ids:
+            self.refresh_file(file_id, force = True)
+
+    def remove_node(self, node_id):
+        """
+        the node is offline, its replicas don't count any more
+        """
+        self.full_reports.pop(node_id, None)
+        file_ids = set()
+        for key in list(self.node_blocks.get(node_id, ())):
+            self.remove_replica(node_id, key)
+            file_ids.add(key[0])
+        self.node_blocks.pop(node_id, None)
+        for file_id in file_ids:
+            self.refresh_file(file_id, force = True)
+        LOG.info("remove node: %s from block map, files affected: %s", node_id, len(file_ids))
+
+    def remove_file(self, file_info):
+        for block in file_info["blocks"]:
+            key = (file_info["id"], block[0])
+            for node_id in self.blocks.pop(key, ()):
+                if node_id in self.node_blocks:
+                    self.node_blocks[node_id].discard(key)
+            self.under_replicated.pop(key, None)
+
+    def refresh_file(self, file_id, force = False):
+        """
+        recount the file's live replicas, without force a file nothing was reported for yet is left alone
+        """
+        if self.fs and file_id in self.fs.files:
+            file_info = self.fs.files[file_id]
+            keys = [(file_id, block[0]) for block in file_info["blocks"]]
+            if force or any(key in self.blocks for key in keys):
+                replica = file_info["replica"]
+                current_replica = replica
+                for key in keys:
+                    live = len(self.blocks.get(key, ()))
+                    if live < replica:
+                        self.under_replicated[key] = live
+                    else:
+                        self.under_replicated.pop(key, None)
+                    if live < current_replica:
+                        current_replica = live
+                file_info["current_replica"] = current_replica
+
+    def replica_nodes(self, file_id, block_id):
+        return self.blocks.get((file_id, block_id), set())
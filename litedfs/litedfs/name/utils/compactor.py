@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import logging
+from uuid import uuid4
+
+from tornado import gen
+from tornado import ioloop
+from tornado.httpclient import AsyncHTTPClient
+
+from litedfs.name.utils.listener import Connection
+from litedfs.name.utils.placement import PlacementPolicy
+from litedfs.name.utils.common import bytes_md5sum
+from litedfs.name.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class Compactor(object):
+    """
+    gives back the space of deleted packed files, a container nothing lives in any more is deleted,
+    a container with less than pack_compact_ratio of it still used is rewritten: its block is read from a data node,
+    the live files are copied into a new container, pointed at it once it is stored, then the old one is deleted,
+    one container is rewritten at a time, a container is one block, so it fits in memory
+    """
+    _instance = None
+    name = "compactor"
+
+    def __new__(cls, fs, interval = 10):
+        if not cls._instance:
+            cls._instance = object.__new__(cls)
+            cls._instance.fs = fs
+            cls._instance.interval = interval
+            cls._instance.running = False
+            cls._instance.compacted_containers = 0
+            cls._instance.compacted_bytes = 0
+            cls._instance.ioloop_service()
+        return cls._instance
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def ioloop_service(self):
+        self.periodic_compact_service = ioloop.PeriodicCallback(
+            self.compact_service,
+            self.interval * 1000
+        )
+        self.periodic_compact_service.start()
+
+    @gen.coroutine
+    def read_container(self, container_id, block):
+        """
+        the container's block from one of its data nodes, None if no node can give it with the right md5
+        """
+        result = None
+        data_nodes = Connection.get_node_infos()
+        node_ids = [node_id for node_id in set(block[2]) | self.fs.block_map.replica_nodes(container_id, block[0]) if node_id in data_nodes]
+        for node_id in node_ids:
+            url = "http://%s:%s/block/download?name=%s&block=%s" % (data_nodes[node_id][0], data_nodes[node_id][1], container_id, block[0])
+            r = yield AsyncHTTPClient().fetch(url, request_timeout = 600, raise_error = False)
+            if r.code == 200 and bytes_md5sum(r.body) == block[3]:
+                result = r.body
+                break
+            LOG.warning("read container: %s from node: %s failed, response: %s", container_id, node_id, r)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def write_container(self, container_id, content, block_md5, replica):
+        """
+        store the content as the container's block, through the replica chain of the data nodes,
+        return the ids of the nodes holding it
+        """
+        result = []
+        node_stats = Connection.get_node_stats()
+        node_ids = PlacementPolicy.instance().choose(
+            {node_id: node_stats[node_id] for node_id in node_stats if not node_stats[node_id]["full"]},
+            min(replica, len(node_stats))
+        )
+        data_nodes = Connection.get_node_infos()
+        if node_ids and node_ids[0] in data_nodes:
+            boundary = uuid4().hex
+            body = b"".join([
+                b'--%s\r\n' % boundary.encode(),
+                b'Content-Disposition: form-data; name="up_file"; filename="up_file"\r\n',
+                b'Content-Type: application/octet-stream\r\n\r\n',
+                content,
+                b'\r\n--%s--\r\n' % boundary.encode(),
+            ])
+            url = "http://%s:%s/block/create?name=%s&block=0&ids=%s" % (
+                data_nodes[node_ids[0]][0], data_nodes[node_ids[0]][1], container_id, ",".join([str(node_id) for node_id in node_ids[1:]]))
+            r = yield AsyncHTTPClient().fetch(
+                url,
+                method = "POST",
+                headers = {"Content-Type": "multipart/form-data; boundary=%s" % boundary},
+                body = body,
+                request_timeout = 600,
+                raise_error = False
+            )
+            if r.code == 200:
+                data = json.loads(r.body.decode("utf-8"))
+                if data["result"] == "ok" and data["md5"] == block_md5:
+                    result.append(node_ids[0])
+                    for node_id in data.get("replicas", {}):
+                        if data["replicas"][node_id] == "ok":
+                            result.append(int(node_id))
+                else:
+                    LOG.error("write container: %s failed: %s", container_id, data)
+            else:
+                LOG.error("write container: %s to node: %s failed, response: %s", container_id, node_ids[0], r)
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def compact(self, container_id):
+        result = False
+        pack_map = self.fs.pack_map
+        container = self.fs.files[container_id]
+        block = container["blocks"][0]
+        content = yield self.read_container(container_id, block)
+        if content is not None:
+            # the files deleted while reading are dropped here, the ones deleted while writing by repack
+            parts = []
+            offsets = {}
+            size = 0
+            for file_id in list(pack_map.containers.get(container_id, ())):
+                file = self.fs.files.get(file_id)
+                if file is not None:
+                    offset = file["pack"][1]
+                    parts.append(content[offset:offset + file["size"]])
+                    offsets[file_id] = size
+                    size += file["size"]
+            content = b"".join(parts)
+            block_md5 = bytes_md5sum(content)
+            new_container_id = str(uuid4())
+            node_ids = yield self.write_container(new_container_id, content, block_md5, container["replica"])
+            if node_ids and container_id in pack_map.containers:
+                now = int(time.time())
+                self.fs.create_pack({
+                    "size": size,
+                    "id": new_container_id,
+                    "replica": container["replica"],
+                    "current_replica": min(len(node_ids), container["replica"]),
+                    "blocks": [[0, size, node_ids, block_md5]],
+                    "checksum": bytes_md5sum(block_md5.encode("utf-8")),
+                    "ctime": now,
+                    "mtime": now,
+                })
+                self.fs.repack(new_container_id, offsets)
+                # the files must point at the new container on disk before the old block goes away
+                success = yield self.fs.sync()
+                if success:
+                    self.fs.delete_pack(container_id)
+                    self.compacted_containers += 1
+                    self.compacted_bytes += container["size"] - size
+                    result = True
+                LOG.info("compact container: %s => %s, %s => %s bytes, files: %s", container_id, new_container_id, container["size"], size, len(offsets))
+        raise gen.Return(result)
+
+    @gen.coroutine
+    def compact_service(self):
+        if not self.running and self.fs.status == "ready":
+            self.running = True
+            try:
+                ratio = CONFIG.get("pack_compact_ratio", 0.5)
+                for container_id in self.fs.pack_map.sparse_containers(ratio):
+                    if not self.fs.pack_map.containers.get(container_id):
+                        self.fs.delete_pack(container_id)
+                        self.compacted_containers += 1
+                    else:
+                        yield self.compact(container_id)
+                        break
+                yield self.fs.sync()
+            except Exception as e:
+                LOG.exception(e)
+            self.running = False
+
+    def close(self):
+        self.periodic_compact_service.stop()
@@ -3,15 +3,29 @@
 import os
 import json
 import time
+import signal
 import random
 import logging
+import binascii
 from copy import deepcopy
+from base64 import b64decode
+from bisect import bisect_right
 
 from tornado import gen, ioloop
+from tornado.concurrent import Future
 
-from litedfs.name.utils.append_log import AppendLogJson
+from litedfs.name.utils.append_log import AppendLogJson, EditLog
+from litedfs.name.utils.fs_image import FsImage, FsImageReader, FsImageWriter
 from litedfs.name.utils.listener import Connection
-from litedfs.name.utils.common import file_sha1sum, file_md5sum, Errors, splitall
+from litedfs.name.utils.placement import PlacementPolicy
+from litedfs.name.utils.block_map import BlockMap
+from litedfs.name.utils.replicator import Replicator
+from litedfs.name.utils.balancer import Balancer
+from litedfs.name.utils.pack_map import PackMap
+from litedfs.name.utils.compactor import Compactor
+from litedfs.name.utils.path_index import PathIndex, SortedChildren, intern_name
+from litedfs.name.utils.namespace import Root, Directory, FileInfo
+from litedfs.name.utils.common import file_sha1sum, file_md5sum, bytes_md5sum, Errors, splitall
 from litedfs.name.config import CONFIG
 
 LOG = logging.getLogger(__name__)
@@ -30,6 +44,10 @@ class F(object):
     target_path = "t"
     id = "id"
     replica = "r"
+    block = "b"
+    nodes = "ns"
+    source_node = "sn"
+    target_node = "tn"
 
 
 class C(object):
@@ -43,6 +61,11 @@ class C(object):
     update_replica = "ur"
     update_file_info = "ufi"
     update_parent_dirs = "upd"
+    add_block_nodes = "abn"
+    move_block_node = "mbn"
+    create_pack = "cpk"
+    delete_pack = "dpk"
+    repack = "rpk"
 
 
 class InvalidValueError(Exception):
@@ -97,12 +120,23 @@ class FileSystemTree(object):
     def __new__(cls, interval = 10):
         if not cls._instance:
             cls._instance = object.__new__(cls)
-            cls._instance.tree = {F.children: {}, F.type: "root"}
+            cls._instance.tree = Root()
             cls._instance.files = {}
+            cls._instance.path_index = PathIndex(cls._instance.tree)
+            cls._instance.sorted_children = SortedChildren()
             cls._instance.editlog = None
             cls._instance.status = "booting"
             cls._instance.locks = {}
             cls._instance.interval = interval
+            cls._instance.segment = 0
+            cls._instance.checkpoint_pid = None
+            cls._instance.checkpoint_segment = 0
+            cls._instance.checkpoint_time = time.time()
+            cls._instance.block_map = BlockMap(cls._instance)
+            cls._instance.replicator = Replicator(cls._instance, interval)
+            cls._instance.balancer = Balancer(cls._instance, interval)
+            cls._instance.pack_map = PackMap(cls._instance)
+            cls._instance.compactor = Compactor(cls._instance, interval)
             cls._instance.ioloop_service()
         return cls._instance
 
@@ -119,6 +153,14 @@ class FileSystemTree(object):
             self.interval * 1000
         )
         self.periodic_lock_service.start()
+        if hasattr(os, "fork"):
+            self.periodic_checkpoint_service = ioloop.PeriodicCallback(
+                self.checkpoint_service,
+                self.interval * 1000
+            )
+            self.periodic_checkpoint_service.start()
+        else:
+            LOG.warning("os.fork not available, background checkpoint disabled")
 
     @gen.coroutine
     def recover(self):
@@ -129,8 +171,11 @@ class FileSystemTree(object):
             if success:
                 success = yield self.dump_fsimage()
                 if success:
-                    self.editlog = AppendLogJson(os.path.join(CONFIG["data_path"], "editlog"))
-                    # TODO: synchronize between name node and data nodes
+                    self.editlog = EditLog(os.path.join(CONFIG["data_path"], "editlog"), CONFIG.get("editlog_durability", "flush"))
+                    self.checkpoint_time = time.time()
+                    # block reports received while recovering
+                    for file_id in set(key[0] for key in self.block_map.blocks):
+                        self.block_map.refresh_file(file_id)
                     self.status = "ready"
                 else:
                     raise RecoverFailedError("dump fsimage failed")
@@ -139,6 +184,16 @@ class FileSystemTree(object):
         else:
             raise RecoverFailedError("load fsimage failed")
 
+    def sync(self):
+        """
+        future resolved with True once the editlog lines of the mutations done so far are durable
+        """
+        if self.editlog:
+            return self.editlog.sync()
+        future = Future()
+        future.set_result(True)
+        return future
+
     def set_file_lock(self, file_path, ttl = 60):
         result = False
         if file_path not in self.locks:
@@ -181,13 +236,23 @@ class FileSystemTree(object):
         parent = self.makedirs(dir_path)
         if parent:
             file_id = file_info["id"]
-            if file_name in parent[F.children]:
+            if file_name in parent.children:
                 raise SameNameExistsError("same file name exists: %s" % file_name)
             elif file_name == "":
                 raise InvalidValueError("file name can't be empty string: %s" % file_name)
             else:
-                parent[F.children][file_name] = {F.type: F.file, F.id: file_id}
-                self.files[file_id] = file_info
+                child = self.files.get(file_id)
+                if child is None:
+                    child = FileInfo(file_info)
+                    self.files[file_id] = child
+                else:
+                    self.pack_map.remove_file(child)
+                    child.load(file_info)
+                parent.children[intern_name(file_name)] = child
+                self.sorted_children.add(parent, file_name, child)
+                self.add_totals(dir_path, child.totals())
+                self.block_map.refresh_file(file_id)
+                self.pack_map.add_file(child)
                 if self.editlog:
                     self.editlog.writeline({F.cmd: C.create, F.path: file_path, F.info: file_info})
                 if not recover:
@@ -200,16 +265,21 @@ class FileSystemTree(object):
         dir_path, name = os.path.split(file_path)
         exists, file_type, file, parent = self.get_info(file_path)
         if exists:
-            del parent[F.children][name]
-            if file[F.type] == F.file:
-                file_id = file[F.id]
+            if file.type == F.dir:
+                self.path_index.remove(file_path)
+                self.sorted_children.remove_tree(file)
+            del parent.children[name]
+            self.sorted_children.remove(parent, name, file)
+            self.add_totals(dir_path, file.totals(), -1)
+            if file.type == F.file:
+                file_id = file.id
+                self.push_delete_tasks(self.files[file_id])
+                self.block_map.remove_file(self.files[file_id])
+                self.pack_map.remove_file(self.files[file_id])
                 del self.files[file_id]
-                task = {"command": "delete", "name": file_id}
-                for i in Connection.id_decompress:
-                    Connection.push_task(i, task)
                 if not recover:
                     self.update_parent_dirs(dir_path)
-            elif file[F.type] == F.dir:
+            elif file.type == F.dir:
                 self.delete_files(file)
                 if not recover:
                     self.update_parent_dirs(dir_path)
@@ -219,26 +289,40 @@ class FileSystemTree(object):
 
     @gen.coroutine
     def delete_files(self, file):
-        if F.children in file and file[F.children]:
-            for name in file[F.children]:
-                child = file[F.children][name]
+        if file.type == F.dir:
+            for name in file.children:
+                child = file.children[name]
                 yield self.delete_files(child)
         else:
-            if file[F.type] == F.file:
-                file_id = file[F.id]
+            if file.type == F.file:
+                file_id = file.id
+                self.push_delete_tasks(self.files[file_id])
+                self.block_map.remove_file(self.files[file_id])
+                self.pack_map.remove_file(self.files[file_id])
                 del self.files[file_id]
-                task = {"command": "delete", "name": file_id}
-                for i in Connection.id_decompress:
-                    Connection.push_task(i, task)
                 LOG.debug("delete file: %s", file)
                 yield gen.moment
 
+    def push_delete_tasks(self, file_info):
+        """
+        only the nodes holding replicas get a delete task, with the exact blocks they hold,
+        the replicas known from the block reports but not recorded in the blocks get one too
+        """
+        node_blocks = {}
+        for block in file_info["blocks"]:
+            for node_id in set(block[2]) | self.block_map.replica_nodes(file_info["id"], block[0]):
+                if node_id not in node_blocks:
+                    node_blocks[node_id] = []
+                node_blocks[node_id].append(block[0])
+        for node_id in node_blocks:
+            Connection.push_task(node_id, {"command": "delete", "name": file_info["id"], "blocks": node_blocks[node_id]})
+
     def get_file_info(self, file_path):
         result = False
         exists, file_type, file, _ = self.get_info(file_path)
         if exists:
-            file_id = file[F.id]
-            result = self.files[file_id]
+            file_id = file.id
+            result = self.files[file_id].to_dict()
         return result
 
     def rename(self, file_path, new_name, recover = False):
@@ -247,21 +331,25 @@ class FileSystemTree(object):
             dir_path, name = os.path.split(file_path)
             exists, file_type, file, parent = self.get_info(file_path)
             if exists:
-                if new_name not in parent[F.children]:
+                if new_name not in parent.children:
                     now = int(time.time())
-                    parent[F.children][new_name] = file
-                    del parent[F.children][name]
+                    if file_type == F.dir:
+                        self.path_index.remove(file_path)
+                    parent.children[intern_name(new_name)] = file
+                    del parent.children[name]
+                    self.sorted_children.remove(parent, name, file)
+                    self.sorted_children.add(parent, new_name, file)
                     if self.editlog:
                         self.editlog.writeline({F.cmd: C.rename, F.path: file_path, F.new_name: new_name})
                     if file_type == F.file:
-                        file_id = file[F.id]
+                        file_id = file.id
                         file_info = self.files[file_id]
                         file_info["mtime"] = now
                         self.update_file_info(os.path.join(dir_path, new_name), file_info, recover = recover)
                     elif file_type == F.dir:
-                        file[F.info]["mtime"] = now
+                        file.info["mtime"] = now
                         if not recover:
-                            self.update_parent_dirs(os.path.join(dir_path, new_name), file[F.info])
+                            self.update_parent_dirs(os.path.join(dir_path, new_name), file.info)
                 else:
                     raise SameNameExistsError("same file name exists: %s" % new_name)
             else:
@@ -276,10 +364,17 @@ class FileSystemTree(object):
         exists, file_type, file, parent = self.get_info(file_path)
         if exists:
             if file_type == F.file:
-                file_id = file[F.id]
-                self.files[file_id] = file_info
+                file_id = file.id
+                if file_info is not self.files[file_id]:
+                    size, _, _, block_count = self.files[file_id].totals()
+                    self.pack_map.remove_file(self.files[file_id])
+                    self.files[file_id].load(file_info)
+                    self.pack_map.add_file(self.files[file_id])
+                    new_size, _, _, new_block_count = self.files[file_id].totals()
+                    if new_size != size or new_block_count != block_count:
+                        self.add_totals(dir_path, (new_size - size, 0, 0, new_block_count - block_count))
                 if self.editlog:
-                    self.editlog.writeline({F.cmd: C.update_file_info, F.path: file_path, F.info: file_info})
+                    self.editlog.writeline({F.cmd: C.update_file_info, F.path: file_path, F.info: self.files[file_id].to_dict()})
                 if not recover:
                     self.update_parent_dirs(dir_path, file_info)
                 result = True
@@ -289,23 +384,108 @@ class FileSystemTree(object):
             raise FileNotExistsError("file not exists: %s" % file_path)
         return result
 
+    def add_block_nodes(self, file_id, block_id, node_ids):
+        """
+        record the nodes a block was re-replicated to, by file id, the block's path isn't known here
+        """
+        result = False
+        if file_id in self.files:
+            blocks = self.files[file_id]["blocks"]
+            for block in blocks:
+                if block[0] == block_id:
+                    for node_id in node_ids:
+                        if node_id not in block[2]:
+                            block[2].append(node_id)
+                    self.files[file_id]["blocks"] = blocks
+                    result = True
+                    break
+            if result and self.editlog:
+                self.editlog.writeline({F.cmd: C.add_block_nodes, F.id: file_id, F.block: block_id, F.nodes: node_ids})
+        return result
+
+    def move_block_node(self, file_id, block_id, source_node_id, target_node_id):
+        """
+        the block was copied to the target node by the balancer, the source's copy goes away
+        """
+        result = False
+        if file_id in self.files:
+            blocks = self.files[file_id]["blocks"]
+            for block in blocks:
+                if block[0] == block_id:
+                    block[2] = [node_id for node_id in block[2] if node_id != source_node_id]
+                    if target_node_id not in block[2]:
+                        block[2].append(target_node_id)
+                    self.files[file_id]["blocks"] = blocks
+                    result = True
+                    break
+            if result and self.editlog:
+                self.editlog.writeline({F.cmd: C.move_block_node, F.id: file_id, F.block: block_id, F.source_node: source_node_id, F.target_node: target_node_id})
+        return result
+
+    def create_pack(self, container_info):
+        """
+        register a container of packed small files, a one block file without a path
+        """
+        container = FileInfo(container_info)
+        self.files[container.id] = container
+        self.pack_map.add_container(container.id)
+        self.block_map.refresh_file(container.id)
+        if self.editlog:
+            self.editlog.writeline({F.cmd: C.create_pack, F.info: container_info})
+        return True
+
+    def delete_pack(self, container_id):
+        """
+        drop a container no packed file is in any more, its block is deleted from the data nodes
+        """
+        result = False
+        if container_id in self.pack_map.containers and not self.pack_map.containers[container_id]:
+            container = self.files.pop(container_id, None)
+            if container is not None:
+                self.push_delete_tasks(container)
+                self.block_map.remove_file(container)
+            self.pack_map.remove_container(container_id)
+            if self.editlog:
+                self.editlog.writeline({F.cmd: C.delete_pack, F.id: container_id})
+            result = True
+        return result
+
+    def repack(self, container_id, offsets):
+        """
+        point packed files to their offsets in another container, offsets: file id => offset,
+        the files deleted meanwhile are skipped
+        """
+        moved = {}
+        for file_id in offsets:
+            file = self.files.get(file_id)
+            if file is not None and "pack" in file:
+                self.pack_map.remove_file(file)
+                file["pack"] = [container_id, offsets[file_id]]
+                self.pack_map.add_file(file)
+                moved[file_id] = offsets[file_id]
+        if self.editlog:
+            self.editlog.writeline({F.cmd: C.repack, F.id: container_id, F.info: moved})
+        return moved
+
     @gen.coroutine
-    def update_replica(self, file_path, replica):
+    def update_replica(self, file_path, replica, recover = False):
         result = False
         exists, file_type, file, parent = self.get_info(file_path)
         if exists:
             now = int(time.time())
             if file_type == F.file:
-                file_id = file[F.id]
+                file_id = file.id
                 file_info = self.files[file_id]
                 file_info["replica"] = replica
                 data_nodes = Connection.get_node_infos()
                 data_node_ids = list(data_nodes.keys())
+                node_stats = Connection.get_node_stats()
                 if (
                         (file_info["replica"] > file_info["current_replica"] and len(data_nodes) >= file_info["current_replica"]) or
                         (file_info["replica"] < file_info["current_replica"] and len(data_nodes) >= file_info["replica"])
                     ):
-                    for block in file_info["blocks"]:
+                    blocks = file_info["blocks"]
+                    for block in blocks:
                         old_node_ids = []
                         new_node_ids = []
                         for node_id in data_node_ids:
@@ -320,14 +500,11 @@ class FileSystemTree(object):
                             block[2].extend(old_node_ids)
                             if delta > 0: # increase block replica
                                 if new_node_ids:
-                                    if len(new_node_ids) <= delta:
-                                        block[2].extend(new_node_ids)
-                                    else:
-                                        new_node_ids = random.sample(new_node_ids, delta)
-                                        block[2].extend(new_node_ids)
+                                    new_node_ids = PlacementPolicy.instance().choose(node_stats, delta, excludes = old_node_ids)
+                                    block[2].extend(new_node_ids)
                                     source_node_id = random.choice(old_node_ids)
                                     task = {"command": "replicate", "name": file_id, "block": block[0], "ids": new_node_ids}
-                                    Connection.push_task(source_node_id, task)
+                                    Connection.push_urgent_task(source_node_id, task)
                                 else:
                                     LOG.warning("can not increase block replica, no usable data node")
                             elif delta < 0: # decrease block replica
@@ -339,15 +516,17 @@ class FileSystemTree(object):
                                         task = {"command": "delete", "name": file_id, "block": block[0]}
                                         Connection.push_task(delete_node_id, task)
                         yield gen.moment
+                    file_info["blocks"] = blocks
                     file_info["current_replica"] = replica
-                    for block in file_info["blocks"]:
+                    for block in blocks:
                         if len(block[2]) < file_info["current_replica"]:
                             file_info["current_replica"] = len(block[2])
+                    self.block_map.refresh_file(file_id)
                     if not recover:
                         file_info["mtime"] = now
                 result = True
                 if self.editlog:
-                    self.editlog.writeline({F.cmd: C.update_file_info, F.path: file_path, F.info: file_info})
+                    self.editlog.writeline({F.cmd: C.update_file_info, F.path: file_path, F.info: file_info.to_dict()})
             else:
                 raise InvalidValueError("must by file not directory: %s" % file_path)
         else:
@@ -368,9 +547,15 @@ class FileSystemTree(object):
             target_exists, target_type, target_file, _ = self.get_info(target_path)
             if target_exists:
                 if target_type in (F.dir, "root"):
-                    if name not in target_file[F.children]:
-                        target_file[F.children][name] = source_file
-                        del source_parent[F.children][name]
+                    if name not in target_file.children:
+                        if source_file.type == F.dir:
+                            self.path_index.remove(source_path)
+                        target_file.children[name] = source_file
+                        del source_parent.children[name]
+                        self.sorted_children.remove(source_parent, name, source_file)
+                        self.sorted_children.add(target_file, name, source_file)
+                        self.add_totals(os.path.split(source_path)[0], source_file.totals(), -1)
+                        self.add_totals(target_path, source_file.totals())
                         if self.editlog:
                             self.editlog.writeline({F.cmd: C.move, F.source_path: source_path, F.target_path: target_path})
                         result = True
@@ -392,8 +577,10 @@ class FileSystemTree(object):
             target_exists, target_type, target_file, _ = self.get_info(target_path)
             if target_exists:
                 if target_type == F.dir:
-                    if name not in target_file[F.children]:
-                        target_file[F.children][name] = source_file
+                    if name not in target_file.children:
+                        target_file.children[name] = source_file
+                        self.sorted_children.add(target_file, name, source_file)
+                        self.add_totals(target_path, source_file.totals())
                         if self.editlog:
                             self.editlog.writeline({F.cmd: C.copy, F.source_path: source_path, F.target_path: target_path})
                         result = True
@@ -407,31 +594,49 @@ class FileSystemTree(object):
             raise SourcePathNotExistsError("source path not exists: %s" % source_path)
         return result
 
-    def list_dir(self, directory_path, offset = 0, limit = 0, recursive = False, include_file = True, include_directory = True):
-        result = {"files": []}
+    def list_dir(self, directory_path, offset = 0, limit = 0, recursive = False, include_file = True, include_directory = True, start_after = ""):
+        """
+        directories first then files, both sorted by name,
+        a page starts after the start_after name if given, the name of a directory continues in the directories,
+        any other name in the files, then skips offset entries and takes limit entries
+        """
+        result = {"files": [], "total": 0, "next_start_after": ""}
         if offset < 0:
             offset = 0
         if limit < 0:
             limit = 0
         result["offset"] = offset
         result["limit"] = limit
-        files = []
-        dirs = []
         exists, file_type, file, _ = self.get_info(directory_path)
         if exists and file_type in (F.dir, "root"):
             if recursive:
-                result = file[F.children]
+                result = file.to_dict()[F.children]
             else:
-                names = list(file[F.children].keys())
-                names.sort()
+                dir_names, file_names = self.sorted_children.get(file)
+                if not include_directory:
+                    dir_names = []
+                if not include_file:
+                    file_names = []
+                total = len(dir_names) + len(file_names)
+                start = 0
+                if start_after:
+                    child = file.children.get(start_after)
+                    if dir_names and child is not None and child.type == F.dir:
+                        start = bisect_right(dir_names, start_after)
+                    else:
+                        start = len(dir_names) + bisect_right(file_names, start_after)
+                start += offset
+                stop = start + limit if limit > 0 else total
+                names = dir_names[start:stop]
+                if stop > len(dir_names):
+                    names += file_names[max(start - len(dir_names), 0):stop - len(dir_names)]
                 for name in names:
-                    c = file[F.children][name]
-                    file_type = c[F.type]
+                    c = file.children[name]
                     child = {
                         "name": name,
                     }
-                    if include_file and file_type == F.file:
-                        file_id = file[F.children][name][F.id]
+                    if c.type == F.file:
+                        file_id = c.id
                         file_info = self.files[file_id]
                         child["type"] = "file"
                         child["size"] = file_info["size"]
@@ -444,25 +649,20 @@ class FileSystemTree(object):
                             child["current_replica"] = file_info["current_replica"]
                         if "replica" in file_info:
                             child["replica"] = file_info["replica"]
-                        files.append(child)
-                    elif include_directory and file_type == F.dir:
+                    else:
                         child["type"] = "directory"
-                        child["size"] = 0
+                        child["size"] = c.size
+                        child["files"] = c.file_count
+                        child["directories"] = c.dir_count
                         child["id"] = ""
-                        if "ctime" in c[F.info]:
-                            child["ctime"] = c[F.info]["ctime"]
-                        if "mtime" in c[F.info]:
-                            child["mtime"] = c[F.info]["mtime"]
-                        dirs.append(child)
-                result["files"].extend(dirs)
-                result["files"].extend(files)
-                result["total"] = len(result["files"])
-                if offset > 0 and limit > 0:
-                    result["files"] = result["files"][offset:offset + limit]
-                elif offset > 0:
-                    result["files"] = result["files"][offset:]
-                elif limit > 0:
-                    result["files"] = result["files"][:limit]
+                        if "ctime" in c.info:
+                            child["ctime"] = c.info["ctime"]
+                        if "mtime" in c.info:
+                            child["mtime"] = c.info["mtime"]
+                    result["files"].append(child)
+                result["total"] = total
+                # the cursor of the next page, empty at the end of the listing
+                result["next_start_after"] = names[-1] if names and stop < total else ""
             LOG.debug("list_dir: %s", result)
         return result
 
@@ -483,19 +683,21 @@ class FileSystemTree(object):
                 directory_info = {"ctime": now, "mtime": now}
             last_idx = len(path_parts) - 2
             for n, dir_name in enumerate(path_parts[1:]):
-                if dir_name not in current_root[F.children]:
+                if dir_name not in current_root.children:
                     if n != last_idx:
                         raise ParentDirectoryNotExistsError("parent directory not exists: %s" % os.path.join(*path_parts[:n + 2]))
                     else:
-                        current_root[F.children][dir_name] = {F.type: F.dir, F.children: {}, F.info: directory_info}
+                        current_root.children[intern_name(dir_name)] = Directory(directory_info)
+                        self.sorted_children.add(current_root, dir_name, current_root.children[dir_name])
+                        self.add_totals(os.path.join(*path_parts[:n + 1]), (0, 0, 1, 0))
                         new_directory_flag = True
                         if self.editlog:
                             self.editlog.writeline({F.cmd: C.makedir, F.path: directory_path, F.info: directory_info})
                 else:
-                    child = current_root[F.children][dir_name]
-                    if child[F.type] == F.file:
+                    child = current_root.children[dir_name]
+                    if child.type == F.file:
                         raise SameNameFileExistsError("same file name exists: %s" % dir_name)
-                current_root = current_root[F.children][dir_name]
+                current_root = current_root.children[dir_name]
             update_root = self.tree
             if new_directory_flag and not recover:
                 self.update_parent_dirs(os.path.join(*path_parts[:-1]), directory_info)
@@ -504,6 +706,10 @@ class FileSystemTree(object):
 
     def makedirs(self, directory_path, recover = False):
         result = False
+        path = PathIndex.normalize(directory_path)
+        directory = self.path_index.get_dir(path) if path else None
+        if directory is not None: # the parent directory of most creates exists already
+            return directory
         path_parts = splitall(directory_path)
         if path_parts[0] != "/":
             raise InvalidValueError("must be absolute path: %s" % directory_path)
@@ -516,8 +722,8 @@ class FileSystemTree(object):
 
     def update_parent_dirs(self, directory_path, info = None):
         result = False
-        path_parts = splitall(directory_path)
-        if path_parts[0] != "/":
+        path = PathIndex.normalize(directory_path)
+        if path is None:
             raise InvalidValueError("must be absolute path: %s" % directory_path)
         else:
             if info is None:
@@ -525,10 +731,10 @@ class FileSystemTree(object):
             else:
                 info = {"mtime": info["mtime"]}
             update_root = self.tree
-            for dir_name in path_parts[1:]:
-                if dir_name in update_root[F.children]:
-                    update_root[F.children][dir_name][F.info]["mtime"] = info["mtime"]
-                update_root = update_root[F.children][dir_name]
+            for dir_name in path.split("/")[1:] if path != "/" else []:
+                if dir_name in update_root.children:
+                    update_root.children[dir_name].info["mtime"] = info["mtime"]
+                update_root = update_root.children[dir_name]
             if self.editlog:
                 self.editlog.writeline({F.cmd: C.update_parent_dirs, F.path: directory_path, F.info: info})
             result = True
@@ -548,24 +754,173 @@ class FileSystemTree(object):
             result = True
         return result
 
+    def add_totals(self, directory_path, totals, sign = 1):
+        """
+        add a child's (size, file count, directory count, block count) to the directory and all its ancestors,
+        sign -1 takes them away
+        """
+        size, file_count, dir_count, block_count = [sign * n for n in totals]
+        path = PathIndex.normalize(directory_path)
+        node = self.tree
+        node.add_totals(size, file_count, dir_count, block_count)
+        if path != "/":
+            for name in path.split("/")[1:]:
+                node = node.children[name]
+                node.add_totals(size, file_count, dir_count, block_count)
+
+    def count_totals(self):
+        """
+        add up every directory's subtree from scratch, a directory copied to several paths is counted once
+        """
+        done = set()
+        stack = [(self.tree, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                node.size = node.file_count = node.dir_count = node.block_count = 0
+                for child in node.children.values():
+                    node.add_totals(*child.totals())
+                done.add(id(node))
+            elif id(node) not in done:
+                stack.append((node, True))
+                for child in node.children.values():
+                    if child.type == F.dir and id(child) not in done:
+                        stack.append((child, False))
+
+    def summary(self, path):
+        """
+        total size, files, directories and blocks under the path, False if it doesn't exist
+        """
+        result = False
+        exists, _, file, _ = self.get_info(path)
+        if exists:
+            result = file.summary()
+        return result
+
+    def batch(self, operations, locks = None):
+        """
+        apply mkdir, create, delete, move, rename & stat operations in order, one result per operation,
+        a create with "inline" base64 content keeps a tiny file in the name node, no blocks on the data nodes,
+        a create takes the file lock and fails on a locked path, the paths locked are added to locks,
+        for the caller to release after sync, without locks they are released at the end,
+        a failed operation doesn't stop the ones after it, nothing yields in between,
+        so all the editlog lines go out with the same group commit
+        """
+        results = []
+        taken = [] if locks is None else locks
+        for operation in operations:
+            result = {"result": Errors.OK}
+            try:
+                self.apply_operation(operation, result, taken)
+            except (InvalidValueError, ParentDirectoryNotExistsError) as e:
+                Errors.set_result_error("InvalidParameters", result, str(e))
+            except SameNameExistsError as e:
+                Errors.set_result_error("SameNameExists", result, str(e))
+            except SameNameFileExistsError as e:
+                Errors.set_result_error("SameNameFileExists", result, str(e))
+            except FileNotExistsError as e:
+                Errors.set_result_error("FileNotExists", result, str(e))
+            except TargetPathMustDirectoryError as e:
+                Errors.set_result_error("TargetPathMustDirectory", result, str(e))
+            except TargetPathNotExistsError as e:
+                Errors.set_result_error("TargetPathNotExists", result, str(e))
+            except SourcePathNotExistsError as e:
+                Errors.set_result_error("SourcePathNotExists", result, str(e))
+            except Exception as e:
+                LOG.exception(e)
+                Errors.set_result_error("ServerException", result)
+            results.append(result)
+        if locks is None:
+            for path in taken:
+                self.unset_file_lock(path)
+        return results
+
+    def apply_operation(self, operation, result, locks):
+        op = operation.get("op", "") if isinstance(operation, dict) else ""
+        path = operation.get("path", "") if op else ""
+        if op == "mkdir" and path:
+            if not self.makedirs(path):
+                Errors.set_result_error("OperationFailed", result)
+        elif op == "create" and path and operation.get("id", ""):
+            if self.exists(path):
+                Errors.set_result_error("SameNameExists", result)
+            elif not self.set_file_lock(path): # a file being uploaded to the same path
+                Errors.set_result_error("SetFileLockFailed", result)
+            else:
+                locks.append(path)
+                replica = int(operation.get("replica", 1))
+                blocks = operation.get("blocks", [])
+                current_replica = replica
+                for block in blocks:
+                    if current_replica > len(block[2]):
+                        current_replica = len(block[2])
+                now = int(time.time())
+                file_info = {
+                    "size": int(operation.get("size", 0)),
+                    "id": operation["id"],
+                    "replica": replica,
+                    "current_replica": current_replica,
+                    "blocks": blocks,
+                    "checksum": operation.get("checksum", ""),
+                    "ctime": now,
+                    "mtime": now,
+                }
+                pack = operation.get("pack")
+                if pack: # a small file packed into a container, [container id, offset]
+                    if blocks or file_info["size"] > CONFIG.get("pack_file_size", 1048576) or not self.pack_map.is_valid(pack, file_info["size"]):
+                        raise InvalidValueError("invalid pack: %s" % pack)
+                    container = self.files[pack[0]]
+                    file_info["replica"] = container["replica"]
+                    file_info["current_replica"] = container["current_replica"]
+                    file_info["pack"] = [pack[0], pack[1]]
+                inline = operation.get("inline")
+                if inline is not None: # a tiny file kept in the file info, base64 content
+                    try:
+                        content = b64decode(inline, validate = True)
+                    except (TypeError, binascii.Error):
+                        raise InvalidValueError("invalid inline content: %s" % path)
+                    inline_file_size = CONFIG.get("inline_file_size", 0) # 0 turns inline files off
+                    if blocks or pack or inline_file_size <= 0 or len(content) > inline_file_size:
+                        raise InvalidValueError("invalid inline file: %s, size: %s" % (path, len(content)))
+                    file_info["size"] = len(content)
+                    file_info["checksum"] = bytes_md5sum(bytes_md5sum(content).encode("utf-8"))
+                    file_info["inline"] = inline
+                if not self.create(path, file_info):
+                    Errors.set_result_error("OperationFailed", result)
+        elif op == "delete" and path:
+            if not self.delete(path):
+                Errors.set_result_error("OperationFailed", result)
+        elif op == "move" and operation.get("source_path", "") and operation.get("target_path", ""):
+            if not self.move(operation["source_path"], operation["target_path"]):
+                Errors.set_result_error("OperationFailed", result)
+        elif op == "rename" and path and operation.get("new_name", ""):
+            if not self.rename(path, operation["new_name"]):
+                Errors.set_result_error("OperationFailed", result)
+        elif op == "stat" and path:
+            exists, file_type, file, _ = self.get_info(path)
+            result["info"] = {"exists": exists, "type": "file"}
+            if exists:
+                if file_type == F.file:
+                    result["info"].update(file.to_dict())
+                else:
+                    result["info"]["type"] = "directory"
+                    result["info"].update(file.info or {})
+                    result["info"].update(file.summary())
+        else:
+            Errors.set_result_error("InvalidParameters", result)
+
     def get_info(self, file_path):
         result = [True, "", {}, None]
-        path_parts = splitall(file_path)
-        if path_parts[0] != "/":
+        path = PathIndex.normalize(file_path)
+        if path is None:
             raise InvalidValueError("must be absolute path: %s" % file_path)
         else:
-            parent = None
-            current_root = self.tree
-            for name in path_parts[1:]:
-                if name not in current_root[F.children]:
-                    result[0] = False
-                    break
-                else:
-                    parent = current_root
-                    current_root = current_root[F.children][name]
-            if result[0]:
-                result[1] = current_root[F.type]
-                result[2] = current_root
+            node, parent = self.path_index.get(path)
+            if node is None:
+                result[0] = False
+            else:
+                result[1] = node.type
+                result[2] = node
                 result[3] = parent
         return result
 
@@ -574,104 +929,281 @@ class FileSystemTree(object):
         result = False
         try:
             LOG.info("loading fsimage ...")
+            self.path_index = PathIndex(self.tree)
+            self.sorted_children.clear()
+            self.pack_map.clear()
             fsimage_path = os.path.join(CONFIG["data_path"], "fsimage")
-            fsimage = AppendLogJson(fsimage_path)
-            n = 0
-            for line in fsimage.iterlines():
-                if n >= 100:
-                    n = 0
-                    yield gen.moment
-                if line[F.cmd] == C.create:
-                    self.create(line[F.path], line[F.info], recover = True)
-                elif line[F.cmd] == C.makedir:
-                    self.makedir(line[F.path], line[F.info], recover = True)
-                elif line[F.cmd] == C.makedirs: # just for loading old fsimage, need convert fsimage first "md" to "mds"
-                    self.makedirs(line[F.path], recover = True)
-                n += 1
+            if FsImage.is_fsimage(fsimage_path):
+                yield self.load_fsimage_binary(fsimage_path)
+            else:
+                yield self.load_fsimage_json(fsimage_path)
+            self.count_totals()
             result = True
         except Exception as e:
             LOG.exception(e)
         raise gen.Return(result)
 
+    @gen.coroutine
+    def load_fsimage_binary(self, fsimage_path):
+        parents = [self.tree]
+        n = 0
+        fsimage = FsImageReader(fsimage_path)
+        for record_type, name, payload in fsimage.iterrecords():
+            if n >= 10000:
+                n = 0
+                yield gen.moment
+            if record_type == FsImage.DIR:
+                directory = Directory(payload)
+                parents[-1].children[intern_name(name)] = directory
+                parents.append(directory)
+            elif record_type == FsImage.FILE:
+                file = self.files.get(payload["id"])
+                if file is None: # a copied file is in the fsimage once for each path
+                    file = FileInfo(payload)
+                    self.files[payload["id"]] = file
+                    self.pack_map.add_file(file)
+                parents[-1].children[intern_name(name)] = file
+            elif record_type == FsImage.PACK:
+                self.create_pack(payload)
+            elif record_type == FsImage.END:
+                parents.pop()
+            n += 1
+        self.segment = fsimage.segment
+
+    @gen.coroutine
+    def load_fsimage_json(self, fsimage_path): # just for loading old fsimage, convert it with migrate_fsimage.py
+        fsimage = AppendLogJson(fsimage_path)
+        n = 0
+        for line in fsimage.iterlines():
+            if n >= 100:
+                n = 0
+                yield gen.moment
+            if line[F.cmd] == C.create:
+                self.create(line[F.path], line[F.info], recover = True)
+            elif line[F.cmd] == C.makedir:
+                self.makedir(line[F.path], line[F.info], recover = True)
+            elif line[F.cmd] == C.makedirs: # need convert fsimage first "md" to "mds"
+                self.makedirs(line[F.path], recover = True)
+            n += 1
+        fsimage.close()
+
     @gen.coroutine
     def load_editlog(self):
         result = False
         try:
             LOG.info("loading editlog ...")
-            editlog_path = os.path.join(CONFIG["data_path"], "editlog")
-            editlog = AppendLogJson(editlog_path)
-            n = 0
-            for line in editlog.iterlines():
-                if n >= 100:
-                    n = 0
-                    yield gen.moment
-                if line[F.cmd] == C.create:
-                    self.create(line[F.path], line[F.info], recover = True)
-                elif line[F.cmd] == C.makedir:
-                    self.makedir(line[F.path], line[F.info], recover = True)
-                elif line[F.cmd] == C.makedirs:
-                    self.makedirs(line[F.path], recover = True)
-                elif line[F.cmd] == C.rename:
-                    self.rename(line[F.path], line[F.new_name], recover = True)
-                elif line[F.cmd] == C.delete:
-                    self.delete(line[F.path], recover = True)
-                elif line[F.cmd] == C.move:
-                    self.move(line[F.source_path], line[F.target_path])
-                elif line[F.cmd] == C.copy:
-                    self.copy(line[F.source_path], line[F.target_path])
-                elif line[F.cmd] == C.update_file_info:
-                    self.update_file_info(line[F.path], line[F.info], recover = True)
-                elif line[F.cmd] == C.update_parent_dirs:
-                    self.update_parent_dirs(line[F.path], line[F.info])
-                n += 1
+            # segments already merged into the fsimage are skipped, the current editlog goes last
+            for segment, editlog_path in self.editlog_segments():
+                if segment > self.segment:
+                    LOG.info("loading editlog segment: %s", segment)
+                    yield self.replay_editlog(editlog_path)
+                    self.segment = segment
+            yield self.replay_editlog(os.path.join(CONFIG["data_path"], "editlog"))
             result = True
         except Exception as e:
             LOG.exception(e)
         raise gen.Return(result)
 
+    @gen.coroutine
+    def replay_editlog(self, editlog_path):
+        editlog = AppendLogJson(editlog_path)
+        n = 0
+        for line in editlog.iterlines():
+            if n >= 100:
+                n = 0
+                yield gen.moment
+            if line[F.cmd] == C.create:
+                self.create(line[F.path], line[F.info], recover = True)
+            elif line[F.cmd] == C.makedir:
+                self.makedir(line[F.path], line[F.info], recover = True)
+            elif line[F.cmd] == C.makedirs:
+                self.makedirs(line[F.path], recover = True)
+            elif line[F.cmd] == C.rename:
+                self.rename(line[F.path], line[F.new_name], recover = True)
+            elif line[F.cmd] == C.delete:
+                self.delete(line[F.path], recover = True)
+            elif line[F.cmd] == C.move:
+                self.move(line[F.source_path], line[F.target_path])
+            elif line[F.cmd] == C.copy:
+                self.copy(line[F.source_path], line[F.target_path])
+            elif line[F.cmd] == C.update_file_info:
+                self.update_file_info(line[F.path], line[F.info], recover = True)
+            elif line[F.cmd] == C.update_parent_dirs:
+                self.update_parent_dirs(line[F.path], line[F.info])
+            elif line[F.cmd] == C.add_block_nodes:
+                self.add_block_nodes(line[F.id], line[F.block], line[F.nodes])
+            elif line[F.cmd] == C.move_block_node:
+                self.move_block_node(line[F.id], line[F.block], line[F.source_node], line[F.target_node])
+            elif line[F.cmd] == C.create_pack:
+                self.create_pack(line[F.info])
+            elif line[F.cmd] == C.delete_pack:
+                self.delete_pack(line[F.id])
+            elif line[F.cmd] == C.repack:
+                self.repack(line[F.id], line[F.info])
+            n += 1
+        editlog.close()
+
+    def editlog_segments(self):
+        result = []
+        for name in os.listdir(CONFIG["data_path"]):
+            if name.startswith("editlog."):
+                segment = name[len("editlog."):]
+                if segment.isdigit():
+                    result.append((int(segment), os.path.join(CONFIG["data_path"], name)))
+        result.sort()
+        return result
+
+    def roll_editlog(self):
+        """
+        rename the current editlog to the next segment, new mutations go to a new editlog,
+        return the last segment
+        """
+        editlog_path = os.path.join(CONFIG["data_path"], "editlog")
+        if self.editlog:
+            self.editlog.close()
+        if os.path.exists(editlog_path) and os.path.getsize(editlog_path) > 0:
+            self.segment += 1
+            os.rename(editlog_path, os.path.join(CONFIG["data_path"], "editlog.%s" % self.segment))
+        if self.editlog:
+            self.editlog = EditLog(editlog_path, CONFIG.get("editlog_durability", "flush"))
+        return self.segment
+
+    def remove_editlog_segments(self, segment):
+        for s, editlog_path in self.editlog_segments():
+            if s <= segment:
+                os.remove(editlog_path)
+                LOG.debug("remove editlog segment: %s", s)
+
+    def replace_fsimage(self):
+        new_fsimage_path = os.path.join(CONFIG["data_path"], "fsimage.new")
+        fsimage_path = os.path.join(CONFIG["data_path"], "fsimage")
+        old_fsimage_path = os.path.join(CONFIG["data_path"], "fsimage.old")
+        if os.path.exists(old_fsimage_path):
+            os.remove(old_fsimage_path)
+        if os.path.exists(fsimage_path):
+            os.rename(fsimage_path, old_fsimage_path)
+        if os.path.exists(new_fsimage_path):
+            os.rename(new_fsimage_path, fsimage_path)
+
     @gen.coroutine
     def dump_fsimage(self):
         result = False
         try:
             LOG.info("dumping fsimage ...")
             new_fsimage_path = os.path.join(CONFIG["data_path"], "fsimage.new")
-            fsimage_path = os.path.join(CONFIG["data_path"], "fsimage")
-            old_fsimage_path = os.path.join(CONFIG["data_path"], "fsimage.old")
-            editlog_path = os.path.join(CONFIG["data_path"], "editlog")
             LOG.debug("new fsimage: %s", new_fsimage_path)
-            self.new_fsimage = AppendLogJson(new_fsimage_path)
-            yield self.dump_files("/", self.tree)
-            if os.path.exists(old_fsimage_path):
-                os.remove(old_fsimage_path)
-            if os.path.exists(fsimage_path):
-                os.rename(fsimage_path, old_fsimage_path)
-            if os.path.exists(new_fsimage_path):
-                os.rename(new_fsimage_path, fsimage_path)
-            if os.path.exists(editlog_path):
-                os.remove(editlog_path)
+            segment = self.roll_editlog()
+            yield self.write_fsimage(new_fsimage_path, segment)
+            self.replace_fsimage()
+            self.remove_editlog_segments(segment)
             result = True
         except Exception as e:
             LOG.exception(e)
         raise gen.Return(result)
 
     @gen.coroutine
-    def dump_files(self, file_path, file):
-        if F.children in file and file[F.children]:
-            if file_path != "/":
-                LOG.debug("find directory[%s]: %s", file_path, file)
-                self.new_fsimage.writeline({F.cmd: C.makedir, F.path: file_path, F.info: file[F.info]})
-            for name in file[F.children]:
-                child = file[F.children][name]
-                yield self.dump_files(os.path.join(file_path, name), child)
-        else:
-            if file[F.type] == F.file:
-                file_id = file[F.id]
-                file_info = self.files[file_id]
-                LOG.debug("find file[%s]: %s", file_path, file)
-                self.new_fsimage.writeline({F.cmd: C.create, F.path: file_path, F.info: file_info})
-            elif file[F.type] == F.dir:
-                LOG.debug("find directory[%s]: %s", file_path, file)
-                self.new_fsimage.writeline({F.cmd: C.makedir, F.path: file_path, F.info: file[F.info]})
+    def write_fsimage(self, fsimage_path, segment = 0):
+        fsimage = FsImageWriter(fsimage_path, segment)
+        try:
+            for _ in self.iter_write_fsimage(fsimage):
+                yield gen.moment
+        finally:
+            fsimage.close()
+
+    def iter_write_fsimage(self, fsimage, batch = 10000):
+        # depth first with an explicit stack, children in name order, pause every batch records
+        stack = [iter(sorted(self.tree.children.items()))]
+        n = 0
+        while stack:
+            if n >= batch:
+                n = 0
+                yield
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                if stack:
+                    fsimage.write_end()
+                continue
+            name, file = child
+            if file.type == F.file:
+                fsimage.write_file(name, file.to_dict())
+            elif file.type == F.dir:
+                fsimage.write_dir(name, file.info)
+                stack.append(iter(sorted(file.children.items())))
+            n += 1
+        # the containers of packed files go after the tree
+        for container_id in list(self.pack_map.containers.keys()):
+            if n >= batch:
+                n = 0
+                yield
+            if container_id in self.files:
+                fsimage.write_pack(self.files[container_id].to_dict())
+            n += 1
+
+    def need_checkpoint(self):
+        result = False
+        editlog_path = os.path.join(CONFIG["data_path"], "editlog")
+        if os.path.exists(editlog_path):
+            editlog_size = os.path.getsize(editlog_path)
+            if editlog_size > 0:
+                if editlog_size >= CONFIG.get("checkpoint_editlog_size", 67108864):
+                    result = True
+                elif time.time() - self.checkpoint_time >= CONFIG.get("checkpoint_interval", 3600):
+                    result = True
+        return result
+
+    def start_checkpoint(self):
+        """
+        roll the editlog, then fork, the child process writes the fsimage from its copy on write snapshot of the tree,
+        so the ioloop only pays for the fork
+        """
+        segment = self.roll_editlog()
+        new_fsimage_path = os.path.join(CONFIG["data_path"], "fsimage.new")
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                fsimage = FsImageWriter(new_fsimage_path, segment)
+                for _ in self.iter_write_fsimage(fsimage):
+                    pass
+                fsimage.close()
+                code = 0
+            except Exception as e:
+                LOG.exception(e)
+            finally:
+                os._exit(code)
+        self.checkpoint_pid = pid
+        self.checkpoint_segment = segment
+        self.checkpoint_time = time.time()
+        LOG.info("checkpoint segment[%s] start, pid: %s", segment, pid)
+
+    def finish_checkpoint(self):
+        pid, status = os.waitpid(self.checkpoint_pid, os.WNOHANG)
+        if pid != 0:
+            self.checkpoint_pid = None
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                self.replace_fsimage()
+                self.remove_editlog_segments(self.checkpoint_segment)
+                LOG.info("checkpoint segment[%s] finished, use %.3fs", self.checkpoint_segment, time.time() - self.checkpoint_time)
+            else:
+                LOG.error("checkpoint segment[%s] failed, status: %s", self.checkpoint_segment, status)
+
+    def checkpoint_service(self):
+        try:
+            if self.checkpoint_pid is not None:
+                self.finish_checkpoint()
+            elif self.status == "ready" and self.need_checkpoint():
+                self.start_checkpoint()
+        except Exception as e:
+            LOG.exception(e)
 
     def close(self):
-        pass
+        if self.checkpoint_pid is not None:
+            try:
+                os.kill(self.checkpoint_pid, signal.SIGKILL)
+                os.waitpid(self.checkpoint_pid, 0)
+            except Exception as e:
+                LOG.exception(e)
+            self.checkpoint_pid = None
+        if self.editlog:
+            self.editlog.close()
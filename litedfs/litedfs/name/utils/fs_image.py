@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import json
+import struct
+import logging
+from array import array
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b"LDFSIMG"
+VERSION = 2
+HEADER = struct.Struct("<7sBQ")
+HEADER_V1 = struct.Struct("<7sB") # version 1 has no segment, the magic & version prefix is the same for all versions
+BATCH = struct.Struct("<III")
+
+
+class FsImageFormatError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class FsImage(object):
+    """
+    binary fsimage, a header (magic, version, last editlog segment merged in) followed by the tree records in pre-order,
+    version 1 headers have no segment and are still read, with segment 0,
+    a directory record is followed by its children in order and closed by an end record,
+    the records of the containers packed small files are in go after the tree,
+    records are stored in batches: (count, names size, payloads size) + types + name sizes + utf-8 names + json array of payloads,
+    so a batch decodes with a single json.loads
+    """
+    DIR = 1
+    FILE = 2
+    END = 3
+    PACK = 4
+
+    @classmethod
+    def is_fsimage(cls, path):
+        result = False
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER_V1.size:
+            with open(path, "rb") as fp:
+                magic, _ = HEADER_V1.unpack(fp.read(HEADER_V1.size))
+                result = magic == MAGIC
+        return result
+
+
+class FsImageWriter(FsImage):
+    def __init__(self, path, segment = 0, batch_size = 4096):
+        self.path = path
+        self.segment = segment
+        self.batch_size = batch_size
+        self.types = array("B")
+        self.name_sizes = array("I")
+        self.names = []
+        self.payloads = []
+        self.fp = open(self.path, "wb")
+        self.fp.write(HEADER.pack(MAGIC, VERSION, self.segment))
+
+    def write_record(self, record_type, name = "", payload = None):
+        name = name.encode("utf-8")
+        self.types.append(record_type)
+        self.name_sizes.append(len(name))
+        self.names.append(name)
+        self.payloads.append(payload)
+        if len(self.types) >= self.batch_size:
+            self.flush()
+
+    def write_dir(self, name, info):
+        self.write_record(FsImage.DIR, name, info)
+
+    def write_file(self, name, file_info):
+        self.write_record(FsImage.FILE, name, file_info)
+
+    def write_end(self):
+        self.write_record(FsImage.END)
+
+    def write_pack(self, container_info):
+        self.write_record(FsImage.PACK, "", container_info)
+
+    def flush(self):
+        if self.types:
+            names = b"".join(self.names)
+            payloads = json.dumps(self.payloads, separators = (",", ":")).encode("utf-8")
+            self.fp.write(BATCH.pack(len(self.types), len(names), len(payloads)))
+            self.fp.write(self.types.tobytes())
+            self.fp.write(self.name_sizes.tobytes())
+            self.fp.write(names)
+            self.fp.write(payloads)
+            self.types = array("B")
+            self.name_sizes = array("I")
+            self.names = []
+            self.payloads = []
+
+    def close(self):
+        if self.fp:
+            self.flush()
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            self.fp.close()
+            self.fp = None
+
+
+class FsImageReader(FsImage):
+    def __init__(self, path):
+        self.path = path
+        self.segment = 0
+
+    def iterrecords(self):
+        """
+        yield (type, name, payload) records, payload is None for end records
+        """
+        with open(self.path, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size < HEADER_V1.size:
+                raise FsImageFormatError("fsimage too small: %s" % self.path)
+            with mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ) as m:
+                size = len(m)
+                magic, version = HEADER_V1.unpack_from(m, 0)
+                if magic == MAGIC and version == 1: # written before the header had the segment, no segment merged in
+                    self.segment = 0
+                    pos = HEADER_V1.size
+                elif magic == MAGIC and version == VERSION and size >= HEADER.size:
+                    _, _, self.segment = HEADER.unpack_from(m, 0)
+                    pos = HEADER.size
+                else:
+                    raise FsImageFormatError("unsupported fsimage: %s, version: %s" % (self.path, version))
+                while pos < size:
+                    count, names_size, payloads_size = BATCH.unpack_from(m, pos)
+                    pos += BATCH.size
+                    if pos + count * 5 + names_size + payloads_size > size:
+                        raise FsImageFormatError("truncated fsimage: %s" % self.path)
+                    types = array("B", m[pos:pos + count])
+                    pos += count
+                    name_sizes = array("I", m[pos:pos + count * 4])
+                    pos += count * 4
+                    names = m[pos:pos + names_size]
+                    pos += names_size
+                    payloads = json.loads(m[pos:pos + payloads_size])
+                    pos += payloads_size
+                    name_pos = 0
+                    for i in range(count):
+                        name_end = name_pos + name_sizes[i]
+                        yield types[i], names[name_pos:name_end].decode("utf-8"), payloads[i]
+                        name_pos = name_end
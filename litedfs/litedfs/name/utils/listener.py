@@ -1,17 +1,22 @@
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 from uuid import uuid4
+from collections import deque
 
 import tornado.tcpserver
 from tornado import gen
 from tornado.ioloop import IOLoop
+from tornado.httpclient import AsyncHTTPClient
 from tornado_discovery.connection import BaseConnection
 from tornado_discovery.listener import BaseListener
 from tornado_discovery.common import crc32sum, Command, Status, Message
 
 from litedfs.name.models.data_nodes import DataNodes
+from litedfs.name.utils.block_map import BlockMap
 from litedfs.name.utils.common import OperationError
+from litedfs.name.config import CONFIG
 
 LOG = logging.getLogger(__name__)
 
@@ -21,18 +26,61 @@ class Connection(BaseConnection):
     id_compress = {}
     id_decompress = {}
     tasks = {}
+    task_token = uuid4().hex # sent to the data nodes when they register, authenticates the pushed tasks
 
     def __init__(self, stream, address):
         super(Connection, self).__init__(stream, address)
 
     @classmethod
     def push_task(cls, id, task):
-        if id in cls.tasks:
-            cls.tasks[id].append(task)
-        else:
-            cls.tasks[id] = [task]
+        if id not in cls.tasks:
+            cls.tasks[id] = deque()
+        cls.tasks[id].append(task)
         LOG.debug("push task, id: %s, task: %s", id, task)
 
+    @classmethod
+    def pop_tasks(cls, id, size):
+        result = []
+        if id in cls.tasks:
+            tasks = cls.tasks[id]
+            while tasks and len(result) < size:
+                result.append(tasks.popleft())
+        return result
+
+    @classmethod
+    @gen.coroutine
+    def push_urgent_task(cls, id, task):
+        """
+        send the task to the data node's push channel right now,
+        put it at the head of the heartbeat queue if the data node can't take it
+        """
+        success = False
+        try:
+            node_id = cls.id_decompress.get(id)
+            if node_id in cls.clients_dict:
+                node = cls.clients_dict[node_id]
+                url = "http://%s:%s/task/push" % (node.info["http_host"], node.info["http_port"])
+                r = yield AsyncHTTPClient().fetch(
+                    url,
+                    method = "POST",
+                    headers = {"token": cls.task_token},
+                    body = json.dumps({"tasks": [task]}),
+                    request_timeout = 10,
+                    raise_error = False
+                )
+                if r.code == 200:
+                    data = json.loads(r.body.decode("utf-8"))
+                    success = data["result"] == "ok"
+                else:
+                    LOG.warning("push urgent task to node: %s failed, response: %s", id, r)
+        except Exception as e:
+            LOG.exception(e)
+        if not success:
+            if id not in cls.tasks:
+                cls.tasks[id] = deque()
+            cls.tasks[id].appendleft(task)
+        LOG.debug("push urgent task, id: %s, task: %s, pushed: %s", id, task, success)
+
     @classmethod
     def load_node_ids(cls):
         nodes_info = DataNodes.instance().list()
@@ -54,6 +102,25 @@ class Connection(BaseConnection):
                     result[node.id] = [node.info["http_host"], node.info["http_port"], node.info["storage_full"]]
         return result
 
+    @classmethod
+    def get_node_stats(cls):
+        """
+        what the placement policy and the balancer need to know about the live data nodes
+        """
+        result = {}
+        for node_id in cls.clients_dict:
+            info = cls.clients_dict[node_id].info
+            result[cls.clients_dict[node_id].id] = {
+                "host": info["http_host"],
+                "rack": info.get("rack", ""),
+                "full": info["storage_full"],
+                "free": info.get("storage_free", 0),
+                "used": info.get("storage_used", 0),
+                "total": info.get("storage_total", 0),
+                "load": info.get("write_load", 0.0),
+            }
+        return result
+
     @gen.coroutine
     def _on_connect(self):
         try:
@@ -95,6 +162,8 @@ class Connection(BaseConnection):
                             if self.info["node_id"] not in Connection.clients_dict:
                                 Connection.clients_dict[self.info["node_id"]] = self
                             self._status = Status.registered
+                            send_data["data"]["id"] = self.id
+                            send_data["data"]["task_token"] = Connection.task_token
                     # register with node_id
                     else:
                         send_data = {
@@ -130,11 +199,16 @@ class Connection(BaseConnection):
                             if self.info["node_id"] not in Connection.clients_dict:
                                 Connection.clients_dict[self.info["node_id"]] = self
                             self._status = Status.registered
+                            send_data["data"]["id"] = self.id
+                            send_data["data"]["task_token"] = Connection.task_token
                 elif "command" in data and data["command"] == Command.heartbeat:
+                    block_report = data["data"].pop("block_report", None)
                     self.info = data["data"]
                     if self.info["http_host"] == "0.0.0.0":
                         self.info["http_host"] = self._address[0]
                     if self._status == Status.registered:
+                        if block_report and BlockMap.instance():
+                            BlockMap.instance().report(self.id, block_report)
                         send_data = {
                             "command": Command.heartbeat,
                             "data": {
@@ -144,9 +218,12 @@ class Connection(BaseConnection):
                             }
                         }
                         if self.id in Connection.tasks and Connection.tasks[self.id]:
-                            if not self.info["task_queue_full"]:
-                                task = Connection.tasks[self.id].pop(0)
-                                send_data["data"]["task"] = task
+                            if "task_queue_free" in self.info: # as many tasks as the data node's task queue can take
+                                tasks = Connection.pop_tasks(self.id, min(self.info["task_queue_free"], CONFIG.get("task_batch_size", 1000)))
+                                if tasks:
+                                    send_data["data"]["tasks"] = tasks
+                            elif not self.info["task_queue_full"]:
+                                send_data["data"]["task"] = Connection.pop_tasks(self.id, 1)[0]
                         if self._heartbeat_timeout:
                             IOLoop.instance().remove_timeout(self._heartbeat_timeout)
                         self._heartbeat_timeout = IOLoop.instance().add_timeout(
@@ -177,7 +254,13 @@ class Connection(BaseConnection):
         except Exception as e:
             LOG.exception(e)
 
+    def _remove_block_replicas(self):
+        # a newer connection of the same node keeps its replicas
+        if BlockMap.instance() and hasattr(self, "id") and Connection.clients_dict.get(self.info.get("node_id")) in (None, self):
+            BlockMap.instance().remove_node(self.id)
+
     def _remove_connection(self):
+        self._remove_block_replicas()
         if self in BaseConnection.clients:
             if "node_id" in self.info and self.info["node_id"] in Connection.clients_dict:
                 del Connection.clients_dict[self.info["node_id"]]
@@ -188,6 +271,7 @@ class Connection(BaseConnection):
     def _refuse_connect(self):
         if self._heartbeat_timeout:
             IOLoop.instance().remove_timeout(self._heartbeat_timeout)
+        self._remove_block_replicas()
         if self in BaseConnection.clients:
             if "node_id" in self.info and self.info["node_id"] in Connection.clients_dict:
                 del Connection.clients_dict[self.info["node_id"]]
@@ -198,6 +282,7 @@ class Connection(BaseConnection):
     def _on_close(self):
         if self._heartbeat_timeout:
             IOLoop.instance().remove_timeout(self._heartbeat_timeout)
+        self._remove_block_replicas()
         if self in BaseConnection.clients:
             if "node_id" in self.info and self.info["node_id"] in Connection.clients_dict:
                 del Connection.clients_dict[self.info["node_id"]]
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import logging
+
+LOG = logging.getLogger(__name__)
+
+ROOT = "root"
+DIR = "d"
+FILE = "f"
+
+BLOCK = struct.Struct("<IQBB") # block id, size, md5 kind, node count
+NODE = struct.Struct("<I")
+DIGEST_SIZE = 16
+NO_MD5 = 0
+BINARY_MD5 = 1
+TEXT_MD5 = 2
+
+
+def pack_digest(value):
+    """
+    a 32 chars hex digest => 16 bytes, anything else stays as it is
+    """
+    if isinstance(value, str) and len(value) == DIGEST_SIZE * 2:
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return value
+
+
+def unpack_digest(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def pack_blocks(blocks):
+    """
+    [[block id, size, [node ids], md5], ...] => bytes, the md5 is optional
+    """
+    result = []
+    for block in blocks:
+        node_ids = block[2]
+        md5 = pack_digest(block[3]) if len(block) > 3 else None
+        if md5 is None:
+            result.append(BLOCK.pack(block[0], block[1], NO_MD5, len(node_ids)))
+        elif isinstance(md5, bytes):
+            result.append(BLOCK.pack(block[0], block[1], BINARY_MD5, len(node_ids)))
+            result.append(md5)
+        else:
+            md5 = md5.encode("utf-8")
+            result.append(BLOCK.pack(block[0], block[1], TEXT_MD5, len(node_ids)))
+            result.append(bytes((len(md5),)))
+            result.append(md5)
+        for node_id in node_ids:
+            result.append(NODE.pack(node_id))
+    return b"".join(result)
+
+
+def count_blocks(packed):
+    result = 0
+    pos = 0
+    size = len(packed)
+    while pos < size:
+        _, _, md5_kind, node_count = BLOCK.unpack_from(packed, pos)
+        pos += BLOCK.size
+        if md5_kind == BINARY_MD5:
+            pos += DIGEST_SIZE
+        elif md5_kind == TEXT_MD5:
+            pos += 1 + packed[pos]
+        pos += node_count * NODE.size
+        result += 1
+    return result
+
+
+def unpack_blocks(packed):
+    result = []
+    pos = 0
+    size = len(packed)
+    while pos < size:
+        block_id, block_size, md5_kind, node_count = BLOCK.unpack_from(packed, pos)
+        pos += BLOCK.size
+        md5 = None
+        if md5_kind == BINARY_MD5:
+            md5 = packed[pos:pos + DIGEST_SIZE].hex()
+            pos += DIGEST_SIZE
+        elif md5_kind == TEXT_MD5:
+            md5_size = packed[pos]
+            md5 = packed[pos + 1:pos + 1 + md5_size].decode("utf-8")
+            pos += 1 + md5_size
+        node_ids = [NODE.unpack_from(packed, pos + i * NODE.size)[0] for i in range(node_count)]
+        pos += node_count * NODE.size
+        if md5 is None:
+            result.append([block_id, block_size, node_ids])
+        else:
+            result.append([block_id, block_size, node_ids, md5])
+    return result
+
+
+class Directory(object):
+    """
+    a directory of the tree, children: name => Directory or FileInfo, info: {"ctime": ..., "mtime": ...},
+    size, file_count, dir_count & block_count add up the whole subtree, the directory itself not included
+    """
+    __slots__ = ("children", "info", "size", "file_count", "dir_count", "block_count")
+    type = DIR
+
+    def __init__(self, info = None):
+        self.children = {}
+        self.info = info
+        self.size = 0
+        self.file_count = 0
+        self.dir_count = 0
+        self.block_count = 0
+
+    def totals(self):
+        """
+        (size, file count, directory count, block count) the directory adds to its parent
+        """
+        return self.size, self.file_count, self.dir_count + 1, self.block_count
+
+    def add_totals(self, size, file_count, dir_count, block_count):
+        self.size += size
+        self.file_count += file_count
+        self.dir_count += dir_count
+        self.block_count += block_count
+
+    def summary(self):
+        return {"size": self.size, "files": self.file_count, "directories": self.dir_count, "blocks": self.block_count}
+
+    def to_dict(self):
+        """
+        the nested dict the tree was made of before, {"t": type, "c": children, "i": info}
+        """
+        result = {"t": self.type, "c": {}}
+        if self.info is not None:
+            result["i"] = self.info
+        for name, child in self.children.items():
+            if child.type == FILE:
+                result["c"][name] = {"t": FILE, "id": child.id}
+            else:
+                result["c"][name] = child.to_dict()
+        return result
+
+
+class Root(Directory):
+    __slots__ = ()
+    type = ROOT
+
+
+class FileInfo(object):
+    """
+    a file of the namespace, both a leaf of the tree and the value of FileSystemTree.files,
+    it reads and writes like the file info dict it replaced, the blocks are packed into one bytes object
+    with binary md5 digests and 32 bits node ids, file_info["blocks"] unpacks a new list every time,
+    so changed blocks must be set back with file_info["blocks"] = blocks
+    """
+    __slots__ = ("size", "id", "replica", "current_replica", "packed_blocks", "checksum", "ctime", "mtime", "extra")
+    type = FILE
+    fields = ("size", "id", "replica", "current_replica", "blocks", "checksum", "ctime", "mtime")
+
+    def __init__(self, file_info = None):
+        self.load(file_info or {})
+
+    def load(self, file_info):
+        """
+        replace every field with the file info dict's
+        """
+        self.size = None
+        self.id = None
+        self.replica = None
+        self.current_replica = None
+        self.packed_blocks = None
+        self.checksum = None
+        self.ctime = None
+        self.mtime = None
+        self.extra = None
+        for key, value in file_info.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key == "blocks":
+            if self.packed_blocks is None:
+                raise KeyError(key)
+            return unpack_blocks(self.packed_blocks)
+        elif key == "checksum":
+            if self.checksum is None:
+                raise KeyError(key)
+            return unpack_digest(self.checksum)
+        elif key in FileInfo.fields:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "blocks":
+            self.packed_blocks = pack_blocks(value)
+        elif key == "checksum":
+            self.checksum = pack_digest(value)
+        elif key in FileInfo.fields:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        if key == "blocks":
+            return self.packed_blocks is not None
+        elif key in FileInfo.fields:
+            return getattr(self, key) is not None
+        return bool(self.extra) and key in self.extra
+
+    def totals(self):
+        """
+        (size, file count, directory count, block count) the file adds to its parent
+        """
+        return self.size or 0, 1, 0, count_blocks(self.packed_blocks) if self.packed_blocks else 0
+
+    def summary(self):
+        size, file_count, dir_count, block_count = self.totals()
+        return {"size": size, "files": file_count, "directories": dir_count, "blocks": block_count}
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        result = {}
+        for key in FileInfo.fields:
+            if key in self:
+                result[key] = self[key]
+        if self.extra:
+            result.update(self.extra)
+        return result
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PackMap(object):
+    """
+    the containers small files are packed into, a container is a one block file of fs.files without a path,
+    so the block map, the replicator and the balancer take care of its block like any other file's,
+    a packed file has no blocks of its own, its file info's "pack" is [container id, offset],
+    containers: container id => set of the packed file ids in it, live: container id => bytes of them
+    """
+    _instance = None
+    name = "pack_map"
+
+    def __new__(cls, fs = None):
+        if not cls._instance:
+            cls._instance = object.__new__(cls)
+            cls._instance.fs = fs
+            cls._instance.containers = {}
+            cls._instance.live = {}
+        return cls._instance
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def clear(self):
+        self.containers = {}
+        self.live = {}
+
+    def add_container(self, container_id):
+        if container_id not in self.containers:
+            self.containers[container_id] = set()
+            self.live[container_id] = 0
+
+    def remove_container(self, container_id):
+        self.containers.pop(container_id, None)
+        self.live.pop(container_id, None)
+
+    def add_file(self, file_info):
+        pack = file_info.get("pack")
+        if pack:
+            self.add_container(pack[0])
+            file_ids = self.containers[pack[0]]
+            if file_info["id"] not in file_ids:
+                file_ids.add(file_info["id"])
+                self.live[pack[0]] += file_info["size"]
+
+    def remove_file(self, file_info):
+        pack = file_info.get("pack")
+        if pack and pack[0] in self.containers:
+            file_ids = self.containers[pack[0]]
+            if file_info["id"] in file_ids:
+                file_ids.discard(file_info["id"])
+                self.live[pack[0]] -= file_info["size"]
+
+    def locate(self, pack):
+        """
+        what a reader needs to find a packed file: {"id": container id, "offset": ..., "block": the container's block}
+        """
+        result = None
+        container = self.fs.files.get(pack[0]) if pack[0] in self.containers else None
+        if container is not None:
+            result = {"id": pack[0], "offset": pack[1], "block": container["blocks"][0]}
+        return result
+
+    def is_valid(self, pack, size):
+        result = False
+        container = self.fs.files.get(pack[0]) if pack[0] in self.containers else None
+        if container is not None and 0 <= pack[1] and 0 <= size and pack[1] + size <= container["size"]:
+            result = True
+        return result
+
+    def sparse_containers(self, ratio):
+        """
+        ids of the containers with less than ratio of their bytes still used, the emptiest first
+        """
+        result = []
+        for container_id in self.containers:
+            container = self.fs.files.get(container_id)
+            if container is not None and (self.live[container_id] == 0 or self.live[container_id] < ratio * container["size"]):
+                result.append((float(self.live[container_id]) / max(container["size"], 1), container_id))
+        result.sort()
+        return [container_id for _, container_id in result]
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import logging
+from bisect import bisect_left, insort
+
+from litedfs.name.utils.namespace import DIR
+
+LOG = logging.getLogger(__name__)
+
+
+def intern_name(name):
+    """
+    the same names repeat all over a namespace, the tree keeps one copy of each
+    """
+    return sys.intern(name)
+
+
+class PathIndex(object):
+    """
+    normalized directory path => directory node of the tree, filled on lookups,
+    a cached path's ancestors are always cached too, so dropping a directory only needs to walk the cached part of its subtree,
+    the tree calls remove before a directory is deleted, renamed or moved
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.dirs = {"/": tree}
+
+    @classmethod
+    def normalize(cls, path):
+        """
+        "/a//b/" => "/a/b", None for relative paths
+        """
+        if not path.startswith("/"):
+            return None
+        if "//" in path or (path.endswith("/") and path != "/"):
+            path = "/" + "/".join(name for name in path.split("/") if name)
+        return path
+
+    @classmethod
+    def split(cls, path):
+        """
+        normalized path => (parent path, name)
+        """
+        i = path.rfind("/")
+        return path[:i] or "/", path[i + 1:]
+
+    def get_dir(self, path):
+        """
+        the directory node at the normalized path, None if it doesn't exist or isn't a directory
+        """
+        node = self.dirs.get(path)
+        if node is None:
+            missing = []
+            parent_path = path
+            while parent_path not in self.dirs:
+                parent_path, name = self.split(parent_path)
+                missing.append(name)
+            node = self.dirs[parent_path]
+            for name in reversed(missing):
+                node = node.children.get(name)
+                if node is None or node.type != DIR:
+                    node = None
+                    break
+                parent_path = parent_path + "/" + name if parent_path != "/" else "/" + name
+                self.dirs[parent_path] = node
+        return node
+
+    def get(self, path):
+        """
+        (node, parent) at the normalized path, (None, None) if it doesn't exist
+        """
+        if path == "/":
+            return self.tree, None
+        parent_path, name = self.split(path)
+        parent = self.get_dir(parent_path)
+        if parent is not None:
+            node = parent.children.get(name)
+            if node is not None:
+                return node, parent
+        return None, None
+
+    def remove(self, path):
+        path = self.normalize(path)
+        node = self.dirs.pop(path, None) if path else None
+        if node is not None:
+            stack = [(path, node)]
+            while stack:
+                path, node = stack.pop()
+                for name, child in node.children.items():
+                    if child.type == DIR:
+                        child_path = path + "/" + name if path != "/" else "/" + name
+                        if self.dirs.pop(child_path, None) is not None:
+                            stack.append((child_path, child))
+
+
+class SortedChildren(object):
+    """
+    sorted directory names & file names of the big directories listed so far, kept sorted on every change,
+    a page of a listing is then a slice of them, small directories are just sorted when they are listed
+    """
+    def __init__(self, min_size = 1024):
+        self.min_size = min_size
+        self.indexes = {} # id(directory node) => [directory node, directory names, file names]
+
+    def get(self, node):
+        """
+        (sorted directory names, sorted file names) of the directory node
+        """
+        entry = self.indexes.get(id(node))
+        if entry is None or entry[0] is not node:
+            dir_names = []
+            file_names = []
+            for name, child in node.children.items():
+                if child.type == DIR:
+                    dir_names.append(name)
+                else:
+                    file_names.append(name)
+            dir_names.sort()
+            file_names.sort()
+            entry = [node, dir_names, file_names]
+            if len(node.children) >= self.min_size:
+                self.indexes[id(node)] = entry
+        return entry[1], entry[2]
+
+    def add(self, node, name, child):
+        entry = self.indexes.get(id(node))
+        if entry is not None and entry[0] is node:
+            insort(entry[1] if child.type == DIR else entry[2], name)
+
+    def remove(self, node, name, child):
+        entry = self.indexes.get(id(node))
+        if entry is not None and entry[0] is node:
+            names = entry[1] if child.type == DIR else entry[2]
+            i = bisect_left(names, name)
+            if i < len(names) and names[i] == name:
+                del names[i]
+
+    def remove_tree(self, node):
+        """
+        the directory is deleted, drop the indexes of its subtree
+        """
+        if self.indexes:
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                self.indexes.pop(id(node), None)
+                for child in node.children.values():
+                    if child.type == DIR:
+                        stack.append(child)
+
+    def clear(self):
+        self.indexes = {}
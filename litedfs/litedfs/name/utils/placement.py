@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import random
+import logging
+import importlib
+
+from litedfs.name.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class PlacementPolicy(object):
+    """
+    chooses the data nodes a block's replicas go to,
+    nodes: node id => {"host", "rack", "full", "free", "load"} from the heartbeats, see Connection.get_node_stats,
+    excludes: nodes already holding the block, they are never chosen and their hosts & racks count as used,
+    placement_policy in the configuration is "weighted", "random" or the dotted path of a PlacementPolicy subclass
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if PlacementPolicy._instance is None:
+            name = CONFIG.get("placement_policy", "weighted")
+            if name in POLICIES:
+                policy_cls = POLICIES[name]
+            else:
+                module_name, cls_name = name.rsplit(".", 1)
+                policy_cls = getattr(importlib.import_module(module_name), cls_name)
+            PlacementPolicy._instance = policy_cls()
+            LOG.info("placement policy: %s", policy_cls.__name__)
+        return PlacementPolicy._instance
+
+    def candidates(self, nodes, excludes = ()):
+        return [node_id for node_id in nodes if node_id not in excludes and not nodes[node_id]["full"]]
+
+    def choose(self, nodes, replica, excludes = ()):
+        raise NotImplementedError
+
+
+class RandomPlacementPolicy(PlacementPolicy):
+    def choose(self, nodes, replica, excludes = ()):
+        node_ids = self.candidates(nodes, excludes)
+        return random.sample(node_ids, min(replica, len(node_ids)))
+
+
+class WeightedPlacementPolicy(PlacementPolicy):
+    """
+    a node's chance is its free space, halved for every block per second it is writing,
+    replicas go to different hosts, and to different racks while there are racks left,
+    nodes on a used host are only chosen when there aren't enough hosts
+    """
+    def weight(self, node):
+        return max(node["free"], 0) / (1.0 + node["load"] / CONFIG["block_size"])
+
+    def choose(self, nodes, replica, excludes = ()):
+        result = []
+        node_ids = self.candidates(nodes, excludes)
+        hosts = set(nodes[node_id]["host"] for node_id in excludes if node_id in nodes)
+        racks = set(nodes[node_id]["rack"] for node_id in excludes if node_id in nodes)
+        while len(result) < replica and node_ids:
+            pool = [node_id for node_id in node_ids if nodes[node_id]["host"] not in hosts] or node_ids
+            pool = [node_id for node_id in pool if nodes[node_id]["rack"] not in racks] or pool
+            weights = [self.weight(nodes[node_id]) for node_id in pool]
+            if sum(weights) > 0:
+                node_id = random.choices(pool, weights = weights)[0]
+            else:
+                node_id = random.choice(pool)
+            result.append(node_id)
+            node_ids.remove(node_id)
+            hosts.add(nodes[node_id]["host"])
+            racks.add(nodes[node_id]["rack"])
+        return result
+
+
+POLICIES = {
+    "random": RandomPlacementPolicy,
+    "weighted": WeightedPlacementPolicy,
+}
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+from tornado import ioloop
+
+from litedfs.name.utils.listener import Connection
+from litedfs.name.utils.placement import PlacementPolicy
+from litedfs.name.config import CONFIG
+
+LOG = logging.getLogger(__name__)
+
+
+class Replicator(object):
+    """
+    re-replicate the under replicated blocks found by the block map,
+    blocks with fewer live replicas go first, every node takes part in at most replication_streams copies at a time,
+    a copy counts as done when the block report of its target node shows the block
+    """
+    _instance = None
+    name = "replicator"
+
+    def __new__(cls, fs, interval = 10):
+        if not cls._instance:
+            cls._instance = object.__new__(cls)
+            cls._instance.fs = fs
+            cls._instance.interval = interval
+            cls._instance.ready_time = None
+            cls._instance.pending = {} # (file_id, block_id) => [expire time, source node id, target node ids]
+            cls._instance.streams = {} # node id => copies in flight
+            cls._instance.ioloop_service()
+        return cls._instance
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def ioloop_service(self):
+        self.periodic_replicate_service = ioloop.PeriodicCallback(
+            self.replicate_service,
+            self.interval * 1000
+        )
+        self.periodic_replicate_service.start()
+
+    def acquire(self, node_id):
+        self.streams[node_id] = self.streams.get(node_id, 0) + 1
+
+    def release(self, node_id):
+        if node_id in self.streams:
+            self.streams[node_id] -= 1
+            if self.streams[node_id] <= 0:
+                del self.streams[node_id]
+
+    def finish(self, key):
+        _, source_node_id, target_node_ids = self.pending.pop(key)
+        self.release(source_node_id)
+        for node_id in target_node_ids:
+            self.release(node_id)
+
+    def check_pending(self):
+        block_map = self.fs.block_map
+        now = time.time()
+        for key in list(self.pending.keys()):
+            expire_time, source_node_id, target_node_ids = self.pending[key]
+            replica_nodes = block_map.replica_nodes(*key)
+            done_node_ids = [node_id for node_id in target_node_ids if node_id in replica_nodes]
+            if len(done_node_ids) == len(target_node_ids) or key not in block_map.under_replicated:
+                if done_node_ids:
+                    self.fs.add_block_nodes(key[0], key[1], done_node_ids)
+                self.finish(key)
+                LOG.debug("replicate block: %s to nodes: %s done", key, done_node_ids)
+            elif expire_time < now:
+                if done_node_ids:
+                    self.fs.add_block_nodes(key[0], key[1], done_node_ids)
+                self.finish(key)
+                LOG.warning("replicate block: %s to nodes: %s timeout, done: %s", key, target_node_ids, done_node_ids)
+
+    def schedule(self):
+        result = 0
+        block_map = self.fs.block_map
+        max_streams = CONFIG.get("replication_streams", 4)
+        data_nodes = Connection.get_node_stats()
+        policy = PlacementPolicy.instance()
+        free_node_ids = [node_id for node_id in data_nodes if self.streams.get(node_id, 0) < max_streams]
+        if len(free_node_ids) < 2:
+            return result
+        # fewest live replicas first, a block without any live replica can't be copied
+        for key, live in sorted(block_map.under_replicated.items(), key = lambda item: item[1]):
+            if live == 0 or key in self.pending:
+                continue
+            file_info = self.fs.files.get(key[0])
+            if file_info is None:
+                continue
+            replica_nodes = block_map.replica_nodes(*key)
+            source_node_ids = [node_id for node_id in replica_nodes if node_id in data_nodes and self.streams.get(node_id, 0) < max_streams]
+            # busy nodes can't take a copy, the holders stay in to tell the policy their hosts & racks
+            nodes = {
+                node_id: data_nodes[node_id] for node_id in data_nodes
+                if node_id in replica_nodes or self.streams.get(node_id, 0) < max_streams
+            }
+            target_node_ids = policy.choose(nodes, file_info["replica"] - len(replica_nodes), excludes = replica_nodes)
+            if source_node_ids and target_node_ids:
+                source_node_id = min(source_node_ids, key = lambda node_id: self.streams.get(node_id, 0))
+                task = {"command": "replicate", "name": key[0], "block": key[1], "ids": target_node_ids}
+                Connection.push_urgent_task(source_node_id, task)
+                self.pending[key] = [time.time() + CONFIG.get("replication_timeout", 600), source_node_id, target_node_ids]
+                self.acquire(source_node_id)
+                for node_id in target_node_ids:
+                    self.acquire(node_id)
+                result += 1
+                if all(self.streams.get(node_id, 0) >= max_streams for node_id in data_nodes):
+                    break
+        return result
+
+    def replicate_service(self):
+        try:
+            if self.fs.status == "ready":
+                now = time.time()
+                if self.ready_time is None:
+                    self.ready_time = now
+                # give the data nodes time to register and send their full block reports
+                if now - self.ready_time >= CONFIG.get("replication_grace_period", 60):
+                    self.check_pending()
+                    n = self.schedule()
+                    if n:
+                        LOG.info("schedule replicate tasks: %s, in flight: %s, under replicated blocks: %s",
+                                 n, len(self.pending), len(self.fs.block_map.under_replicated))
+        except Exception as e:
+            LOG.exception(e)
+
+    def close(self):
+        self.periodic_replicate_service.stop()
@@ -159,9 +159,13 @@ def main():
     parser_directory_list.add_argument("-r", "--remote-path", required = True, help = "remote directory path", default = "")
     parser_directory_list.add_argument("-o", "--offset", help = "list offset", type = int, default = 0)
     parser_directory_list.add_argument("-l", "--limit", help = "list limit", type = int, default = 0)
+    parser_directory_list.add_argument("-a", "--start-after", help = "list the children after this name, the next page starts after the last name printed", default = "")
     parser_directory_list.add_argument("-f", "--exclude-file", help = "exclude file", action = "store_false")
     parser_directory_list.add_argument("-d", "--exclude-directory", help = "exclude directory", action = "store_false")
 
+    parser_directory_summary = subparsers_directory.add_parser("summary", help = "total size, files, directories and blocks under a directory")
+    parser_directory_summary.add_argument("-r", "--remote-path", required = True, help = "remote directory path", default = "")
+
     # operate with cluster
     parser_cluster = subparsers.add_parser("cluster", help = "operate with cluster API")
     subparsers_cluster = parser_cluster.add_subparsers(dest = "operation", help = 'sub-command cluster help')
@@ -169,6 +173,11 @@ def main():
     parser_cluster_info = subparsers_cluster.add_parser("info", help = "cluster's info")
     parser_cluster_info.add_argument("-r", "--raw", help = "display raw json data", action = "store_true")
 
+    parser_cluster_balance = subparsers_cluster.add_parser("balance", help = "move blocks from the most used data nodes to the least used ones")
+    parser_cluster_balance.add_argument("command", help = "start, stop or status", choices = ["start", "stop", "status"])
+    parser_cluster_balance.add_argument("-t", "--threshold", help = "max distance of a node's utilization from the cluster's average, default: 0.1", type = float, default = None)
+    parser_cluster_balance.add_argument("-b", "--bandwidth", help = "max bytes moved per second, default: 10485760", type = int, default = None)
+
     # operate with path(file or directory)
     parser_path = subparsers.add_parser("path", help = "operate with path API")
     subparsers_path = parser_path.add_subparsers(dest = "operation", help = 'sub-command path help')
@@ -301,17 +310,33 @@ def main():
                 elif operation == "list":
                     if args.remote_path:
                         try:
-                            r = ldfs.list_directory(args.remote_path, offset = args.offset, limit = args.limit, include_file = args.exclude_file, include_directory = args.exclude_directory)
+                            r = ldfs.list_directory(args.remote_path, offset = args.offset, limit = args.limit, include_file = args.exclude_file, include_directory = args.exclude_directory, start_after = args.start_after)
                             if r:
                                 print_table_result(
                                     r["children"],
                                     ["id", "type", "size", "name"],
                                     args
                                 )
+                                if r.get("next_start_after"):
+                                    print("next start after: %s" % r["next_start_after"])
                             else:
                                 print("list directory[%s] failed" % args.remote_path)
                         except Exception as e:
                             print(e)
+                elif operation == "summary":
+                    if args.remote_path:
+                        try:
+                            r = ldfs.summary(args.remote_path)
+                            if r:
+                                print_table_result(
+                                    [r["summary"]],
+                                    ["size", "files", "directories", "blocks"],
+                                    args
+                                )
+                            else:
+                                print("get directory[%s]'s summary failed" % args.remote_path)
+                        except Exception as e:
+                            print(e)
             if object == "path":
                 if operation == "info":
                     if args.remote_path:
@@ -363,6 +388,26 @@ def main():
                                 )
                     else:
                         print("get cluster info failed") 
+                elif operation == "balance":
+                    try:
+                        if args.command == "status":
+                            r = ldfs.balance()
+                        else:
+                            r = ldfs.balance(args.command, threshold = args.threshold, bandwidth = args.bandwidth)
+                        if r:
+                            balancer = r["balancer"]
+                            print("running: %s, threshold: %s, bandwidth: %s, moving blocks: %s, moved blocks: %s, moved bytes: %s" % (
+                                balancer["running"], balancer["threshold"], balancer["bandwidth"],
+                                balancer["moving_blocks"], balancer["moved_blocks"], balancer["moved_bytes"]))
+                            print_table_result(
+                                [{"id": node_id, "utilization": "%.2f%%" % (balancer["utilization"][node_id] * 100)} for node_id in sorted(balancer["utilization"], key = int)],
+                                ["id", "utilization"],
+                                args
+                            )
+                        else:
+                            print("cluster balance %s failed" % args.command)
+                    except Exception as e:
+                        print(e)
     except Exception as e:
         logging.error(logging.traceback.format_exc())
 
@@ -185,6 +185,12 @@ function remoteStorageInit (manager_host) {
             $table_header.css({"margin-right": 0});
         }
 
+        if (data.summary) {
+            $('#remote-manager #remote-summary').text(data.summary.size + ', ' + data.summary.files + ' files, ' + data.summary.directories + ' directories');
+        } else {
+            $('#remote-manager #remote-summary').text('');
+        }
+
         generatePagination('#remote-manager #ul-pagination', current_page, current_page_size, 5, data.total);
         $('#remote-manager a.page-num').bind('click', changePage);
         $('#remote-manager a.previous-page').bind('click', previousPage);
@@ -8,7 +8,7 @@ import datetime
 import zipfile
 
 from litedfs_client.client import LiteDFSClient
-from litedfs.tool.viewer.utils.common import joinpath, splitpath, listsort, sha1sum
+from litedfs.tool.viewer.utils.common import joinpath, splitpath, listsort, sha1sum, get_file_size
 from litedfs.tool.viewer.config import CONFIG
 
 LOG = logging.getLogger(__name__)
@@ -25,6 +25,19 @@ class RemoteStorage(object):
     def cluster_info(self):
         return self.client.cluster_info()
 
+    def summary(self, dir_path):
+        """
+        total size, files, directories and blocks under the directory, kept by the name node
+        """
+        result = {}
+        try:
+            r = self.client.summary(dir_path)
+            if r:
+                result = r["summary"]
+        except Exception as e:
+            LOG.exception(e)
+        return result
+
     def listdir(self, dir_path, sort_by = "name", desc = False, offset = 0, limit = -1):
         dirs = []
         files = []
@@ -115,6 +128,10 @@ class RemoteStorage(object):
                     data["dir_path"] = splitpath(dir_path)
                     data["home_path"] = splitpath(home_path)
                     data["home_path_string"] = home_path
+                    summary = self.summary(dir_path)
+                    if summary:
+                        summary["size"] = get_file_size(summary["size"])
+                        data["summary"] = summary
         except Exception as e:
             LOG.exception(e)
         return data
@@ -135,6 +152,24 @@ class RemoteStorage(object):
             LOG.exception(e)
         return result
 
+    def mkdirs(self, dir_paths, batch_size = 1000):
+        """
+        create many directories with one batch request per batch_size directories
+        """
+        result = False
+        try:
+            result = True
+            for i in range(0, len(dir_paths), batch_size):
+                results = self.client.batch([{"op": "mkdir", "path": dir_path} for dir_path in dir_paths[i:i + batch_size]])
+                for dir_path, r in zip(dir_paths[i:i + batch_size], results):
+                    if r["result"] != "ok":
+                        LOG.error("create directory[%s] failed: %s", dir_path, r["result"])
+                        result = False
+        except Exception as e:
+            LOG.exception(e)
+            result = False
+        return result
+
     def delete_file(self, file_path):
         result = False
         try:
@@ -191,13 +226,23 @@ class RemoteStorage(object):
             LOG.exception(e)
         return result
 
+    def open_remote_file(self, file_path):
+        return self.client.open_remote_file(
+            file_path,
+            page_size = CONFIG.get("remote_file_page_size", 4194304),
+            cache_size = CONFIG.get("remote_file_cache_size", 67108864)
+        )
+
     def preview_zip_file(self, file_path):
         result = False
         try:
-            fp = self.client.open_remote_file(file_path)
+            fp = self.open_remote_file(file_path)
             if fp:
-                z = zipfile.ZipFile(fp)
-                result = z.namelist()
+                try:
+                    with zipfile.ZipFile(fp) as z:
+                        result = z.namelist()
+                finally:
+                    fp.close()
         except Exception as e:
             LOG.exception(e)
         return result
@@ -205,9 +250,12 @@ class RemoteStorage(object):
     def preview_text_file(self, file_path):
         result = False
         try:
-            fp = self.client.open_remote_file(file_path)
+            fp = self.open_remote_file(file_path)
             if fp:
-                result = fp.read().decode()
+                try:
+                    result = fp.read().decode()
+                finally:
+                    fp.close()
         except Exception as e:
             LOG.exception(e)
         return result
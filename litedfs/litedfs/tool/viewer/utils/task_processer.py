@@ -120,14 +120,19 @@ def download_directory(dir, remote_path, local_path, handler):
     MessageQueue.put([handler, msg])
 
 
-def upload_directory(dir, local_path, remote_path, handler, replica = 1):
+def upload_directory(dir, local_path, remote_path, handler, replica = 1, mkdirs = True):
     source_path = os.path.join(local_path, dir["name"])
     target_path = os.path.join(remote_path, dir["name"])
-    handler.client.mkdir(target_path)
+    if mkdirs: # the whole remote directory tree with one batch request, instead of one request per directory
+        dir_paths = [target_path]
+        for root, dirs, _ in os.walk(source_path):
+            for d in sorted(dirs):
+                dir_paths.append(os.path.join(target_path, os.path.relpath(os.path.join(root, d), source_path)))
+        handler.client.mkdirs(dir_paths)
     items, _ = listdir(source_path)
     for item in items:
         if item["type"] == "Directory":
-            upload_directory(item, source_path, target_path, handler, replica = replica)
+            upload_directory(item, source_path, target_path, handler, replica = replica, mkdirs = False)
         else:
             msg = {"cmd": "info"}
             try:
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+from tornado import ioloop, gen
+
+from litedfs.name.utils.namespace import Root
+
+
+def recover(fs):
+    """
+    drop the in memory tree and rebuild it from the fsimage and the editlog, like a name node restart
+    """
+    ioloop.IOLoop.current().run_sync(fs.sync)
+    fs.close()
+    fs.tree = Root()
+    fs.files = {}
+    fs.editlog = None
+    fs.segment = 0
+    ioloop.IOLoop.current().run_sync(fs.recover)
+    # the files of replayed directory deletes go away in the background
+    ioloop.IOLoop.current().run_sync(lambda: gen.sleep(0.1))
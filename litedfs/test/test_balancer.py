@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import gen, ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.utils.namespace import Root
+from litedfs.name.utils.listener import Connection
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+G = 1024 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+class FakeNode(object):
+    def __init__(self, id, used, total):
+        self.id = id
+        self.info = {
+            "http_host": "10.0.0.%s" % id,
+            "http_port": 8002,
+            "storage_full": False,
+            "storage_free": total - used,
+            "storage_used": used,
+            "storage_total": total,
+        }
+
+
+def add_node(id, used, total):
+    Connection.clients_dict["node_%s" % id] = FakeNode(id, used, total)
+
+
+def create_files(fs, n):
+    now = int(time.time())
+    blocks = {}
+    for i in range(n):
+        file_id = "f_%05d" % i
+        fs.create("/balance/%s.txt" % file_id, {"id": file_id, "size": BLOCK_SIZE, "replica": 2, "current_replica": 2, "ctime": now, "mtime": now, "blocks": [[0, BLOCK_SIZE, [1, 2]]]})
+        blocks[file_id] = [0]
+    for node_id in (1, 2):
+        fs.block_map.report(node_id, {"type": "full", "blocks": blocks, "first": True, "last": True})
+
+
+@gen.coroutine
+def balance():
+    fs = FileSystemTree()
+    yield fs.recover()
+    create_files(fs, 20)
+    add_node(1, 90 * G, 100 * G)
+    add_node(2, 90 * G, 100 * G)
+    add_node(3, 0, 100 * G) # the new node
+    balancer = fs.balancer
+    balancer.start(threshold = 0.1, bandwidth = 40 * 1024 * 1024)
+    n = balancer.schedule()
+    LOG.info("scheduled: %s blocks, moves: %s", n // BLOCK_SIZE, sorted((key[0], move[1], move[2]) for key, move in balancer.moves.items()))
+    LOG.info("replicate tasks: %s", {node_id: len(Connection.tasks.get(node_id, [])) for node_id in (1, 2, 3)})
+    # the moves in flight share the bandwidth
+    LOG.info("replicate bandwidth: %s", sum(task["bandwidth"] for node_id in (1, 2) for task in Connection.tasks.get(node_id, []) if task["command"] == "replicate"))
+    moves = list(balancer.moves.items())
+    for key, move in moves:
+        fs.block_map.report(move[2], {"type": "incremental", "added": {key[0]: [key[1]]}, "removed": {}})
+    balancer.check_moves()
+    LOG.info("moved: %s, moving: %s, block nodes: %s", balancer.moved_blocks, len(balancer.moves), [fs.files[key[0]]["blocks"][0][2] for key, _ in moves])
+    LOG.info("delete tasks: %s", [task for node_id in (1, 2) for task in Connection.tasks.get(node_id, []) if task["command"] == "delete"])
+    status = balancer.status()
+    LOG.info("status: %s", status)
+    # a replica only the block reports know about gets a delete task too
+    now = int(time.time())
+    fs.create("/balance/orphan.txt", {"id": "orphan", "size": BLOCK_SIZE, "replica": 1, "current_replica": 1, "ctime": now, "mtime": now, "blocks": [[0, BLOCK_SIZE, [1]]]})
+    fs.block_map.report(3, {"type": "incremental", "added": {"orphan": [0]}, "removed": {}})
+    fs.delete("/balance/orphan.txt")
+    LOG.info("orphan delete tasks: %s", [node_id for node_id in (1, 2, 3) if any(task["command"] == "delete" and task["name"] == "orphan" for task in Connection.tasks.get(node_id, []))])
+    expected = {key[0]: list(fs.files[key[0]]["blocks"][0][2]) for key, _ in moves}
+    yield fs.sync()
+    fs.close()
+    fs.tree = Root()
+    fs.files = {}
+    fs.editlog = None
+    fs.segment = 0
+    yield fs.recover()
+    LOG.info("placement recovered: %s", {file_id: fs.files[file_id]["blocks"][0][2] for file_id in expected} == expected)
+    balancer.stop()
+    fs.close()
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_balancer.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "balancer_data")
+        CONFIG["block_size"] = BLOCK_SIZE
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+        ioloop.IOLoop.current().run_sync(balance)
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
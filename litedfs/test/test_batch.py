@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.utils.namespace import Root
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def count_commits(editlog):
+    """
+    count the batches the editlog writes and the lines in them
+    """
+    counts = {"batches": 0, "lines": 0}
+    write_batch = editlog.write_batch
+    def wrapper(lines):
+        counts["batches"] += 1
+        counts["lines"] += lines.count("\n")
+        return write_batch(lines)
+    editlog.write_batch = wrapper
+    return counts
+
+
+def tree_operations(n):
+    operations = []
+    for i in range(n):
+        operations.append({"op": "mkdir", "path": "/upload/d_%03d/sub" % i})
+        operations.append({"op": "create", "path": "/upload/d_%03d/f.txt" % i, "id": "id_%s" % i, "size": 1, "replica": 1, "blocks": [[0, 1, [1]]]})
+    return operations
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_batch.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "batch_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        counts = count_commits(fs.editlog)
+        t = time.time()
+        results = fs.batch(tree_operations(100))
+        ioloop.IOLoop.current().run_sync(fs.sync)
+        LOG.info("batch 200 operations: %.3fs, all ok: %s, editlog: %s", time.time() - t, all(r["result"] == "ok" for r in results), counts)
+
+        results = fs.batch([
+            {"op": "stat", "path": "/upload/d_000/f.txt"},
+            {"op": "stat", "path": "/upload"},
+            {"op": "stat", "path": "/missing"},
+            {"op": "rename", "path": "/upload/d_000/f.txt", "new_name": "g.txt"},
+            {"op": "move", "source_path": "/upload/d_000/g.txt", "target_path": "/upload/d_001/sub"},
+            {"op": "create", "path": "/upload/d_001/f.txt", "id": "id_x", "size": 1},
+            {"op": "move", "source_path": "/upload/d_002", "target_path": "/missing"},
+            {"op": "rename", "path": "/missing", "new_name": "x"},
+            {"op": "mkdir", "path": "/upload/d_003/f.txt"},
+            {"op": "delete", "path": "/upload/d_004"},
+            {"op": "mkdir", "path": "relative"},
+            {"op": "chmod", "path": "/upload"},
+        ])
+        ioloop.IOLoop.current().run_sync(fs.sync)
+        LOG.info("file stat: %s", results[0]["info"])
+        LOG.info("directory stat: %s", results[1]["info"])
+        LOG.info("missing stat: %s", results[2]["info"])
+        LOG.info("results: %s", [r["result"] for r in results[3:]])
+        LOG.info("moved: %s, deleted: %s, editlog: %s", fs.isfile("/upload/d_001/sub/g.txt"), not fs.exists("/upload/d_004"), counts)
+
+        # a path being uploaded is refused, only the locks the batch took are released
+        fs.set_file_lock("/upload/locked.txt")
+        locks = []
+        results = fs.batch([
+            {"op": "create", "path": "/upload/locked.txt", "id": "id_locked", "size": 1},
+            {"op": "create", "path": "/upload/free.txt", "id": "id_free", "size": 1},
+        ], locks)
+        ioloop.IOLoop.current().run_sync(fs.sync)
+        for file_path in locks:
+            fs.unset_file_lock(file_path)
+        LOG.info("locked results: %s, taken: %s, locks: %s", [r["result"] for r in results], locks, list(fs.locks))
+        fs.unset_file_lock("/upload/locked.txt")
+
+        expected = fs.summary("/upload")
+        fs.close()
+        fs.tree = Root()
+        fs.files = {}
+        fs.editlog = None
+        fs.segment = 0
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        LOG.info("after recover: %s", fs.summary("/upload") == expected)
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import logging
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.data.utils.block_index import BlockIndex
+from litedfs.data.utils.common import bytes_md5sum, delete_block, delete_file
+from litedfs.data.config import CONFIG
+from litedfs.data import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def write_block(name, block, content):
+    dir_path = os.path.join(CONFIG["data_path"], "files", name[:2], name[2:4])
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    with open(os.path.join(dir_path, "%s_%s.blk" % (name, block)), "wb") as fp:
+        fp.write(content)
+    with open(os.path.join(dir_path, "%s_%s.chk" % (name, block)), "w") as fp:
+        fp.write(bytes_md5sum(content))
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_block_index.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "block_index_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+        CONFIG["block_index_size"] = 3
+        CONFIG["block_index_file"] = True
+
+        for i in range(4):
+            write_block("file_%s" % i, 0, b"x" * (i + 1))
+        write_block("file_0", 1, b"y" * 10)
+        LOG.info("lazy load: %s, missing: %s", BlockIndex.get("file_0", 0) == (bytes_md5sum(b"x"), 1), BlockIndex.get("file_9", 0))
+        for i in range(1, 4):
+            BlockIndex.get("file_%s" % i, "0")
+        LOG.info("least recently read dropped: %s", list(BlockIndex.blocks))
+
+        # the index is used without reading the .chk file again
+        os.remove(os.path.join(CONFIG["data_path"], "files", "fi", "le", "file_3_0.chk"))
+        LOG.info("cached: %s", BlockIndex.get("file_3", 0) == (bytes_md5sum(b"xxxx"), 4))
+        delete_block("file_3", 0)
+        delete_file("file_0")
+        LOG.info("deleted: %s, %s, %s", BlockIndex.get("file_3", 0), BlockIndex.get("file_0", 1), list(BlockIndex.blocks))
+
+        BlockIndex.add("file_5", 0, "0" * 32, 100)
+        expected = list(BlockIndex.blocks.items())
+        BlockIndex.save()
+        BlockIndex.clear()
+        BlockIndex.load()
+        LOG.info("after load: %s, index file removed: %s", list(BlockIndex.blocks.items()) == expected, not os.path.exists(BlockIndex.path()))
+
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.utils.namespace import Root
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def create_files(fs, prefix, n):
+    now = int(time.time())
+    for i in range(n):
+        file_id = "%s_%s" % (prefix, i)
+        fs.create("/%s/f_%05d.txt" % (prefix, i), {"id": file_id, "size": 1, "ctime": now, "mtime": now, "blocks": []})
+
+
+def snapshot(fs):
+    return json.dumps([fs.tree.to_dict(), {file_id: fs.files[file_id].to_dict() for file_id in fs.files}], sort_keys = True)
+
+
+def restart(fs):
+    fs.close()
+    fs.tree = Root()
+    fs.files = {}
+    fs.editlog = None
+    fs.segment = 0
+    ioloop.IOLoop.current().run_sync(fs.recover)
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_checkpoint.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "checkpoint_data")
+        CONFIG["checkpoint_editlog_size"] = 1024
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        create_files(fs, "a", 1000)
+        ioloop.IOLoop.current().run_sync(fs.sync)
+        fs.checkpoint_service()
+        LOG.info("checkpoint started: %s, segment: %s", fs.checkpoint_pid is not None, fs.checkpoint_segment)
+        create_files(fs, "b", 10) # goes to the new editlog while the child is writing
+        while fs.checkpoint_pid is not None:
+            time.sleep(0.1)
+            fs.checkpoint_service()
+        LOG.info("files after checkpoint: %s", sorted(os.listdir(CONFIG["data_path"])))
+        expected = snapshot(fs)
+        restart(fs)
+        LOG.info("recover after checkpoint: %s", snapshot(fs) == expected)
+
+        # crash after the new fsimage replaced the old one, but before the segments are removed
+        create_files(fs, "c", 10)
+        segment = fs.roll_editlog()
+        ioloop.IOLoop.current().run_sync(lambda: fs.write_fsimage(os.path.join(CONFIG["data_path"], "fsimage.new"), segment))
+        fs.replace_fsimage()
+        expected = snapshot(fs)
+        restart(fs)
+        LOG.info("recover with merged segment left: %s, files: %s", snapshot(fs) == expected, sorted(os.listdir(CONFIG["data_path"])))
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.utils.namespace import Root
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def walk_summary(fs, path):
+    """
+    what a client had to do before, list every directory under the path
+    """
+    result = {"size": 0, "files": 0, "directories": 0, "blocks": 0}
+    stack = [path]
+    while stack:
+        dir_path = stack.pop()
+        for child in fs.list_dir(dir_path)["files"]:
+            child_path = os.path.join(dir_path, child["name"])
+            if child["type"] == "directory":
+                result["directories"] += 1
+                stack.append(child_path)
+            else:
+                result["files"] += 1
+                result["size"] += child["size"]
+                result["blocks"] += len(fs.files[child["id"]]["blocks"])
+    return result
+
+
+def create_file(fs, file_path, file_id, size):
+    now = int(time.time())
+    blocks = []
+    block_id = 0
+    while size > 0:
+        blocks.append([block_id, min(size, BLOCK_SIZE), [1]])
+        size -= BLOCK_SIZE
+        block_id += 1
+    fs.create(file_path, {"id": file_id, "size": sum(block[1] for block in blocks), "replica": 1, "current_replica": 1, "ctime": now, "mtime": now, "blocks": blocks})
+
+
+def check(fs, paths):
+    return all(fs.summary(path) == walk_summary(fs, path) for path in paths)
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_directory_summary.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "directory_summary_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        t = time.time()
+        n = 0
+        for i in range(20):
+            for j in range(10):
+                for k in range(50):
+                    create_file(fs, "/data/d_%02d/s_%02d/f_%03d.bin" % (i, j, k), "f_%s" % n, (n % 7) * 30000000 + 1)
+                    n += 1
+        LOG.info("create %s files: %.3fs", n, time.time() - t)
+        paths = ["/", "/data", "/data/d_01", "/data/d_02/s_03"]
+        t = time.time()
+        summary = fs.summary("/data")
+        LOG.info("summary: %s, use: %.6fs", summary, time.time() - t)
+        t = time.time()
+        summary = walk_summary(fs, "/data")
+        LOG.info("walk: %s, use: %.3fs", summary, time.time() - t)
+        LOG.info("after create: %s", check(fs, paths))
+
+        fs.delete("/data/d_00/s_00/f_000.bin")
+        fs.delete("/data/d_00/s_01")
+        fs.makedirs("/data/d_00/new/x/y")
+        LOG.info("after delete & makedirs: %s", check(fs, paths + ["/data/d_00"]))
+        fs.move("/data/d_01/s_00", "/data/d_00/new")
+        fs.move("/data/d_01/s_01/f_000.bin", "/")
+        fs.rename("/data/d_00/new/s_00", "s_10")
+        LOG.info("after move & rename: %s", check(fs, paths + ["/data/d_00", "/data/d_00/new/s_10"]))
+        fs.copy("/data/d_03/s_00", "/data/d_04/s_01")
+        fs.copy("/data/d_03/s_01/f_001.bin", "/data/d_04")
+        LOG.info("after copy: %s", check(fs, paths + ["/data/d_04", "/data/d_04/s_01"]))
+        file_info = fs.get_file_info("/data/d_05/s_00/f_000.bin")
+        create_file(fs, "/tmp/f.bin", "tmp", 3 * BLOCK_SIZE)
+        file_info["size"] = fs.files["tmp"]["size"]
+        file_info["blocks"] = fs.files["tmp"]["blocks"]
+        fs.update_file_info("/data/d_05/s_00/f_000.bin", file_info)
+        LOG.info("after update file info: %s", check(fs, paths + ["/data/d_05", "/tmp"]))
+        LOG.info("file summary: %s", fs.summary("/tmp/f.bin"))
+
+        expected = {path: fs.summary(path) for path in paths}
+        ioloop.IOLoop.current().run_sync(fs.sync)
+        fs.close()
+        fs.tree = Root()
+        fs.files = {}
+        fs.editlog = None
+        fs.segment = 0
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        LOG.info("after recover: %s", all(fs.summary(path) == expected[path] for path in paths))
+        r = fs.list_dir("/data", limit = 2)
+        LOG.info("list: %s", [(child["name"], child["size"], child["files"], child["directories"]) for child in r["files"]])
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import logging
+
+from tornado import gen, ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.append_log import AppendLogJson, EditLog
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+class CountedEditLog(EditLog):
+    batches = 0
+
+    def write_batch(self, lines):
+        CountedEditLog.batches += 1
+        return EditLog.write_batch(self, lines)
+
+
+@gen.coroutine
+def mutation(editlog, i):
+    editlog.writeline({"c": "c", "p": "/test/f_%05d.txt" % i})
+    success = yield editlog.sync()
+    return success
+
+
+@gen.coroutine
+def group_commit(log_path, n, durability):
+    editlog = CountedEditLog(log_path, durability)
+    results = yield [mutation(editlog, i) for i in range(n)]
+    editlog.close()
+    return all(results)
+
+
+def line_commit(log_path, n):
+    editlog = AppendLogJson(log_path)
+    for i in range(n):
+        editlog.writeline({"c": "c", "p": "/test/f_%05d.txt" % i})
+        os.fsync(editlog.log_file.fileno())
+    editlog.close()
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_editlog.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        log_path = os.path.join(cwd, "test_editlog.log")
+        n = 2000
+
+        t = time.time()
+        line_commit(log_path, n)
+        LOG.info("fsync per line: %s lines, %.3fs", n, time.time() - t)
+        os.remove(log_path)
+
+        for durability in ("none", "flush", "fsync"):
+            CountedEditLog.batches = 0
+            t = time.time()
+            success = ioloop.IOLoop.current().run_sync(lambda: group_commit(log_path, n, durability))
+            lines = len(list(AppendLogJson(log_path).iterlines()))
+            LOG.info("group commit %s: %s lines, %s batches, %.3fs, acknowledged: %s, written: %s",
+                     durability, n, CountedEditLog.batches, time.time() - t, success, lines == n)
+            os.remove(log_path)
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
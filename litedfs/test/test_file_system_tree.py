@@ -43,7 +43,9 @@ if __name__ == "__main__":
         # fs.move("/a/b/c/d/e/f.txt", "/a/b")
         # fs.delete("/a/b/f.txt")
         # LOG.debug("%s", json.dumps(fs.files, indent = 4))
-        LOG.debug("%s", json.dumps(fs.get_info("/"), indent = 4))
+        info = fs.get_info("/")
+        info[2] = info[2].to_dict()
+        LOG.debug("%s", json.dumps(info, indent = 4))
         # LOG.debug("%s", fs.dump_fsimage())
         # LOG.debug("%s", json.dumps(fs.get_info("/a/b/c/d"), indent = 4))
         # LOG.debug("%s", json.dumps(fs.list_dir("/a/b/c/d/e", recursive = True), indent = 4))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree, F, C
+from litedfs.name.utils.fs_image import FsImage
+from litedfs.name.utils.namespace import Root
+from litedfs.name.utils.append_log import AppendLogJson
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def build_tree(fs, dirs, files_per_dir):
+    now = int(time.time())
+    for i in range(dirs):
+        for j in range(files_per_dir):
+            file_id = "%s_%s" % (i, j)
+            file_info = {"id": file_id, "size": 1024, "ctime": now, "mtime": now, "replica": 1, "current_replica": 1, "blocks": [[0, 1024, [1], "d41d8cd98f00b204e9800998ecf8427e"]]}
+            fs.create("/data/d_%04d/sub/f_%05d.txt" % (i, j), file_info, recover = True)
+
+
+def write_json_fsimage(fs, fsimage_path):
+    fsimage = AppendLogJson(fsimage_path)
+    stack = [("/", fs.tree)]
+    while stack:
+        path, node = stack.pop()
+        for name, child in node.children.items():
+            child_path = os.path.join(path, name)
+            if child.type == F.dir:
+                fsimage.writeline({F.cmd: C.makedir, F.path: child_path, F.info: child.info})
+                stack.append((child_path, child))
+            else:
+                fsimage.writeline({F.cmd: C.create, F.path: child_path, F.info: child.to_dict()})
+    fsimage.close()
+
+
+def tree_json(fs):
+    return json.dumps(fs.tree.to_dict(), sort_keys = True)
+
+
+def files_json(fs):
+    return json.dumps({file_id: fs.files[file_id].to_dict() for file_id in fs.files}, sort_keys = True)
+
+
+def reset(fs):
+    fs.tree = Root()
+    fs.files = {}
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_fsimage.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "fsimage_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+        fsimage_path = os.path.join(CONFIG["data_path"], "fsimage")
+
+        fs = FileSystemTree()
+        build_tree(fs, 100, 1000)
+        tree = tree_json(fs)
+        files = files_json(fs)
+
+        write_json_fsimage(fs, fsimage_path)
+        reset(fs)
+        t = time.time()
+        ioloop.IOLoop.current().run_sync(fs.load_fsimage)
+        LOG.info("json fsimage: %s bytes, load: %.3fs, same: %s",
+                 os.path.getsize(fsimage_path), time.time() - t,
+                 files_json(fs) == files)
+
+        ioloop.IOLoop.current().run_sync(lambda: fs.write_fsimage(fsimage_path))
+        LOG.info("binary fsimage: %s", FsImage.is_fsimage(fsimage_path))
+        reset(fs)
+        t = time.time()
+        ioloop.IOLoop.current().run_sync(fs.load_fsimage)
+        LOG.info("binary fsimage: %s bytes, load: %.3fs, same: %s",
+                 os.path.getsize(fsimage_path), time.time() - t,
+                 tree_json(fs) == tree and files_json(fs) == files)
+
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import logging
+from base64 import b64encode, b64decode
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+from fs_helper import recover
+
+LOG = logging.getLogger(__name__)
+
+
+def inline_create(path, content, **kwargs):
+    operation = {"op": "create", "path": path, "id": path.replace("/", "_"), "inline": b64encode(content).decode("utf-8")}
+    operation.update(kwargs)
+    return operation
+
+
+def inline_state(fs):
+    return {file_id: (fs.files[file_id]["size"], fs.files[file_id]["checksum"], b64decode(fs.files[file_id]["inline"])) for file_id in fs.files if "inline" in fs.files[file_id]}
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_inline_file.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "inline_file_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        CONFIG["inline_file_size"] = 0
+        results = fs.batch([inline_create("/off.txt", b"off")])
+        assert [r["result"] for r in results] == ["InvalidParameters"], results
+
+        CONFIG["inline_file_size"] = 1024
+        results = fs.batch([inline_create("/t/f_%03d.txt" % i, b"x" * i) for i in range(100)])
+        assert all(r["result"] == "ok" for r in results), results
+        results = fs.batch([
+            inline_create("/t/big.txt", b"x" * 1025),
+            inline_create("/t/blocks.txt", b"x", blocks = [[0, 1, [1]]]),
+            {"op": "create", "path": "/t/bad.txt", "id": "bad", "inline": "not base64!"},
+            inline_create("/t/f_001.txt", b"y"),
+        ])
+        assert [r["result"] for r in results] == ["InvalidParameters", "InvalidParameters", "InvalidParameters", "SameNameExists"], results
+        file_info = fs.get_file_info("/t/f_010.txt")
+        assert file_info["size"] == 10 and file_info["blocks"] == [] and b64decode(file_info["inline"]) == b"x" * 10, file_info
+        assert fs.summary("/t") == {"size": 4950, "files": 100, "directories": 0, "blocks": 0}, fs.summary("/t")
+
+        fs.delete("/t/f_000.txt")
+        fs.rename("/t/f_001.txt", "g.txt")
+        expected = inline_state(fs)
+        assert len(expected) == 99
+        recover(fs)
+        assert inline_state(fs) == expected
+        recover(fs)
+        assert inline_state(fs) == expected
+        assert fs.summary("/t") == {"size": 4950, "files": 99, "directories": 0, "blocks": 0}, fs.summary("/t")
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+        sys.exit(1)
+
+    LOG.info("test end")
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree, F
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def sort_names(fs, directory_path):
+    """
+    the full sort list_dir did on every call before the sorted children index
+    """
+    _, _, directory, _ = fs.get_info(directory_path)
+    dirs = []
+    files = []
+    for name in directory.children:
+        if directory.children[name].type == F.dir:
+            dirs.append(name)
+        else:
+            files.append(name)
+    dirs.sort()
+    files.sort()
+    return dirs + files
+
+
+def list_names(fs, directory_path, limit):
+    names = []
+    start_after = ""
+    while True:
+        r = fs.list_dir(directory_path, limit = limit, start_after = start_after)
+        names.extend(child["name"] for child in r["files"])
+        start_after = r["next_start_after"]
+        if not start_after:
+            break
+    return names
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_list_dir.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "list_dir_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        now = int(time.time())
+        n = 100000
+        t = time.time()
+        for i in range(n):
+            fs.create("/big/f_%06d.txt" % ((i * 7919) % n), {"id": "id_%s" % i, "size": 1, "ctime": now, "mtime": now, "blocks": []})
+        for i in range(100):
+            fs.makedir("/big/d_%03d" % (99 - i))
+        LOG.info("create %s children: %.3fs", n + 100, time.time() - t)
+
+        t = time.time()
+        for i in range(100):
+            sort_names(fs, "/big")[50000:50100]
+        LOG.info("100 pages with a full sort: %.3fs", time.time() - t)
+        fs.list_dir("/big", limit = 1)
+        t = time.time()
+        for i in range(100):
+            fs.list_dir("/big", offset = 50000, limit = 100)
+        LOG.info("100 pages with offset: %.3fs", time.time() - t)
+        t = time.time()
+        for i in range(100):
+            fs.list_dir("/big", limit = 100, start_after = "f_050000.txt")
+        LOG.info("100 pages with start_after: %.3fs", time.time() - t)
+
+        expected = sort_names(fs, "/big")
+        r = fs.list_dir("/big", offset = 90, limit = 20)
+        LOG.info("offset page: %s, total: %s", [child["name"] for child in r["files"]] == expected[90:110], r["total"] == len(expected))
+        LOG.info("cursor pages: %s", list_names(fs, "/big", 999) == expected)
+
+        fs.delete("/big/f_000500.txt")
+        fs.delete("/big/d_050")
+        fs.create("/big/f_000500_b.txt", {"id": "id_b", "size": 1, "ctime": now, "mtime": now, "blocks": []})
+        fs.rename("/big/f_000600.txt", "a.txt")
+        fs.move("/big/f_000700.txt", "/")
+        fs.copy("/big/f_000800.txt", "/big/d_000")
+        fs.copy("/f_000700.txt", "/big")
+        fs.makedir("/big/d_050_b")
+        fs.makedirs("/big/d_200/x")
+        LOG.info("after changes: %s", list_names(fs, "/big", 777) == sort_names(fs, "/big"))
+        r = fs.list_dir("/big", limit = 2, start_after = "d_099", include_file = False)
+        LOG.info("directories only: %s, next: %s", [child["name"] for child in r["files"]], repr(r["next_start_after"]))
+        r = fs.list_dir("/big", limit = 2, start_after = "d_099")
+        LOG.info("directories then files: %s", [child["name"] for child in r["files"]])
+        r = fs.list_dir("/missing", limit = 2)
+        LOG.info("missing directory: %s", r)
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
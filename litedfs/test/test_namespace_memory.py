@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import gc
+import time
+import random
+import hashlib
+import logging
+import resource
+import multiprocessing
+from uuid import UUID
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.namespace import Root, Directory, FileInfo
+from litedfs.name.utils.path_index import intern_name
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+FILES_PER_DIR = 1000
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def rss():
+    """
+    resident memory of this process in bytes
+    """
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def available_memory():
+    result = None
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    result = int(line.split()[1]) * 1024
+                    break
+    return result
+
+
+def file_infos(n, seed = 0):
+    """
+    what the create handler stores, most files fit in one block, every 10th one takes 4
+    """
+    rand = random.Random(seed)
+    now = int(time.time())
+    for i in range(n):
+        blocks = []
+        size = rand.randint(1, BLOCK_SIZE)
+        block_count = 4 if i % 10 == 0 else 1
+        for block_id in range(block_count):
+            md5 = hashlib.md5(b"%d_%d" % (i, block_id)).hexdigest()
+            blocks.append([block_id, BLOCK_SIZE if block_id < block_count - 1 else size, rand.sample(range(1, 21), 2), md5])
+        yield "d_%05d" % (i // FILES_PER_DIR), "f_%05d.txt" % (i % FILES_PER_DIR), {
+            "size": (block_count - 1) * BLOCK_SIZE + size,
+            "id": str(UUID(int = rand.getrandbits(128), version = 4)),
+            "replica": 2,
+            "current_replica": 2,
+            "blocks": blocks,
+            "checksum": hashlib.md5(b"%d" % i).hexdigest(),
+            "ctime": now + i,
+            "mtime": now + i,
+        }
+
+
+def build_dicts(n):
+    """
+    the namespace as it was, nested dicts for the tree and a file info dict per file
+    """
+    tree = {"c": {}, "t": "root"}
+    files = {}
+    for dir_name, file_name, file_info in file_infos(n):
+        directory = tree["c"].get(dir_name)
+        if directory is None:
+            directory = {"t": "d", "c": {}, "i": {"ctime": file_info["ctime"], "mtime": file_info["mtime"]}}
+            tree["c"][dir_name] = directory
+        directory["c"][file_name] = {"t": "f", "id": file_info["id"]}
+        files[file_info["id"]] = file_info
+    return tree, files
+
+
+def build_compact(n):
+    tree = Root()
+    files = {}
+    for dir_name, file_name, file_info in file_infos(n):
+        directory = tree.children.get(dir_name)
+        if directory is None:
+            directory = Directory({"ctime": file_info["ctime"], "mtime": file_info["mtime"]})
+            tree.children[intern_name(dir_name)] = directory
+        file = FileInfo(file_info)
+        directory.children[intern_name(file_name)] = file
+        files[file.id] = file
+    return tree, files
+
+
+def measure(build, n, queue):
+    gc.collect()
+    before = rss()
+    t = time.time()
+    namespace = build(n)
+    use_time = time.time() - t
+    gc.collect()
+    queue.put((rss() - before, use_time))
+
+
+def run(build, n):
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target = measure, args = (build, n, queue))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_namespace_memory.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        counts = [int(n) for n in sys.argv[1:]] or [1000000, 10000000]
+        tree, files = build_dicts(1000)
+        compact_tree, compact_files = build_compact(1000)
+        LOG.info("same file infos: %s", all(compact_files[file_id].to_dict() == files[file_id] for file_id in files))
+        bytes_per_file = {}
+        for n in counts:
+            for name, build in (("dicts", build_dicts), ("compact", build_compact)):
+                available = available_memory()
+                if name in bytes_per_file and available is not None and bytes_per_file[name] * n * 1.2 > available:
+                    LOG.info("%s, %s files: skipped, needs about %.1fG, available: %.1fG",
+                             name, n, bytes_per_file[name] * n / 1024.0 ** 3, available / 1024.0 ** 3)
+                    continue
+                memory, use_time = run(build, n)
+                bytes_per_file[name] = float(memory) / n
+                LOG.info("%s, %s files: %.1fM, %.1f bytes per file, build: %.3fs", name, n, memory / 1024.0 ** 2, bytes_per_file[name], use_time)
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
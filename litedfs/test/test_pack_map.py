@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+from fs_helper import recover
+
+LOG = logging.getLogger(__name__)
+
+
+def create_pack(fs, container_id, dir_path, sizes):
+    """
+    what the pack create handler does, a container and one create per packed file
+    """
+    now = int(time.time())
+    fs.create_pack({"size": sum(sizes), "id": container_id, "replica": 2, "current_replica": 2,
+                    "blocks": [[0, sum(sizes), [1, 2], "0" * 32]], "checksum": "", "ctime": now, "mtime": now})
+    operations = []
+    offset = 0
+    for i, size in enumerate(sizes):
+        operations.append({"op": "create", "path": "%s/f_%03d.txt" % (dir_path, i), "id": "%s_%03d" % (container_id, i), "size": size, "pack": [container_id, offset]})
+        offset += size
+    return fs.batch(operations)
+
+
+def pack_state(fs):
+    return {container_id: (sorted(fs.pack_map.containers[container_id]), fs.pack_map.live[container_id]) for container_id in fs.pack_map.containers}
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_pack_map.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "pack_map_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        results = create_pack(fs, "pack_a", "/a", [100] * 10)
+        assert all(r["result"] == "ok" for r in results), results
+        results = create_pack(fs, "pack_b", "/b", [1000, 2000, 3000])
+        assert all(r["result"] == "ok" for r in results), results
+        results = fs.batch([
+            {"op": "create", "path": "/c/out.txt", "id": "out", "size": 200, "pack": ["pack_a", 900]},
+            {"op": "create", "path": "/c/missing.txt", "id": "missing", "size": 1, "pack": ["pack_x", 0]},
+            {"op": "create", "path": "/c/big.txt", "id": "big", "size": 2 * 1048576, "pack": ["pack_b", 0]},
+        ])
+        assert [r["result"] for r in results] == ["InvalidParameters"] * 3, results
+        assert fs.get_file_info("/a/f_001.txt")["pack"] == ["pack_a", 100]
+        assert fs.summary("/a") == {"size": 1000, "files": 10, "directories": 0, "blocks": 0}, fs.summary("/a")
+
+        for i in range(7):
+            fs.delete("/a/f_%03d.txt" % i)
+        fs.delete("/b")
+        ioloop.IOLoop.current().run_sync(fs.sync) # a directory's files go away in the background
+        assert fs.pack_map.live == {"pack_a": 300, "pack_b": 0}, fs.pack_map.live
+        assert sorted(fs.pack_map.sparse_containers(0.5)) == ["pack_a", "pack_b"]
+        fs.rename("/a/f_008.txt", "g.txt")
+        expected = pack_state(fs)
+        recover(fs)
+        assert pack_state(fs) == expected, pack_state(fs)
+
+        assert fs.delete_pack("pack_b")
+        now = int(time.time())
+        fs.create_pack({"size": 300, "id": "pack_c", "replica": 2, "current_replica": 2,
+                        "blocks": [[0, 300, [1, 2], "1" * 32]], "checksum": "", "ctime": now, "mtime": now})
+        moved = fs.repack("pack_c", {"pack_a_007": 0, "pack_a_008": 100, "pack_a_009": 200, "pack_a_000": 300})
+        # pack_a_000 was deleted, it can't move
+        assert moved == {"pack_a_007": 0, "pack_a_008": 100, "pack_a_009": 200}, moved
+        assert fs.delete_pack("pack_a")
+        assert not fs.delete_pack("pack_c") # still has live files
+        pack_info = fs.pack_map.locate(fs.get_file_info("/a/g.txt")["pack"])
+        assert pack_info["id"] == "pack_c" and pack_info["offset"] == 100, pack_info
+        expected = pack_state(fs)
+        recover(fs)
+        assert pack_state(fs) == expected, pack_state(fs)
+        assert sorted(fs.pack_map.containers) == ["pack_c"]
+        recover(fs)
+        assert pack_state(fs) == expected, pack_state(fs)
+        assert sorted(fs.files) == ["pack_a_007", "pack_a_008", "pack_a_009", "pack_c"], sorted(fs.files)
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+        sys.exit(1)
+
+    LOG.info("test end")
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import shutil
+import logging
+
+from tornado import ioloop
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.fs_core import FileSystemTree, F
+from litedfs.name.utils.common import splitall
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+
+def walk_info(fs, file_path):
+    """
+    the tree walk get_info did before the path index
+    """
+    result = [True, "", {}, None]
+    path_parts = splitall(file_path)
+    parent = None
+    current_root = fs.tree
+    for name in path_parts[1:]:
+        if current_root.type == F.file or name not in current_root.children:
+            result[0] = False
+            break
+        else:
+            parent = current_root
+            current_root = current_root.children[name]
+    if result[0]:
+        result[1] = current_root.type
+        result[2] = current_root
+        result[3] = parent
+    return result
+
+
+def same(fs, paths):
+    for path in paths:
+        a = fs.get_info(path)
+        b = walk_info(fs, path)
+        if a[0] != b[0] or (a[0] and (a[2] is not b[2] or a[3] is not b[3])):
+            LOG.error("mismatch: %s, %s, %s", path, a[:2], b[:2])
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_path_index.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["data_path"] = os.path.join(cwd, "path_index_data")
+        if os.path.exists(CONFIG["data_path"]):
+            shutil.rmtree(CONFIG["data_path"])
+        os.makedirs(CONFIG["data_path"])
+
+        fs = FileSystemTree()
+        ioloop.IOLoop.current().run_sync(fs.recover)
+        now = int(time.time())
+        deep = "/" + "/".join("level_%02d" % i for i in range(20))
+        paths = []
+        t = time.time()
+        for i in range(20000):
+            file_path = "%s/d_%02d/f_%05d.txt" % (deep, i % 10, i)
+            fs.create(file_path, {"id": "id_%s" % i, "size": 1, "ctime": now, "mtime": now, "blocks": []})
+            paths.append(file_path)
+        LOG.info("create %s files at depth 22: %.3fs", len(paths), time.time() - t)
+
+        t = time.time()
+        for path in paths:
+            walk_info(fs, path)
+        LOG.info("tree walk lookups: %.3fs", time.time() - t)
+        t = time.time()
+        for path in paths:
+            fs.get_info(path)
+        LOG.info("path index lookups: %.3fs", time.time() - t)
+
+        checks = paths[:10] + [deep, deep + "/d_01", deep + "//d_01/", "/", "/missing", deep + "/d_01/f_00001.txt/x"]
+        LOG.info("lookups match: %s", same(fs, checks))
+        fs.rename(deep + "/d_01", "d_01_renamed")
+        LOG.info("after rename: %s, old gone: %s", same(fs, checks + [deep + "/d_01_renamed/f_00001.txt"]), not fs.exists(deep + "/d_01/f_00001.txt"))
+        fs.makedir(deep + "/d_01")
+        fs.move(deep + "/d_02", deep + "/d_01")
+        LOG.info("after move: %s, moved: %s", same(fs, checks + [deep + "/d_01/d_02/f_00002.txt"]), fs.exists(deep + "/d_01/d_02/f_00002.txt"))
+        fs.delete("/level_00/level_01")
+        LOG.info("after delete: %s, deleted: %s, index size: %s", same(fs, checks), not fs.exists(deep), len(fs.path_index.dirs))
+        fs.create(deep + "/d_03/f_new.txt", {"id": "id_new", "size": 1, "ctime": now, "mtime": now, "blocks": []})
+        LOG.info("create again: %s", same(fs, checks + [deep + "/d_03/f_new.txt"]))
+
+        fs.close()
+        shutil.rmtree(CONFIG["data_path"])
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
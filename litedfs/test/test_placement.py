@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+from collections import Counter
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs.name.utils.placement import PlacementPolicy, WeightedPlacementPolicy, RandomPlacementPolicy
+from litedfs.name.config import CONFIG
+from litedfs.name import logger
+
+LOG = logging.getLogger(__name__)
+
+G = 1024 * 1024 * 1024
+
+
+def node(host, rack, free, load = 0.0, full = False):
+    return {"host": host, "rack": rack, "full": full, "free": free, "load": load}
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_placement.log",
+                          log_level = "INFO",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.info("test start")
+
+    try:
+        CONFIG["block_size"] = 64 * 1024 * 1024
+        nodes = {
+            1: node("10.0.0.1", "r1", 100 * G),
+            2: node("10.0.0.2", "r1", 100 * G, load = 3 * CONFIG["block_size"]), # busy writing
+            3: node("10.0.0.3", "r2", 10 * G), # nearly full
+            4: node("10.0.0.4", "r2", 100 * G),
+            5: node("10.0.0.4", "r2", 100 * G), # same host as 4
+            6: node("10.0.0.6", "r3", 100 * G, full = True),
+        }
+        for policy in (RandomPlacementPolicy(), WeightedPlacementPolicy()):
+            counter = Counter()
+            same_host = 0
+            same_rack = 0
+            for i in range(10000):
+                node_ids = policy.choose(nodes, 2)
+                counter.update(node_ids)
+                same_host += nodes[node_ids[0]]["host"] == nodes[node_ids[1]]["host"]
+                same_rack += nodes[node_ids[0]]["rack"] == nodes[node_ids[1]]["rack"]
+            LOG.info("%s: %s, same host: %s, same rack: %s, full node chosen: %s",
+                     policy.__class__.__name__, sorted(counter.items()), same_host, same_rack, 6 in counter)
+
+        policy = WeightedPlacementPolicy()
+        LOG.info("excludes 1 & 4: %s", Counter(tuple(sorted(policy.choose(nodes, 2, excludes = [1, 4]))) for i in range(1000)))
+        LOG.info("one host: %s", policy.choose({1: node("127.0.0.1", "", G), 2: node("127.0.0.1", "", G)}, 2))
+        LOG.info("configured: %s", PlacementPolicy.instance().__class__.__name__)
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.info("test end")
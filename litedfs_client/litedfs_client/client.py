@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 
 import os
+import io
 import re
 import sys
 import json
@@ -9,11 +10,16 @@ import hashlib
 import argparse
 import logging
 import random
+import threading
 import urllib.parse
 from io import BytesIO
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from base64 import b64encode, b64decode
 
 import requests
+from requests.adapters import HTTPAdapter
 from tea_encrypt import EncryptStr, DecryptStr
 
 from litedfs_client.version import __version__
@@ -65,10 +71,26 @@ def strings_md5sum(l):
     return md5.hexdigest()
 
 
-class RemoteFile(object):
-    def __init__(self, host, port, remote_path, file_info):
+class RemoteFile(io.RawIOBase):
+    """
+    read only file object, reads whole pages with one range request each,
+    keeps them in a LRU cache of cache_size bytes, and prefetches the next page in background when the file is read sequentially,
+    reads larger than a page skip the cache and go straight into the caller's buffer,
+    cache_size <= 0 turns the cache and the prefetch off, every read goes straight to the data nodes
+    """
+    def __init__(self, host, port, remote_path, file_info, client = None, page_size = 4 * 1024 * 1024, cache_size = 64 * 1024 * 1024, read_ahead = True):
+        io.RawIOBase.__init__(self)
         self.host = host
         self.port = port
+        self.own_client = client is None # the blocks are read through the client's pooled sessions
+        self.client = LiteDFSClient(host, port) if client is None else client
+        self.page_size = page_size
+        self.max_pages = max(1, cache_size // page_size) if cache_size > 0 else 0
+        self.pages = OrderedDict()
+        self.prefetching = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers = 1) if read_ahead and self.max_pages else None
+        self.last_page = -1
         self.remote_path = remote_path
         self.base_url = "http://%s:%s" % (self.host, self.port)
         self.headers = {"user-agent": "%s/%s" % (USER_AGENT, __version__)}
@@ -80,48 +102,37 @@ class RemoteFile(object):
         self.blocks = self.file_info["blocks"]
         self.file_id = self.file_info["id"]
         self.block_size = file_info["block_size"]
+        self.pack_offset = 0
+        if file_info.get("pack"): # a small file packed into a container, read its range of the container's block
+            self.blocks = [file_info["pack"]["block"]]
+            self.file_id = file_info["pack"]["id"]
+            self.pack_offset = file_info["pack"]["offset"]
+        self.inline = None
+        if "inline" in self.file_info: # a tiny file kept in the name node, no data node to read from
+            self.inline = b64decode(self.file_info["inline"])
         self.pos = 0
-        self.closed = False
 
     def read(self, size = -1):
-        result = b""
-        if size != -1:
-            if size <= 0:
-                return result
-            elif size > 0 and self.pos + size < self.file_size:
-                blocks = self.blocks_range(self.pos, size)
-                for block in blocks:
-                    r = self.block_range_read(block[0], block[1], block[2])
-                    if r:
-                        result += r
-                    else:
-                        raise
-                self.pos = self.pos + size
-            else:
-                blocks = self.blocks_range(self.pos, self.file_size - self.pos)
-                for block in blocks:
-                    r = self.block_range_read(block[0], block[1], block[2])
-                    if r:
-                        result += r
-                    else:
-                        raise
-                self.pos = self.file_size
-        else:
-            blocks = self.blocks_range(self.pos, self.file_size - self.pos)
-            for block in blocks:
-                r = self.block_range_read(block[0], block[1], block[2])
-                if r:
-                    result += r
-                else:
-                    raise
-            self.pos = self.file_size
-        return result
+        if size is None or size < 0:
+            size = self.file_size - self.pos
+        b = bytearray(max(0, min(size, self.file_size - self.pos)))
+        n = self.readinto(b)
+        if n < len(b):
+            del b[n:]
+        return bytes(b)
 
     def readall(self):
         return self.read()
 
     def block_range_read(self, block_id, offset, size):
-        result = False
+        b = bytearray(size)
+        self.block_readinto(block_id, offset, memoryview(b))
+        return bytes(b)
+
+    def block_readinto(self, block_id, offset, view):
+        if self.inline is not None:
+            view[:] = self.inline[offset:offset + len(view)]
+            return len(view)
         block = self.blocks[block_id]
 
         node_ids = block[2]
@@ -130,28 +141,76 @@ class RemoteFile(object):
         exists_ids = list(set(node_ids).intersection(set(self.data_nodes.keys())))
         if exists_ids:
             exists_ids_random = random.sample(exists_ids, len(exists_ids))
-            block_success = False
             for node_id in exists_ids_random:
                 data_node = self.data_nodes[node_id]
-                block_read_url = "http://%s:%s/block/read?name=%s&block=%s&offset=%s&size=%s&md5=%s" % (data_node[0], data_node[1], self.file_id, block_id, offset, size, block_md5)
-                r = requests.get(block_read_url, headers = self.headers)
-                if r.status_code == 200:
-                    result = r.content
-                    block_success = True
-                    break
-                elif r.status_code == 400:
-                    data = r.json()
-                    LOG.error("error: %s", data["result"])
-                    continue
-                else:
-                    LOG.error("error:\ncode: %s\ncontent: %s", r.status_code, r.content)
-                    block_success = False
-                    continue
-            if not block_success:
-                raise OperationFailedError("read block failed from: %s" % exists_ids_random)
+                block_read_url = "http://%s:%s/block/read?name=%s&block=%s&offset=%s&size=%s&md5=%s" % (data_node[0], data_node[1], self.file_id, block_id, self.pack_offset + offset, len(view), block_md5)
+                try:
+                    with self.client.get_session(data_node).get(block_read_url, headers = self.headers, stream = True) as r:
+                        if r.status_code == 200:
+                            # straight into the caller's buffer, BUF_SIZE at a time, the whole range is never copied
+                            n = 0
+                            while n < len(view):
+                                m = r.raw.readinto(view[n:n + BUF_SIZE])
+                                if not m:
+                                    break
+                                n += m
+                            if n == len(view):
+                                return n
+                            LOG.error("read block[%s] from node: %s, get %s bytes, need %s bytes", block_id, node_id, n, len(view))
+                        else:
+                            LOG.error("read block[%s] from node: %s error:\ncode: %s\ncontent: %s", block_id, node_id, r.status_code, r.content)
+                except Exception as e:
+                    LOG.warning("read block[%s] from node: %s failed: %s", block_id, node_id, e)
+            raise OperationFailedError("read block failed from: %s" % exists_ids_random)
         else:
             raise OperationFailedError("not enough data nodes online")
-        return result
+
+    def range_readinto(self, offset, view):
+        n = 0
+        # blocks_range doesn't touch the position, safe for the prefetch thread
+        for block_id, block_offset, size in self.blocks_range(offset, len(view)):
+            n += self.block_readinto(block_id, block_offset, view[n:n + size])
+        return n
+
+    def fetch_page(self, page):
+        offset = page * self.page_size
+        data = bytearray(min(self.page_size, self.file_size - offset))
+        self.range_readinto(offset, memoryview(data))
+        return data
+
+    def cache_page(self, page, data):
+        with self.lock:
+            self.pages[page] = data
+            self.pages.move_to_end(page)
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last = False)
+
+    def get_page(self, page):
+        with self.lock:
+            if page in self.pages:
+                self.pages.move_to_end(page)
+                return self.pages[page]
+            future = self.prefetching.pop(page, None)
+        data = None
+        if future:
+            try:
+                data = future.result()
+            except Exception as e:
+                LOG.warning("prefetch page[%s] failed: %s", page, e)
+        if data is None:
+            data = self.fetch_page(page)
+        self.cache_page(page, data)
+        return data
+
+    def prefetch(self, page):
+        if self.executor and page * self.page_size < self.file_size:
+            with self.lock:
+                if page not in self.pages and page not in self.prefetching:
+                    self.prefetching[page] = self.executor.submit(self.fetch_page, page)
+
+    def is_cached(self, page):
+        with self.lock:
+            return page in self.pages or page in self.prefetching
 
     def blocks_range(self, offset, size):
         result = []
@@ -178,11 +237,49 @@ class RemoteFile(object):
             self.pos = 0
         if self.pos > self.file_size:
             self.pos = self.file_size
+        return self.pos
 
     def readinto(self, b):
-        content = self.read(len(b))
-        b[:len(content)] = content
-        return len(content)
+        view = memoryview(b).cast("B")
+        size = max(0, min(len(view), self.file_size - self.pos))
+        if not self.max_pages: # no cache, read straight through
+            n = self.range_readinto(self.pos, view[:size])
+            self.pos += n
+            return n
+        n = 0
+        while n < size:
+            page = self.pos // self.page_size
+            if size - n >= self.page_size and not self.is_cached(page):
+                length = self.range_readinto(self.pos, view[n:size])
+                n += length
+                self.pos += length
+                self.last_page = (self.pos - 1) // self.page_size
+                self.prefetch(self.last_page + 1)
+                continue
+            data = memoryview(self.get_page(page))
+            start = self.pos - page * self.page_size
+            length = min(size - n, len(data) - start)
+            if length <= 0:
+                break
+            view[n:n + length] = data[start:start + length]
+            n += length
+            self.pos += length
+            if page == self.last_page or page == self.last_page + 1:
+                self.prefetch(page + 1)
+            self.last_page = page
+        return n
+
+    def readinto_iter(self, b):
+        """
+        fill the caller's buffer again and again until the end of file,
+        yields the filled part of the buffer, it is only valid until the next iteration
+        """
+        view = memoryview(b).cast("B")
+        while True:
+            n = self.readinto(view)
+            if not n:
+                break
+            yield view[:n]
 
     def readable(self):
         return True
@@ -193,87 +290,86 @@ class RemoteFile(object):
     def tell(self):
         return self.pos
 
-    def flush(self):
-        pass
-
     def close(self):
-        self.closed = True
+        if self.executor:
+            self.executor.shutdown(wait = False)
+            self.executor = None
+        with self.lock:
+            self.pages.clear()
+            self.prefetching.clear()
+        if self.own_client:
+            self.client.close()
+        io.RawIOBase.close(self)
 
 
 class LiteDFSClient(object):
-    def __init__(self, host, port, user = "", password = ""):
+    def __init__(self, host, port, user = "", password = "", single_round_trip = False, hint_ttl = 30, pool_size = 10, keep_alive = True):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.token = ""
+        self.single_round_trip = single_round_trip
+        self.hint_ttl = hint_ttl
+        self.placement_hints = {}
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
         self.base_url = "http://%s:%s" % (self.host, self.port)
         self.headers = {"user-agent": "%s/%s" % (USER_AGENT, __version__)}
         self.encode_token()
 
+    def get_session(self, data_node = None):
+        """
+        one pooled keep-alive session per endpoint, the name node's without data_node, shared by all threads
+        """
+        endpoint = "%s:%s" % ((self.host, self.port) if data_node is None else (data_node[0], data_node[1]))
+        with self.sessions_lock:
+            if endpoint not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = self.pool_size)
+                session.mount("http://", adapter)
+                if not self.keep_alive:
+                    session.headers["Connection"] = "close"
+                self.sessions[endpoint] = session
+            return self.sessions[endpoint]
+
+    def close(self):
+        with self.sessions_lock:
+            for endpoint in self.sessions:
+                self.sessions[endpoint].close()
+            self.sessions.clear()
+
     def encode_token(self):
         if self.user and self.password:
             self.token = b64encode(EncryptStr(self.user.encode("utf-8"), bytes_md5sum(self.password.encode("utf-8"))))
             self.headers["user"] = self.user
             self.headers["token"] = self.token
 
-    def create_file(self, local_path, remote_path, replica = 1, lock_ttl = 60, progress_callback = None):
+    def create_file(self, local_path, remote_path, replica = 1, lock_ttl = 60, progress_callback = None, max_workers = 1, max_node_streams = 2):
+        """
+        with max_workers > 1 the blocks are uploaded concurrently, see create_blocks
+        """
         result = False
         if os.path.exists(local_path) and os.path.isfile(local_path):
             success = True
             file_size = os.stat(local_path).st_size
+            if self.single_round_trip:
+                with open(local_path, "rb") as fp:
+                    if self.create_small_file(fp, file_size, remote_path, replica = replica):
+                        if progress_callback:
+                            progress_callback("create file: ok")
+                        return True
             block_list_url = "%s/file/block/list?size=%s&replica=%s&path=%s&lock_ttl=%s" % (self.base_url, file_size, replica, urllib.parse.quote(remote_path), lock_ttl)
-            r = requests.get(block_list_url, headers = self.headers)
+            r = self.get_session().get(block_list_url, headers = self.headers)
             if r.status_code == 200:
                 data = r.json()
                 if "result" in data and data["result"] == "ok":
                     if progress_callback:
                         progress_callback("generate blocks: ok")
-                    data_nodes = data["data_nodes"]
                     fp = open(local_path, "rb")
-                    blocks_md5 = []
-                    for n, block in enumerate(data["blocks"]):
-                        if progress_callback:
-                            progress_callback("processing block[%s/%s]" % (n + 1, len(data["blocks"])))
-                        block_id = block[0]
-                        block_size = block[1]
-                        block_content = BytesIO()
-                        block_content.write(fp.read(block_size))
-                        node_id = block[2][0]
-                        node_ids = ",".join([str(b) for b in block[2][1:]])
-                        data_node = data_nodes[str(node_id)]
-                        block_create_url = "http://%s:%s/block/create" % (data_node[0], data_node[1])
-                        block_content.seek(0)
-                        block_md5 = bytes_io_md5sum(block_content)
-                        block.append(block_md5)
-                        blocks_md5.append(block_md5)
-                        block_content.seek(0)
-                        files = {'up_file': ("up_file", block_content, b"text/plain")}
-                        values = {"name": data["id"], "block": block_id, "ids": node_ids}
-                        r = requests.post(block_create_url, headers = self.headers, files = files, data = values)
-                        if r.status_code == 200:
-                            if progress_callback:
-                                progress_callback("process block[%s/%s]: ok" % (n + 1, len(data["blocks"])))
-                            update_file_lock_url = "%s/file/lock/update" % self.base_url
-                            json_data = {"path": remote_path, "lock_ttl": lock_ttl}
-                            rr = requests.put(update_file_lock_url, headers = self.headers, json = json_data)
-                            if rr.status_code == 200:
-                                dd = rr.json()
-                                if "result" not in dd or dd["result"] != "ok":
-                                    raise OperationFailedError("update file[%s] lock ttl[%s] failed: %s" % (remote_path, lock_ttl, dd["result"]))
-                            else:
-                                raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (rr.status_code, rr.content))
-
-                            d = r.json()
-                            if "result" in d and d["result"] != "ok":
-                                LOG.error("create block failed: %s", d)
-                                success = False
-                                break
-                            elif "md5" in d and d["md5"] != block_md5:
-                                success = False
-                                break
-                        if not success:
-                            break
+                    success, blocks_md5 = self.create_blocks(fp, data, remote_path, lock_ttl, max_workers, max_node_streams, progress_callback)
                     fp.close()
                     if success:
                         json_data = {
@@ -284,7 +380,7 @@ class LiteDFSClient(object):
                             "blocks": data["blocks"],
                             "checksum": strings_md5sum(blocks_md5),
                         }
-                        r = requests.post("%s/file/create" % self.base_url, headers = self.headers, json = json_data)
+                        r = self.get_session().post("%s/file/create" % self.base_url, headers = self.headers, json = json_data)
                         if r.status_code == 200:
                             d = r.json()
                             if "result" in d and d["result"] == "ok":
@@ -303,7 +399,7 @@ class LiteDFSClient(object):
             raise OperationFailedError("file[%s] not exists" % local_path)
         return result
 
-    def create_file_by_content(self, content, remote_path, replica = 1, lock_ttl = 60):
+    def create_file_by_content(self, content, remote_path, replica = 1, lock_ttl = 60, max_workers = 1, max_node_streams = 2):
         result = False
         fp = None
         if isinstance(content, bytes):
@@ -317,51 +413,15 @@ class LiteDFSClient(object):
             fp.seek(0, 2)
             file_size = fp.tell()
             fp.seek(0)
+            if self.single_round_trip and self.create_small_file(fp, file_size, remote_path, replica = replica):
+                return True
+            fp.seek(0)
             block_list_url = "%s/file/block/list?size=%s&replica=%s&path=%s&lock_ttl=%s" % (self.base_url, file_size, replica, urllib.parse.quote(remote_path), lock_ttl)
-            r = requests.get(block_list_url, headers = self.headers)
+            r = self.get_session().get(block_list_url, headers = self.headers)
             if r.status_code == 200:
                 data = r.json()
                 if "result" in data and data["result"] == "ok":
-                    data_nodes = data["data_nodes"]
-                    blocks_md5 = []
-                    for block in data["blocks"]:
-                        block_id = block[0]
-                        block_size = block[1]
-                        block_content = BytesIO()
-                        block_content.write(fp.read(block_size))
-                        node_id = block[2][0]
-                        node_ids = ",".join([str(b) for b in block[2][1:]])
-                        data_node = data_nodes[str(node_id)]
-                        block_create_url = "http://%s:%s/block/create" % (data_node[0], data_node[1])
-                        block_content.seek(0)
-                        block_md5 = bytes_io_md5sum(block_content)
-                        block.append(block_md5)
-                        blocks_md5.append(block_md5)
-                        block_content.seek(0)
-                        files = {'up_file': ("up_file", block_content, b"text/plain")}
-                        values = {"name": data["id"], "block": block_id, "ids": node_ids}
-                        r = requests.post(block_create_url, headers = self.headers, files = files, data = values)
-                        if r.status_code == 200:
-                            update_file_lock_url = "%s/file/lock/update" % self.base_url
-                            json_data = {"path": remote_path, "lock_ttl": lock_ttl}
-                            rr = requests.put(update_file_lock_url, headers = self.headers, json = json_data)
-                            if rr.status_code == 200:
-                                dd = rr.json()
-                                if "result" not in dd or dd["result"] != "ok":
-                                    raise OperationFailedError("update file[%s] lock ttl[%s] failed: %s" % (remote_path, lock_ttl, dd["result"]))
-                            else:
-                                raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (rr.status_code, rr.content))
-
-                            d = r.json()
-                            if "result" in d and d["result"] != "ok":
-                                LOG.error("create block failed: %s", d)
-                                success = False
-                                break
-                            elif "md5" in d and d["md5"] != block_md5:
-                                success = False
-                                break
-                        if not success:
-                            break
+                    success, blocks_md5 = self.create_blocks(fp, data, remote_path, lock_ttl, max_workers, max_node_streams)
                     fp.close()
                     if success:
                         json_data = {
@@ -372,7 +432,7 @@ class LiteDFSClient(object):
                             "blocks": data["blocks"],
                             "checksum": strings_md5sum(blocks_md5),
                         }
-                        r = requests.post("%s/file/create" % self.base_url, headers = self.headers, json = json_data)
+                        r = self.get_session().post("%s/file/create" % self.base_url, headers = self.headers, json = json_data)
                         if r.status_code == 200:
                             d = r.json()
                             if "result" in d and d["result"] == "ok":
@@ -391,10 +451,259 @@ class LiteDFSClient(object):
             raise OperationFailedError("not support content parameter: %s" % content)
         return result
 
+    def create_blocks(self, fp, data, remote_path, lock_ttl, max_workers, max_node_streams, progress_callback = None):
+        """
+        upload the blocks one by one, or with max_workers > 1 threads, at most max_node_streams of them to one data node at a time,
+        a block is read from fp only when a worker is free for it, so about max_workers blocks are in memory,
+        return (success, blocks_md5), the md5s in block order, the same for both
+        """
+        blocks = data["blocks"]
+        if max_workers <= 1:
+            blocks_md5 = []
+            for n, block in enumerate(blocks):
+                if progress_callback:
+                    progress_callback("processing block[%s/%s]" % (n + 1, len(blocks)))
+                content = fp.read(block[1])
+                block_md5 = bytes_md5sum(content)
+                block.append(block_md5)
+                blocks_md5.append(block_md5)
+                if not self.create_block(data, block, content, remote_path, lock_ttl):
+                    return False, blocks_md5
+                if progress_callback:
+                    progress_callback("process block[%s/%s]: ok" % (n + 1, len(blocks)))
+            return True, blocks_md5
+
+        blocks_md5 = [None] * len(blocks)
+        slots = threading.Semaphore(max_workers)
+        node_streams = {}
+        for block in blocks:
+            if block[2][0] not in node_streams:
+                node_streams[block[2][0]] = threading.Semaphore(max_node_streams)
+        failed = threading.Event()
+
+        def upload(n, block, content):
+            try:
+                block_md5 = bytes_md5sum(content)
+                block.append(block_md5)
+                blocks_md5[n] = block_md5
+                with node_streams[block[2][0]]:
+                    if failed.is_set() or not self.create_block(data, block, content, remote_path, lock_ttl):
+                        failed.set()
+                    elif progress_callback:
+                        progress_callback("process block[%s/%s]: ok" % (n + 1, len(blocks)))
+            except Exception:
+                failed.set()
+                raise
+            finally:
+                slots.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            for n, block in enumerate(blocks):
+                slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    break
+                if progress_callback:
+                    progress_callback("processing block[%s/%s]" % (n + 1, len(blocks)))
+                futures.append(executor.submit(upload, n, block, fp.read(block[1])))
+        for future in futures:
+            future.result() # raise the upload's exception, if any
+        return not failed.is_set(), blocks_md5
+
+    def create_block(self, data, block, content, remote_path = None, lock_ttl = 60):
+        """
+        upload one block to the first data node of block[2], keep only the acknowledged replicas in block[2],
+        the remote_path's file lock is renewed after the upload, a pack container has no lock
+        """
+        result = False
+        data_node = data["data_nodes"][str(block[2][0])]
+        block_create_url = "http://%s:%s/block/create" % (data_node[0], data_node[1])
+        files = {'up_file': ("up_file", BytesIO(content), b"text/plain")}
+        values = {"name": data["id"], "block": block[0], "ids": ",".join([str(b) for b in block[2][1:]])}
+        r = self.get_session(data_node).post(block_create_url, headers = self.headers, files = files, data = values)
+        if r.status_code == 200:
+            if remote_path is not None:
+                update_file_lock_url = "%s/file/lock/update" % self.base_url
+                json_data = {"path": remote_path, "lock_ttl": lock_ttl}
+                rr = self.get_session().put(update_file_lock_url, headers = self.headers, json = json_data)
+                if rr.status_code == 200:
+                    dd = rr.json()
+                    if "result" not in dd or dd["result"] != "ok":
+                        raise OperationFailedError("update file[%s] lock ttl[%s] failed: %s" % (remote_path, lock_ttl, dd["result"]))
+                else:
+                    raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (rr.status_code, rr.content))
+
+            d = r.json()
+            if "result" in d and d["result"] != "ok":
+                LOG.error("create block failed: %s", d)
+            elif "md5" in d and d["md5"] != block[3]:
+                LOG.error("create block failed, checksum not equal, need %s, get %s", block[3], d["md5"])
+            else:
+                if "replicas" in d: # commit only the replicas that really landed
+                    block[2] = [block[2][0]] + [node_id for node_id in block[2][1:] if d["replicas"].get(str(node_id)) == "ok"]
+                result = True
+        else:
+            LOG.error("create block failed, code: %s, content: %s", r.status_code, r.content)
+        return result
+
+    def get_placement_hints(self, replica):
+        """
+        replica chains chosen by the name node's placement policy, cached for hint_ttl seconds
+        """
+        hints = self.placement_hints.get(replica)
+        if hints is None or time.time() > hints["expire"]:
+            hints = {"placements": [], "data_nodes": {}, "block_size": 0}
+            r = self.get_session().get("%s/placement/hints?replica=%s" % (self.base_url, replica), headers = self.headers)
+            if r.status_code == 200:
+                data = r.json()
+                if "result" in data and data["result"] == "ok":
+                    hints = data
+            hints["expire"] = time.time() + self.hint_ttl
+            hints["next"] = 0
+            self.placement_hints[replica] = hints
+        return hints
+
+    def create_small_file(self, fp, file_size, remote_path, replica = 1):
+        """
+        create a file that fits in one block with one request, it goes to the first data node of a cached replica chain,
+        the data node forwards it down the chain and commits it to the name node,
+        return None if there is no usable hint or the data node can't be reached, then the file is created the usual way
+        """
+        result = None
+        hints = self.get_placement_hints(replica)
+        if hints["placements"] and 0 < file_size <= hints["block_size"]:
+            node_ids = hints["placements"][hints["next"] % len(hints["placements"])]
+            hints["next"] += 1
+            data_node = hints["data_nodes"][str(node_ids[0])]
+            file_create_url = "http://%s:%s/file/create" % (data_node[0], data_node[1])
+            block_md5 = bytes_io_md5sum(fp)
+            fp.seek(0)
+            files = {'up_file': ("up_file", fp, b"text/plain")}
+            values = {"path": remote_path, "replica": replica, "ids": ",".join([str(node_id) for node_id in node_ids[1:]]), "md5": block_md5}
+            try:
+                r = self.get_session(data_node).post(file_create_url, headers = self.headers, files = files, data = values)
+            except requests.ConnectionError as e:
+                LOG.warning("create file[%s] through data node %s failed: %s", remote_path, data_node, e)
+                self.placement_hints.pop(replica, None)
+                return result
+            if r.status_code == 200:
+                data = r.json()
+                if "result" in data and data["result"] == "ok":
+                    result = True
+                else:
+                    raise OperationFailedError("create file[%s] failed: %s" % (remote_path, data["result"]))
+            elif r.status_code == 404: # a data node without /file/create
+                hints["placements"] = []
+            else:
+                raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+        return result
+
+    def create_inline_file(self, content, remote_path, replica = 1):
+        """
+        create a tiny file with one request and no data node I/O, the content is kept in the name node,
+        the name node must have inline_file_size set and not smaller than the content
+        """
+        result = False
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        elif hasattr(content, "read"):
+            content = content.read()
+        json_data = {"path": remote_path, "replica": replica, "content": b64encode(content).decode("utf-8")}
+        r = self.get_session().post("%s/file/inline/create" % self.base_url, headers = self.headers, json = json_data)
+        if r.status_code == 200:
+            data = r.json()
+            if "result" in data and data["result"] == "ok":
+                result = True
+            else:
+                raise OperationFailedError("create file[%s] failed: %s" % (remote_path, data["result"]))
+        else:
+            raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+        return result
+
+    def create_small_files(self, files, replica = 1, pack_file_size = 1048576, pack_size = 67108864, inline_file_size = 0):
+        """
+        files: [(content, remote_path), ...], content is bytes, str or a file object,
+        the files up to inline_file_size are kept in the name node, 1000 of them a request, 0 means none,
+        the files up to pack_file_size are packed into shared containers of up to pack_size bytes,
+        a container takes one block upload and one request to create all of its files, the bigger files are created one by one,
+        return one result per file, {"result": "ok"} or {"result": error name, "message": ...}
+        """
+        results = [None] * len(files)
+        pack = []
+        pack_bytes = 0
+        inline = []
+        for n, (content, remote_path) in enumerate(files):
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            elif hasattr(content, "read"):
+                content = content.read()
+            if inline_file_size > 0 and len(content) <= inline_file_size:
+                operation = {"op": "create", "path": remote_path, "id": str(uuid4()), "replica": replica, "inline": b64encode(content).decode("utf-8")}
+                inline.append((n, operation))
+                if len(inline) >= 1000:
+                    self.create_inline_files(inline, results)
+                    inline = []
+            elif len(content) > pack_file_size:
+                self.create_file_by_content(content, remote_path, replica = replica)
+                results[n] = {"result": "ok"}
+            else:
+                if pack and (pack_bytes + len(content) > pack_size or len(pack) >= 1000):
+                    self.create_pack(pack, replica, results)
+                    pack = []
+                    pack_bytes = 0
+                pack.append((n, remote_path, content))
+                pack_bytes += len(content)
+        if pack:
+            self.create_pack(pack, replica, results)
+        if inline:
+            self.create_inline_files(inline, results)
+        return results
+
+    def create_inline_files(self, operations, results):
+        for (n, _), result in zip(operations, self.batch([operation for _, operation in operations])):
+            results[n] = result
+
+    def create_pack(self, files, replica, results):
+        content = b"".join([f[2] for f in files])
+        pack_block_url = "%s/pack/block?size=%s&replica=%s" % (self.base_url, len(content), replica)
+        r = self.get_session().get(pack_block_url, headers = self.headers)
+        if r.status_code == 200:
+            data = r.json()
+            if "result" in data and data["result"] == "ok":
+                block = data["blocks"][0]
+                block.append(bytes_md5sum(content))
+                if not self.create_block(data, block, content):
+                    raise OperationFailedError("create pack[%s] failed" % data["id"])
+                json_data = {"id": data["id"], "replica": replica, "blocks": [block], "files": []}
+                offset = 0
+                for _, remote_path, file_content in files:
+                    json_data["files"].append({
+                        "path": remote_path,
+                        "offset": offset,
+                        "size": len(file_content),
+                        "checksum": strings_md5sum([bytes_md5sum(file_content)]),
+                    })
+                    offset += len(file_content)
+                r = self.get_session().post("%s/pack/create" % self.base_url, headers = self.headers, json = json_data)
+                if r.status_code == 200:
+                    d = r.json()
+                    if "result" in d and d["result"] == "ok":
+                        for f, result in zip(files, d["results"]):
+                            results[f[0]] = result
+                    else:
+                        raise OperationFailedError("create pack[%s] failed: %s" % (data["id"], d["result"]))
+                else:
+                    raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+            else:
+                raise OperationFailedError("create pack failed: %s" % data["result"])
+        else:
+            raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+
     def delete_file(self, remote_path):
         result = False
         url = "%s/file/delete?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
-        r = requests.delete(url, headers = self.headers)
+        r = self.get_session().delete(url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -409,7 +718,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/file/move" % self.base_url
         json_data = {"source_path": source_path, "target_path": target_path}
-        r = requests.put(url, headers = self.headers, json = json_data)
+        r = self.get_session().put(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -424,7 +733,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/file/rename" % self.base_url
         json_data = {"path": remote_path, "new_name": new_name}
-        r = requests.put(url, headers = self.headers, json = json_data)
+        r = self.get_session().put(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -439,7 +748,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/file/update" % self.base_url
         json_data = {"path": remote_path, "replica": replica}
-        r = requests.put(url, headers = self.headers, json = json_data)
+        r = self.get_session().put(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -450,12 +759,14 @@ class LiteDFSClient(object):
             raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
         return result
 
-    def download_file(self, remote_path, local_path, progress_callback = None):
+    def download_file(self, remote_path, local_path, progress_callback = None, max_workers = 1):
+        """
+        with max_workers > 1 the blocks are downloaded concurrently, see download_blocks
+        """
         result = False
         if not os.path.exists(local_path):
-            success = True
             block_info_url = "%s/file/block/info?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
-            r = requests.get(block_info_url, headers = self.headers)
+            r = self.get_session().get(block_info_url, headers = self.headers)
             if r.status_code == 200:
                 data = r.json()
                 if "result" in data and data["result"] == "ok":
@@ -465,57 +776,26 @@ class LiteDFSClient(object):
                     for node_id in data["data_nodes"]:
                         data_nodes[int(node_id)] = data["data_nodes"][node_id]
                     file_info = data["file_info"]
-                    fp = open(local_path, "wb")
-                    blocks_md5 = []
-                    for n, block in enumerate(file_info["blocks"]):
-                        block_id = block[0]
-                        block_size = block[1]
-                        node_ids = block[2]
-                        block_md5 = block[3]
-                        exists_ids = list(set(node_ids).intersection(set(data_nodes.keys())))
-                        if exists_ids:
-                            exists_ids_random = random.sample(exists_ids, len(exists_ids))
-                            block_success = False
-                            for node_id in exists_ids_random:
-                                if progress_callback:
-                                    progress_callback("fetching block[%s/%s]" % (n + 1, len(file_info["blocks"])))
-                                data_node = data_nodes[node_id]
-                                block_download_url = "http://%s:%s/block/download?name=%s&block=%s" % (data_node[0], data_node[1], file_info["id"], block_id)
-                                r = requests.get(block_download_url, headers = self.headers)
-                                if r.status_code == 200:
-                                    response_md5 = bytes_md5sum(r.content)
-                                    if response_md5 == block_md5:
-                                        blocks_md5.append(response_md5)
-                                        fp.write(r.content)
-                                        if progress_callback:
-                                            progress_callback("fetch block[%s/%s]: ok" % (n + 1, len(file_info["blocks"])))
-                                        block_success = True
-                                        break
-                                    else:
-                                        LOG.error("checksum not equal, need %s, get %s", block_md5, response_md5)
-                                        block_success = False
-                                        continue
-                                else:
-                                    LOG.error("error:\ncode: %s\ncontent: %s", r.status_code, r.content)
-                                    block_success = False
-                                    continue
-                            if not block_success:
-                                raise OperationFailedError("read block failed from: %s" % exists_ids_random)
-                                success = False
-                                break
-                        else:
-                            raise OperationFailedError("not enough data nodes online")
-                            success = False
-                            break
-                    if success:
-                        fp.close()
-                        checksum = strings_md5sum(blocks_md5)
-                        if file_info["checksum"] == checksum:
-                            result = True
-                        else:
-                            raise OperationFailedError("download file[%s => %s] failed, checksum not equal: %s" % (remote_path, local_path, checksum))
+                    if data.get("pack") or "inline" in file_info:
+                        content = RemoteFile(self.host, self.port, remote_path, data, client = self, read_ahead = False).read()
+                        if strings_md5sum([bytes_md5sum(content)]) == file_info["checksum"]:
+                            with open(local_path, "wb") as fp:
+                                fp.write(content)
+                            return True
+                        raise OperationFailedError("download file[%s => %s] failed, checksum not equal" % (remote_path, local_path))
+                    with open(local_path, "wb") as fp: # preallocated, the blocks are written at their offsets
+                        fp.truncate(file_info["size"])
+                    try:
+                        blocks_md5 = self.download_blocks(file_info, data_nodes, local_path, max_workers, progress_callback)
+                    except Exception:
+                        os.remove(local_path)
+                        raise
+                    checksum = strings_md5sum(blocks_md5)
+                    if file_info["checksum"] == checksum:
+                        result = True
                     else:
-                        raise OperationFailedError("download file[%s => %s] failed" % (remote_path, local_path))
+                        os.remove(local_path)
+                        raise OperationFailedError("download file[%s => %s] failed, checksum not equal: %s" % (remote_path, local_path, checksum))
                 else:
                     raise OperationFailedError("download file[%s] failed: %s" % (remote_path, data["result"]))
             else:
@@ -524,17 +804,88 @@ class LiteDFSClient(object):
             raise OperationFailedError("local file[%s] already exists" % local_path)
         return result
 
-    def open_remote_file(self, remote_path):
+    def download_blocks(self, file_info, data_nodes, local_path, max_workers, progress_callback = None):
+        """
+        download the blocks with max_workers threads into the preallocated local file, each at its offset,
+        return the blocks' md5 in block order
+        """
+        blocks = file_info["blocks"]
+        offsets = []
+        offset = 0
+        for block in blocks:
+            offsets.append(offset)
+            offset += block[1]
+
+        def download(n, block):
+            if progress_callback:
+                progress_callback("fetching block[%s/%s]" % (n + 1, len(blocks)))
+            block_md5 = self.download_block(file_info["id"], block, data_nodes, local_path, offsets[n])
+            if progress_callback:
+                progress_callback("fetch block[%s/%s]: ok" % (n + 1, len(blocks)))
+            return block_md5
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = [executor.submit(download, n, block) for n, block in enumerate(blocks)]
+            try:
+                return [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def download_block(self, file_id, block, data_nodes, local_path, offset):
+        """
+        stream the block into the local file at offset from one of its replicas,
+        the md5 is computed while streaming, a failed or corrupted replica falls over to the next one
+        """
+        block_id = block[0]
+        block_size = block[1]
+        node_ids = block[2]
+        block_md5 = block[3]
+        exists_ids = list(set(node_ids).intersection(set(data_nodes.keys())))
+        if not exists_ids:
+            raise OperationFailedError("not enough data nodes online")
+        exists_ids_random = random.sample(exists_ids, len(exists_ids))
+        for node_id in exists_ids_random:
+            data_node = data_nodes[node_id]
+            block_download_url = "http://%s:%s/block/download?name=%s&block=%s" % (data_node[0], data_node[1], file_id, block_id)
+            try:
+                with self.get_session(data_node).get(block_download_url, headers = self.headers, stream = True) as r:
+                    if r.status_code == 200:
+                        md5 = hashlib.md5()
+                        size = 0
+                        with open(local_path, "r+b") as fp:
+                            fp.seek(offset)
+                            for chunk in r.iter_content(BUF_SIZE):
+                                if size + len(chunk) > block_size:
+                                    break
+                                fp.write(chunk)
+                                md5.update(chunk)
+                                size += len(chunk)
+                        response_md5 = md5.hexdigest()
+                        if size == block_size and response_md5 == block_md5:
+                            return response_md5
+                        LOG.error("checksum not equal, need %s, get %s, from node: %s", block_md5, response_md5, node_id)
+                    else:
+                        LOG.error("error:\ncode: %s\ncontent: %s", r.status_code, r.content)
+            except requests.RequestException as e:
+                LOG.error("fetch block[%s] from node: %s failed: %s", block_id, node_id, e)
+        raise OperationFailedError("read block failed from: %s" % exists_ids_random)
+
+    def open_remote_file(self, remote_path, page_size = 4 * 1024 * 1024, cache_size = 64 * 1024 * 1024, read_ahead = True):
+        """
+        a read only file object, see RemoteFile for the page cache and the read ahead
+        """
         result = False
         info = self.info_file(remote_path)
         if info:
-            result = RemoteFile(self.host, self.port, remote_path, info)
+            result = RemoteFile(self.host, self.port, remote_path, info, client = self, page_size = page_size, cache_size = cache_size, read_ahead = read_ahead)
         return result
 
     def info_file(self, remote_path):
         result = False
         block_info_url = "%s/file/block/info?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
-        r = requests.get(block_info_url, headers = self.headers)
+        r = self.get_session().get(block_info_url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -549,7 +900,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/directory/create" % self.base_url
         json_data = {"path": remote_path}
-        r = requests.post(url, headers = self.headers, json = json_data)
+        r = self.get_session().post(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -563,7 +914,7 @@ class LiteDFSClient(object):
     def delete_directory(self, remote_path):
         result = False
         url = "%s/directory/delete?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
-        r = requests.delete(url, headers = self.headers)
+        r = self.get_session().delete(url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -578,7 +929,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/directory/move" % self.base_url
         json_data = {"source_path": source_path, "target_path": target_path}
-        r = requests.put(url, headers = self.headers, json = json_data)
+        r = self.get_session().put(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -593,7 +944,7 @@ class LiteDFSClient(object):
         result = False
         url = "%s/directory/rename" % self.base_url
         json_data = {"path": remote_path, "new_name": new_name}
-        r = requests.put(url, headers = self.headers, json = json_data)
+        r = self.get_session().put(url, headers = self.headers, json = json_data)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -604,12 +955,18 @@ class LiteDFSClient(object):
             raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
         return result
 
-    def list_directory(self, remote_path, offset = 0, limit = 0, include_file = True, include_directory = True):
+    def list_directory(self, remote_path, offset = 0, limit = 0, include_file = True, include_directory = True, start_after = None):
+        """
+        with start_after the page starts after that child's name instead of at offset,
+        the result's next_start_after is the start_after of the next page, empty on the last page
+        """
         result = False
         url = "%s/directory/list?path=%s&offset=%s&limit=%s" % (self.base_url, urllib.parse.quote(remote_path), offset, limit)
         url += "&include_file=%s" % ("true" if include_file else "false")
         url += "&include_directory=%s" % ("true" if include_directory else "false")
-        r = requests.get(url, headers = self.headers)
+        if start_after:
+            url += "&start_after=%s" % urllib.parse.quote(start_after)
+        r = self.get_session().get(url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -623,7 +980,7 @@ class LiteDFSClient(object):
     def info_path(self, remote_path):
         result = False
         url = "%s/path/info?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
-        r = requests.get(url, headers = self.headers)
+        r = self.get_session().get(url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -634,10 +991,27 @@ class LiteDFSClient(object):
             raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
         return result
 
+    def summary(self, remote_path):
+        """
+        total size, files, directories and blocks under the path, kept by the name node
+        """
+        result = False
+        url = "%s/directory/summary?path=%s" % (self.base_url, urllib.parse.quote(remote_path))
+        r = self.get_session().get(url, headers = self.headers)
+        if r.status_code == 200:
+            data = r.json()
+            if "result" in data and data["result"] == "ok":
+                result = data
+            else:
+                raise OperationFailedError("summary path[%s] failed: %s" % (remote_path, data["result"]))
+        else:
+            raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+        return result
+
     def cluster_info(self):
         result = False
         url = "%s/cluster/info" % self.base_url
-        r = requests.get(url, headers = self.headers)
+        r = self.get_session().get(url, headers = self.headers)
         if r.status_code == 200:
             data = r.json()
             if "result" in data and data["result"] == "ok":
@@ -648,3 +1022,39 @@ class LiteDFSClient(object):
             raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
         return result
 
+    def balance(self, command = None, threshold = None, bandwidth = None):
+        """
+        the balancer's status, command "start" or "stop" changes it first,
+        threshold and bandwidth of a start default to the name node's balance_threshold and balance_bandwidth
+        """
+        result = False
+        url = "%s/cluster/balance" % self.base_url
+        if command:
+            json_data = {"command": command, "threshold": threshold, "bandwidth": bandwidth}
+            r = self.get_session().post(url, headers = self.headers, json = json_data)
+        else:
+            r = self.get_session().get(url, headers = self.headers)
+        if r.status_code == 200:
+            data = r.json()
+            if "result" in data and data["result"] == "ok":
+                result = data
+            else:
+                raise OperationFailedError("cluster balance failed: %s" % data["result"])
+        else:
+            raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+        return result
+
+    def batch(self, operations):
+        result = False
+        url = "%s/batch" % self.base_url
+        json_data = {"operations": operations}
+        r = self.get_session().post(url, headers = self.headers, json = json_data)
+        if r.status_code == 200:
+            data = r.json()
+            if "result" in data and data["result"] == "ok":
+                result = data["results"]
+            else:
+                raise OperationFailedError("batch %s operations failed: %s" % (len(operations), data["result"]))
+        else:
+            raise OperationFailedError("error:\ncode: %s\ncontent: %s" % (r.status_code, r.content))
+        return result
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import zipfile
+import logging
+from io import BytesIO, BufferedReader
+
+cwd = os.path.split(os.path.realpath(__file__))[0]
+sys.path.insert(0, os.path.split(cwd)[0])
+
+from litedfs_client.client import RemoteFile
+from litedfs_client import logger
+
+LOG = logging.getLogger(__name__)
+
+
+class FakeRemoteFile(RemoteFile):
+    """
+    the blocks come from memory instead of the data nodes, counts the range requests
+    """
+    def __init__(self, content, block_size, **kwargs):
+        file_info = {
+            "file_info": {"id": "fake", "size": len(content), "blocks": []},
+            "data_nodes": {},
+            "block_size": block_size,
+        }
+        RemoteFile.__init__(self, "127.0.0.1", 9000, "/fake.zip", file_info, **kwargs)
+        self.content = content
+        self.requests = 0
+
+    def block_readinto(self, block_id, offset, view):
+        self.requests += 1
+        start = block_id * self.block_size + offset
+        view[:] = self.content[start:start + len(view)]
+        return len(view)
+
+
+if __name__ == "__main__":
+    logger.config_logging(file_name = "test_remote_file_cache.log",
+                          log_level = "DEBUG",
+                          dir_name = os.path.join(cwd, "logs"),
+                          day_rotate = False,
+                          when = "D",
+                          interval = 1,
+                          max_size = 20,
+                          backup_count = 5,
+                          console = True)
+
+    LOG.debug("test start")
+    
+    try:
+        content = BytesIO()
+        with zipfile.ZipFile(content, "w") as z:
+            for i in range(500):
+                z.writestr("file_%03d.txt" % i, os.urandom(4096))
+        content = content.getvalue()
+
+        fp = FakeRemoteFile(content, 1024 * 1024, page_size = 256 * 1024, cache_size = 1024 * 1024)
+        with zipfile.ZipFile(fp) as z:
+            LOG.debug("members: %s", len(z.namelist()))
+            for name in z.namelist():
+                z.read(name)
+        LOG.debug("file size: %s, range requests: %s", len(content), fp.requests)
+
+        fp.seek(12345)
+        LOG.debug("random read ok: %s", fp.read(300000) == content[12345:12345 + 300000])
+        fp.seek(0)
+        buf = bytearray(1024 * 1024)
+        parts = [bytes(b) for b in fp.readinto_iter(buf)]
+        LOG.debug("readinto iter ok: %s, chunks: %s", b"".join(parts) == content, len(parts))
+
+        fp.seek(0)
+        reader = BufferedReader(fp, buffer_size = 64 * 1024)
+        LOG.debug("buffered read ok: %s", reader.read(100) + reader.read() == content)
+        fp.close()
+
+        fp = FakeRemoteFile(content, 1024 * 1024, page_size = 256 * 1024, cache_size = 0)
+        fp.seek(12345)
+        data = fp.read(100)
+        LOG.debug("no cache read ok: %s, cached pages: %s, prefetch: %s", data == content[12345:12345 + 100], len(fp.pages), fp.executor)
+        fp.close()
+    except Exception as e:
+        LOG.exception(e)
+
+    LOG.debug("test end")